@@ -1,8 +1,38 @@
 import streamlit as st
-import google.generativeai as genai
 from datetime import datetime
-import pandas as pd
-import requests  # 👈 추가: GitHub 문서 로드용
+from collections import OrderedDict
+import os
+import time
+import functools
+import importlib
+import threading
+import metrics
+from metrics_export import exporter_from_settings
+from doc_retrieval import DEFAULT_TOKEN_BUDGET
+from correlations import CorrelationStore, DEFAULT_PATH as CORRELATION_DATA_PATH
+from reference_doc import ReferenceDocument, DEFAULT_REFRESH_INTERVAL
+from llm_backend import create_backend, DEFAULT_MODEL
+from response_cache import ResponseCache, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from prompts import PromptBuilder, PRESET_STORE_INFO, OUTPUT_TOKEN_LIMITS, prescription_header, assemble_prescription
+from diagnosis import generate as generate_diagnosis, result_fields as diagnosis_fields, valid as diagnosis_valid, context as diagnosis_context
+from sectioned import SectionedGeneration
+from speculative import Speculator
+from call_gate import gate_from_settings
+from model_router import router_from_settings
+from model_calls import ModelCaller
+from coalescing import coalescer_from_settings
+from hedging import hedging_from_settings
+from context_cache import ContextCacheManager, DEFAULT_TTL as CONTEXT_CACHE_TTL
+from chat_memory import ConversationMemory, DEFAULT_HISTORY_TOKENS, DEFAULT_MAX_TURNS
+from consultation_digest import ConsultationDigest, DEFAULT_DIGEST_TOKENS, DEFAULT_WAIT as DIGEST_WAIT
+from question_cache import QuestionCache, segment_key, DEFAULT_THRESHOLD as SIMILARITY_THRESHOLD, DEFAULT_MAX_ENTRIES as SIMILARITY_MAX_ENTRIES, DEFAULT_MAX_PER_SEGMENT, DEFAULT_TTL as SIMILARITY_TTL
+from prescription_export import PrescriptionExporter, prescription_document, stored_documents, FORMATS as EXPORT_FORMATS
+from session_store import SessionStore, DEFAULT_MAX_SESSIONS, DEFAULT_IDLE_TIMEOUT, DEFAULT_WINDOW, DEFAULT_RETENTION
+
+# 스크립트 1회 실행 시간 측정 시작 (script_rerun_seconds)
+RERUN_STARTED = time.perf_counter()
+# 현재 진료 세션 (아래 세션 저장소에서 열기 전까지 None)
+session = None
 
 st.set_page_config(
     page_title="상권 마케팅 처방 클리닉", 
@@ -10,128 +40,424 @@ st.set_page_config(
     layout="wide"
 )
 
-# ==================== GitHub 문서 로더 추가 ====================
-@st.cache_data(ttl=3600)  # 1시간 캐시
-def load_github_document(url):
-    """GitHub Raw URL에서 HTML 문서 로드"""
+def get_setting(name, default=None):
+    """설정값 조회 (secrets → 환경변수 → 기본값)"""
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        return response.text
-    except Exception as e:
-        st.error(f"⚠️ 문서 로드 실패: {e}")
-        return None
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(name, default)
+
+# ==================== 계측 ====================
+# LOG_FORMAT=json: 구조화 로그 / METRICS_FILE, METRICS_PORT: Prometheus 텍스트 내보내기
+@st.cache_resource
+def get_metrics_exporter():
+    """지표 내보내기 (프로세스당 1개)"""
+    return exporter_from_settings(get_setting)
+
+get_metrics_exporter()
+
+# 사이드바 디버그 패널 (DEBUG_PANEL=true)
+DEBUG_PANEL = str(get_setting("DEBUG_PANEL", "false")).lower() in ("1", "true", "yes", "on")
+
+def finish_rerun():
+    """이번 스크립트 실행 시간 기록 (단계별)"""
+    elapsed = time.perf_counter() - RERUN_STARTED
+    step = session.step if session is not None else "접수"
+    metrics.observe("script_rerun_seconds", elapsed, step=step)
+    metrics.event("script_rerun", step=step, seconds=round(elapsed, 6))
+
+def rerun():
+    """st.rerun() 전에 지금까지의 실행 시간 기록 (프래그먼트 안에서 불러도 앱 전체를 다시 실행)"""
+    finish_rerun()
+    st.rerun()
+
+def timed_fragment(name):
+    """st.fragment 로 감싸고 실행 시간 기록 (fragment_rerun_seconds{fragment})
+
+    프래그먼트 안의 위젯을 조작하면 스크립트 전체 대신 이 함수만 다시 실행된다.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span("fragment_rerun", fragment=name):
+                return func(*args, **kwargs)
+        return st.fragment(wrapper)
+    return decorate
+
+# ==================== 참고 문서 로더 ====================
+# GitHub 문서 URL (secrets의 GITHUB_DOC_URL 로 변경 가능)
+GITHUB_DOC_URL = get_setting(
+    "GITHUB_DOC_URL",
+    "https://raw.githubusercontent.com/june11223344/gemini-chatbot/refs/heads/main/docs/%EB%A7%88%EC%BC%80%ED%8C%85_%EC%A0%84%EB%9E%B5_%EB%B6%84%EC%84%9D_%EB%B3%B4%EA%B3%A0%EC%84%9C_full.html",
+)
+# 저장소에 포함된 사본 (시작 시 바로 사용)
+LOCAL_DOC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docs", "마케팅_전략_분석_보고서_full.html")
+
+@st.cache_resource
+def get_reference_store():
+    """참고 문서 보관소 (프로세스당 1개, 백그라운드에서 GitHub 원본과 동기화)"""
+    store = ReferenceDocument(
+        GITHUB_DOC_URL,
+        LOCAL_DOC_PATH,
+        refresh_interval=int(get_setting("REFERENCE_REFRESH_SECONDS", DEFAULT_REFRESH_INTERVAL)),
+    )
+    store.start()
+    return store
+
+@st.cache_resource
+def get_correlation_store():
+    """상관 데이터 저장소 (프로세스당 1개, 파일은 첫 조회 또는 예열 때 1회 읽음)"""
+    return CorrelationStore(get_setting("CORRELATION_DATA_PATH", CORRELATION_DATA_PATH))
 
-# GitHub 문서 URL (secrets에 저장 권장)
-GITHUB_DOC_URL = "https://raw.githubusercontent.com/june11223344/gemini-chatbot/refs/heads/main/docs/%EB%A7%88%EC%BC%80%ED%8C%85_%EC%A0%84%EB%9E%B5_%EB%B6%84%EC%84%9D_%EB%B3%B4%EA%B3%A0%EC%84%9C_full.html"
+correlations = get_correlation_store()
 
-# 문서 로드 (캐싱되어 빠름)
-reference_document = load_github_document(GITHUB_DOC_URL)
+def correlation_table(question, store_info=None):
+    """질문별 상관 데이터 표 (store_info 를 주면 그 가맹점 조건에 맞는 행, DataFrame 은 조건별 1회만 생성)"""
+    return correlations.table(question, store_info)
+
+@st.cache_resource(max_entries=4)
+def get_prompt_builder(version, token_budget, full_reference, _document, _correlations):
+    """프롬프트 빌더 (문서 버전별 1회만 섹션 인덱스/압축본 생성)"""
+    return PromptBuilder(_document, version, token_budget, full_reference=full_reference, correlations=_correlations)
+
+# 현재 문서 스냅샷 (네트워크 대기 없음, 갱신되면 다음 rerun 부터 새 버전 사용)
+reference_snapshot = get_reference_store().snapshot
+reference_document = reference_snapshot.text
+
+# 참고 자료에 쓸 토큰 예산
+REFERENCE_TOKEN_BUDGET = int(get_setting("REFERENCE_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+
+# 컨텍스트 캐시 (CONTEXT_CACHE=true): 요청별 발췌 대신 압축한 보고서 전체를 고정 앞부분에 넣고
+# 앞부분은 공급자측 캐시에 한 번만 등록, 요청에는 뒷부분만 보냄
+CONTEXT_CACHE_ENABLED = str(get_setting("CONTEXT_CACHE", "false")).lower() in ("1", "true", "yes", "on")
+prompt_builder = get_prompt_builder(
+    reference_snapshot.version, REFERENCE_TOKEN_BUDGET, CONTEXT_CACHE_ENABLED, reference_document, correlations
+)
+
+# ==================== LLM 백엔드 ====================
+# LLM_BACKEND=gemini (기본, GEMINI_API_KEY 필요) / stub (네트워크 없는 로컬 스텁)
+@st.cache_resource
+def get_backend(kind, model_name):
+    """LLM 백엔드 (설정별 1개, 세션 간 공유)
+
+    동시 실행 수 / 초당 호출 수 제한, 재시도, 서킷 브레이커를 거치도록 관문으로 감싼다 (LLM_* 설정).
+    그 위에 단계 / 요청 크기별 모델 라우터를 두고 (MODEL_ROUTING=false 면 관문만),
+    느린 요청 헤징 (HEDGING=true 일 때), 맨 바깥에서 동시에 들어온 같은 요청을 하나로 합친다 (LLM_COALESCE=false 로 끔).
+    """
+    backend = create_backend(get_setting)
+    if backend is None:
+        return None
+    backend = router_from_settings(gate_from_settings(backend, get_setting), get_setting)
+    return coalescer_from_settings(hedging_from_settings(backend, get_setting), get_setting)
 
-# API Key 설정
 try:
-    api_key = st.secrets["GEMINI_API_KEY"]
-except:
-    st.error("⚠️ API 키를 설정해주세요.")
-    
-if "GEMINI_API_KEY" in st.secrets:
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        MODEL_AVAILABLE = True
-    except Exception as e:
-        st.error(f"⚠️ 모델 초기화 오류: {e}")
-        MODEL_AVAILABLE = False
-else:
-    MODEL_AVAILABLE = False
-
-# Session State 초기화
-if "step" not in st.session_state:
-    st.session_state.step = "접수"
-if "store_info" not in st.session_state:
-    st.session_state.store_info = {}
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "diagnosis_result" not in st.session_state:
-    st.session_state.diagnosis_result = {}
-if "selected_question" not in st.session_state:
-    st.session_state.selected_question = None
-
-# Q1 주요 고객 특성별 상관계수 데이터
-Q1_CUSTOMER_CORRELATION_DATA = {
-    "피처 (Feature)": [
-        "유동 고객 비율",
-        "거주 고객 비율",
-        "직장 고객 비율"
-    ],
-    "상관계수": [-0.35, 0.24, 0.15]
-}
+    backend = get_backend(str(get_setting("LLM_BACKEND", "gemini")).lower(), get_setting("GEMINI_MODEL", DEFAULT_MODEL))
+    if backend is None:
+        st.error("⚠️ API 키를 설정해주세요.")
+except Exception as e:
+    st.error(f"⚠️ 모델 초기화 오류: {e}")
+    backend = None
 
-# Q2 재방문율 관련 데이터
-REVISIT_CORRELATION_DATA = {
-    "피처 (Feature)": [
-        "재방문 고객 비중",
-        "동일 업종 매출건수 비중",
-        "동일 상권 내 해지 가맹점 비중",
-        "동일 업종 매출금액 비중",
-        "동일 상권 내 매출 순위 비중",
-        "동일 업종 내 해지 가맹점 비중",
-        "동일 업종 내 매출 순위 비중"
-    ],
-    "상관계수": [1.0, 0.2, 0.024, -0.018, -0.14, -0.15, -0.17]
-}
+MODEL_AVAILABLE = backend is not None
+# 캐시 키 등에 쓰는 모델명
+MODEL_NAME = backend.model_name if backend is not None else get_setting("GEMINI_MODEL", DEFAULT_MODEL)
 
-# Q3 재방문 고객 확보 및 유동 고객 의존 완화 데이터
-Q3_REVISIT_RELATION_DATA = {
-    "피처 (Feature)": [
-        "전 업종 평균 재방문 고객 비중",
-        "상·하위 매장 간 재방문율 격차",
-        "객단가 상위(75~90%) 재방문율",
-        "유동 고객 비중 ↘ 재방문률",
-        "거주 고객 비중 ↗ 재방문률",
-        "직장 고객 비중 ↗ 재방문률"
-    ],
-    "값": ["26.1%", "격차 존재", "30% 이상", "-0.32", "0.24", "0.15"]
-}
+# 스트리밍 응답 사용 여부 (STREAMING=false 면 기존 블로킹 방식)
+STREAMING = str(get_setting("STREAMING", "true")).lower() not in ("0", "false", "no", "off")
 
-# Q4 지역(상권)별 매출 편차 데이터
-Q4_REGION_SALES_CORRELATION_DATA = {
-    "피처 (Feature)": [
-        "유동 고객 비중",
-        "거주 고객 비중",
-        "직장 고객 비중",
-        "반경 500m 내 경쟁 매장 수",
-        "중간 매출군 재방문율"
-    ],
-    "상관계수": [0.494, 0.378, 0.113, 0.506, 0.188]
-}
+# 접수 화면에서 진단 입력이 채워지면 제출 전에 초기 진단을 미리 생성 (SPECULATIVE_DIAGNOSIS=false 로 끔)
+SPECULATIVE_DIAGNOSIS = str(get_setting("SPECULATIVE_DIAGNOSIS", "true")).lower() not in ("0", "false", "no", "off")
 
-# Q5 월·계절별 매출 변동 데이터
-Q5_SEASONAL_CORRELATION_DATA = {
-    "피처 (Feature)": [
-        "여름철(6~7월) 재방문율",
-        "유동 고객 비율(6~7월)",
-        "거주 고객 비율(9월)",
-        "유동 고객 비율(9월)",
-        "직장 고객 비율(12월)"
-    ],
-    "상관계수": [0.2677, 0.576, 0.3497, 0.5451, 0.1225]
+# 단계별 최대 출력 토큰 (MAX_OUTPUT_TOKENS_DIAGNOSIS / _CHAT / _PRESCRIPTION / _PRESCRIPTION_SECTION)
+OUTPUT_LIMITS = {
+    stage: int(get_setting(f"MAX_OUTPUT_TOKENS_{stage.upper()}", limit))
+    for stage, limit in OUTPUT_TOKEN_LIMITS.items()
 }
 
-# 👇 SYSTEM_PROMPT에 참고 문서 포함
-SYSTEM_PROMPT = f"""
-당신은 신한카드 빅데이터 기반 상권 마케팅 전문 의사입니다.
+# 처방전 생성 방식: single (한 번에 작성) / parallel (섹션별 동시 작성)
+PRESCRIPTION_MODE = str(get_setting("PRESCRIPTION_MODE", "single")).lower()
+
+# 응답 캐시 (LLM_CACHE=false 로 끔)
+LLM_CACHE_ENABLED = str(get_setting("LLM_CACHE", "true")).lower() not in ("0", "false", "no", "off")
+
+@st.cache_resource
+def get_response_cache():
+    """디스크 응답 캐시 (프로세스당 1개, 세션 간 공유)"""
+    return ResponseCache(
+        get_setting("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_responses.sqlite3")),
+        ttl=float(get_setting("LLM_CACHE_TTL", DEFAULT_TTL)),
+        max_entries=int(get_setting("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
+
+response_cache = get_response_cache() if LLM_CACHE_ENABLED else None
+
+# 상담 유사 질문 캐시 (CHAT_SIMILARITY_CACHE=false 로 끔): 같은 업종/상권/사전 질문에서 거의 같은 질문이면 이전 답변 재사용
+CHAT_SIMILARITY_ENABLED = str(get_setting("CHAT_SIMILARITY_CACHE", "true")).lower() not in ("0", "false", "no", "off")
+
+@st.cache_resource
+def get_question_cache():
+    """유사 질문 캐시 (프로세스당 1개, 세션 간 공유)"""
+    return QuestionCache(
+        threshold=float(get_setting("CHAT_SIMILARITY_THRESHOLD", SIMILARITY_THRESHOLD)),
+        max_entries=int(get_setting("CHAT_SIMILARITY_MAX_ENTRIES", SIMILARITY_MAX_ENTRIES)),
+        max_per_segment=int(get_setting("CHAT_SIMILARITY_MAX_PER_SEGMENT", DEFAULT_MAX_PER_SEGMENT)),
+        ttl=float(get_setting("CHAT_SIMILARITY_TTL", SIMILARITY_TTL)),
+    )
+
+question_cache = get_question_cache() if CHAT_SIMILARITY_ENABLED else None
+
+@st.cache_resource
+def get_context_cache(_backend, kind, model_name):
+    """컨텍스트 캐시 관리자 (백엔드별 1개, 참고 문서가 바뀌면 기존 캐시 삭제)"""
+    manager = ContextCacheManager(
+        _backend,
+        ttl=int(get_setting("CONTEXT_CACHE_TTL", CONTEXT_CACHE_TTL)),
+        min_tokens=int(get_setting("CONTEXT_CACHE_MIN_TOKENS", 0)),
+    )
+    get_reference_store().subscribe(manager.invalidate)
+    return manager
+
+context_cache = (
+    get_context_cache(backend, backend.name, MODEL_NAME)
+    if CONTEXT_CACHE_ENABLED and backend is not None else None
+)
+
+# ==================== 서버 시작 시 예열 ====================
+# 첫 화면은 기다리지 않고 첫 진단 전까지 백그라운드에서 미리 준비 (WARM_UP=false 로 끔)
+# - 참고 문서 섹션 인덱스 (문서 버전마다)
+# - 상관 데이터 파일 + 조회 인덱스, pandas (상관 데이터 표)
+# - 모델 라이브러리 로드 + 생성 API 연결 (gemini 는 약 1초 + 연결 수립)
+WARM_UP = str(get_setting("WARM_UP", "true")).lower() not in ("0", "false", "no", "off")
+
+def run_warm_up(tasks):
+    for name, task in tasks:
+        try:
+            with metrics.span("warm_up", task=name):
+                task()
+        except Exception:
+            pass  # 실패해도 첫 요청에서 다시 시도됨 (warm_up_errors_total 에 기록)
+
+@st.cache_resource
+def start_warm_up(_backend, _builder, kind, version):
+    """예열 스레드 (백엔드 / 문서 버전별 1회)"""
+    # 로컬 작업 먼저, 네트워크를 기다릴 수 있는 백엔드 연결은 마지막
+    tasks = [("reference_index", _builder.warm_up)]
+    if _builder.correlations is not None:
+        tasks.append(("correlations", _builder.correlations.warm_up))
+    tasks.append(("pandas", functools.partial(importlib.import_module, "pandas")))
+    if _backend is not None:
+        tasks.append(("backend", _backend.warm_up))
+    thread = threading.Thread(target=run_warm_up, args=(tasks,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+if WARM_UP:
+    start_warm_up(backend, prompt_builder, backend.name if backend is not None else None, reference_snapshot.version)
+
+# 응답 캐시 키 / 모델 호출 (batch.py 와 같은 model_calls.ModelCaller 를 써서 응답 캐시 공유)
+model_caller = ModelCaller(backend, prompt_builder, OUTPUT_LIMITS, context_cache, model_name=MODEL_NAME)
+
+def record_usage(result, stage):
+    """실제 전송한 입력 토큰 / 캐시에서 읽은 토큰 (요청당 절약분) / 출력 토큰 (usage_metadata 기준)
+
+    병합된 요청이 받은 응답(shared)은 대표 요청이 이미 기록했으므로 건너뛴다 (llm_coalesce_total 에 따로 집계).
+    """
+    if result is None or result.shared:
+        return
+    cached_tokens = result.cached_tokens or 0
+    if result.prompt_tokens is not None:
+        metrics.observe("llm_input_tokens", result.prompt_tokens - cached_tokens, stage=stage)
+        metrics.observe("llm_cached_input_tokens", cached_tokens, stage=stage)
+        metrics.inc("llm_tokens_total", result.prompt_tokens - cached_tokens, stage=stage, kind="input")
+        metrics.inc("llm_tokens_total", cached_tokens, stage=stage, kind="cached_input")
+    if result.output_tokens is not None:
+        metrics.observe("llm_output_tokens", result.output_tokens, stage=stage)
+        metrics.inc("llm_tokens_total", result.output_tokens, stage=stage, kind="output")
+    metrics.event("llm_usage", stage=stage, model=result.model, input_tokens=result.prompt_tokens,
+                  cached_tokens=cached_tokens, output_tokens=result.output_tokens)
+
+def generate_text(prompt, stage, cache_inputs=None, show=True, remember=None, validate=None, max_output_tokens=None):
+    """모델 호출 후 현재 위치에 응답을 출력하고 전체 텍스트 반환
+
+    스트리밍 모드에서는 조각이 도착하는 대로 출력한다.
+    show=False 면 출력하지 않는다 (JSON 으로 받는 초기 진단은 호출한 쪽에서 파싱 후 출력).
+    cache_inputs 가 주어지면 (모델명, 문서 버전, 입력) 기준으로 응답 캐시를 먼저 확인한다.
+    remember(text) 는 응답을 캐시해도 될 때(기본 경로 모델의 응답)만 호출한다 (유사 질문 캐시).
+    validate(text) 가 거짓인 응답(예: 읽을 수 없는 진단 JSON)은 캐시에 넣지 않고 캐시에 있어도 쓰지 않는다.
+    max_output_tokens 를 주면 이번 호출만 단계별 최대 출력 토큰 대신 사용한다.
+    첫 토큰까지 걸린 시간(TTFT)과 전체 지연시간은 stage/mode 별로 metrics 에 기록한다.
+    """
+    mode = "stream" if STREAMING else "blocking"
+    started = time.perf_counter()
+    first_token = []
+
+    cache_key = None
+    if response_cache is not None and cache_inputs is not None:
+        cache_key = model_caller.response_key(stage, cache_inputs, prompt)
+        cached = response_cache.get(cache_key)
+        if cached is not None and (validate is None or validate(cached)):
+            metrics.inc("llm_cache_hits_total", stage=stage)
+            if show:
+                st.markdown(cached)
+            metrics.observe("llm_ttft_seconds", time.perf_counter() - started, stage=stage, mode="cache")
+            return cached
+        metrics.inc("llm_cache_misses_total", stage=stage)
+
+    # 호출 시간 / 오류 종류는 llm_request_seconds, llm_request_errors_total{stage,mode,error}
+    with metrics.span("llm_request", stage=stage, mode=mode):
+        if STREAMING:
+            result = model_caller.call(prompt, stage, max_output_tokens=max_output_tokens)
+            def chunks():
+                for piece in result:
+                    if not first_token:
+                        first_token.append(time.perf_counter() - started)
+                    yield piece
+            if show:
+                st.write_stream(chunks())
+            else:
+                for _ in chunks():
+                    pass
+            text = result.text
+        else:
+            result = model_caller.call(prompt, stage, stream=False, max_output_tokens=max_output_tokens)
+            text = result.text
+            first_token.append(time.perf_counter() - started)
+            if show:
+                st.markdown(text)
+    record_usage(result, stage)
+
+    metrics.observe("llm_ttft_seconds", first_token[0] if first_token else time.perf_counter() - started, stage=stage, mode=mode)
+    metrics.observe("llm_latency_seconds", time.perf_counter() - started, stage=stage, mode=mode)
+    if text and model_caller.cacheable(result) and (validate is None or validate(text)):
+        if cache_key is not None:
+            response_cache.put(cache_key, text, stage=stage)
+        if remember is not None:
+            remember(text)
+    return text
 
-## 참고 자료
-{reference_document if reference_document else "참고 문서 로드 실패"}
+def show_diagnosis(result):
+    """초기 진단 출력 (구조화 결과가 있으면 근거 수치를 지표로 함께 표시)"""
+    st.markdown(result.get("initial") or "진단 중...")
+    structured = result.get("structured")
+    if not structured:
+        return
+    evidence = [
+        ("상권 유형", structured["trade_area"]["type"]),
+        ("주 고객 매출 비중", f"{structured['customers']['sales_share']:g}%" if structured["customers"].get("sales_share") is not None else None),
+        ("재방문 상관", f"{structured['customers']['revisit_correlation']:+.2f}" if structured["customers"].get("revisit_correlation") is not None else None),
+        ("핵심 원인 상관", f"{structured['problem']['correlation']:+.2f}" if structured["problem"].get("correlation") is not None else None),
+    ]
+    evidence = [(label, value) for label, value in evidence if value is not None]
+    for col, (label, value) in zip(st.columns(len(evidence)), evidence):
+        col.metric(label, value)
 
-## 응답 원칙
-1. **초기 진단은 간결하게**: 3-4줄 요약 형식
-2. **모든 수치 명시**: 상관계수, 비율, 매장수
-3. **의료 컨셉**: 진단 → 처방 형식
-4. **참고 자료 활용**: 위의 HTML 문서 내용도 적극 활용
-"""
+def speculate_diagnosis(store_info, cache_inputs):
+    """초기 진단 추측 실행 시작 (같은 입력이면 진행 중인 것 유지)"""
+    prompt = prompt_builder.diagnosis(store_info)
+    key = model_caller.response_key("diagnosis", cache_inputs, prompt)
+
+    def work(cancel):
+        # 작업 스레드: st 호출 없이 텍스트만 만든다
+        # 읽을 수 없는 진단 JSON 은 버리고 (None) 제출 시 diagnosis.generate 로 다시 받는다
+        if response_cache is not None:
+            cached = response_cache.get(key)
+            if cached is not None and diagnosis_valid(cached):
+                return cached
+        result = model_caller.call(prompt, "diagnosis")
+        for _ in result:
+            if cancel.is_set():
+                result.close()
+                return None
+        record_usage(result, "diagnosis")
+        if not diagnosis_valid(result.text):
+            return None
+        if response_cache is not None and model_caller.cacheable(result):
+            response_cache.put(key, result.text, stage="diagnosis")
+        return result.text
+
+    st.session_state.speculator.propose(key, work)
+
+def generate_sections(header, sections, stage, issued):
+    """섹션별 프롬프트를 동시에 호출해 템플릿 순서 자리에 도착하는 대로 출력, 조립한 전체 텍스트 반환
+
+    sections: [(이름, 제목, PromptParts)] — 모든 섹션이 같은 고정 앞부분(컨텍스트)을 공유한다.
+    """
+    st.markdown(header)
+    slots = {name: st.empty() for name, _, _ in sections}
+    generation = SectionedGeneration([
+        (name, title, lambda prompt=prompt: model_caller.call(prompt, f"{stage}_section"))
+        for name, title, prompt in sections
+    ]).start()
+    for snapshot in generation.updates():
+        for name, title, text, done in snapshot:
+            if text or done:
+                slots[name].markdown(f"{title}\n{text}" + ("" if done else " ▌"))
+    for state in generation.sections:
+        metrics.observe("llm_request_seconds", state.finished, stage=f"{stage}_section", mode="parallel")
+        if state.error is not None:
+            metrics.inc("llm_request_errors_total", stage=f"{stage}_section", mode="parallel", error=type(state.error).__name__)
+    generation.raise_for_error()
+    for state in generation.sections:
+        record_usage(state.result, f"{stage}_section")
+
+    metrics.observe("llm_ttft_seconds", generation.first_token or generation.elapsed, stage=stage, mode="parallel")
+    metrics.observe("llm_latency_seconds", generation.elapsed, stage=stage, mode="parallel")
+    return assemble_prescription(header, [(s.name, s.title, s.text) for s in generation.sections], issued)
+
+# ==================== 진료 세션 ====================
+@st.cache_resource
+def get_session_store():
+    """진료 세션 저장소 (프로세스당 1개, 접수 정보 / 상담 / 처방전을 디스크에 저장)"""
+    return SessionStore(
+        get_setting("SESSION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions.sqlite3")),
+        max_sessions=int(get_setting("SESSION_MAX_IN_MEMORY", DEFAULT_MAX_SESSIONS)),
+        idle_timeout=float(get_setting("SESSION_IDLE_SECONDS", DEFAULT_IDLE_TIMEOUT)),
+        window=int(get_setting("SESSION_MESSAGE_WINDOW", DEFAULT_WINDOW)),
+        retention=float(get_setting("SESSION_RETENTION_SECONDS", DEFAULT_RETENTION)),
+    )
+
+session_store = get_session_store()
+
+@st.cache_resource
+def get_prescription_exporter():
+    """처방전 내보내기 (형식별 렌더 결과를 내용 해시로 캐시, 세션 간 공유)"""
+    return PrescriptionExporter(max_entries=int(get_setting("EXPORT_CACHE_MAX_ENTRIES", 64)))
+
+prescription_exporter = get_prescription_exporter()
+
+# 이 브라우저에서 발급한 처방전 묶음에 남길 최근 건수 (브라우저 세션 메모리 상한)
+ISSUED_PRESCRIPTIONS_MAX = int(get_setting("ISSUED_PRESCRIPTIONS_MAX", 20))
+
+# 진료 번호: URL(?session=...) → 이 브라우저 세션 → 새로 발급
+# st.session_state 에는 토큰만 두고 내용은 저장소에서 읽는다 (메모리에서 내려갔으면 디스크에서 다시 읽음)
+session = session_store.open(st.query_params.get("session") or st.session_state.get("session_token"))
+if session is None:
+    session = session_store.create()
+if st.session_state.get("session_token") != session.token:
+    st.session_state.session_token = session.token
+    # 다른 진료로 바뀌었으면 이전 진료의 상담 요약 / 노트 / 추측 실행은 버림
+    st.session_state.pop("chat_memory", None)
+    st.session_state.pop("consultation_digest", None)
+    if "speculator" in st.session_state:
+        st.session_state.speculator.cancel()
+if st.query_params.get("session") != session.token:
+    st.query_params["session"] = session.token
+
+if "speculator" not in st.session_state:
+    st.session_state.speculator = Speculator("diagnosis")
+if "chat_memory" not in st.session_state:
+    # 상담 기억: 최근 턴 원문 (CHAT_HISTORY_TOKENS / CHAT_HISTORY_TURNS) + 이전 턴 요약
+    st.session_state.chat_memory = ConversationMemory(
+        history_tokens=int(get_setting("CHAT_HISTORY_TOKENS", DEFAULT_HISTORY_TOKENS)),
+        max_turns=int(get_setting("CHAT_HISTORY_TURNS", DEFAULT_MAX_TURNS)),
+    )
+if "consultation_digest" not in st.session_state:
+    # 처방전용 상담 노트: 상담 턴마다 백그라운드에서 갱신 (CONSULTATION_DIGEST_TOKENS)
+    st.session_state.consultation_digest = ConsultationDigest(
+        max_tokens=int(get_setting("CONSULTATION_DIGEST_TOKENS", DEFAULT_DIGEST_TOKENS)),
+    )
 
 # 헤더
 st.markdown("""
@@ -171,101 +497,215 @@ with st.sidebar:
     st.caption("→ 월/계절별 매출 패턴 분석")
 
     if q1:
-        st.session_state.selected_question = 1
-        st.session_state.step = "접수"
-        st.session_state.store_info = {
-            "business_type": "카페",
-            "location_detail": "역세권/대로변 (유동인구 많음)",
-            "customer_type": "신규 고객 많음",
-            "concern": "주요 고객 특성에 맞는 마케팅 채널과 홍보 방법을 알고 싶어요"
-        }
-        st.rerun()
+        session.update(selected_question=1, step="접수", store_info=dict(PRESET_STORE_INFO[1]))
+        rerun()
 
     if q2:
-        st.session_state.selected_question = 2
-        st.session_state.step = "접수"
-        st.session_state.store_info = {
-            "business_type": "카페", 
-            "location_detail": "주택가/골목 (거주민 중심)",
-            "customer_type": "단골 손님 적음",
-            "concern": "재방문율이 30% 이하인데 어떻게 높일 수 있을까요?"
-        }
-        st.rerun()
+        session.update(selected_question=2, step="접수", store_info=dict(PRESET_STORE_INFO[2]))
+        rerun()
 
     if q3:
-        st.session_state.selected_question = 3
-        st.session_state.step = "접수"
-        st.session_state.store_info = {
-            "business_type": "한식-일반",
-            "location_detail": "오피스/업무지구 (직장인 중심)",
-            "customer_type": "신규 고객 많음",
-            "concern": "요식업 매장의 가장 큰 문제점이 무엇인지 알고 이를 개선하고 싶어요"
-        }
-        st.rerun()
+        session.update(selected_question=3, step="접수", store_info=dict(PRESET_STORE_INFO[3]))
+        rerun()
     
     if q4:
-        st.session_state.selected_question = 4
-        st.session_state.step = "접수"
-        st.session_state.store_info = {
-            "business_type": "카페",
-            "location_detail": "역세권/대로변 (유동인구 많음)",
-            "customer_type": "신규 고객 많음",
-            "concern": "같은 지역 내에서도 매출 편차가 큰 이유를 알고 싶어요"
-        }
-        st.rerun()
+        session.update(selected_question=4, step="접수", store_info=dict(PRESET_STORE_INFO[4]))
+        rerun()
     
     if q5:
-        st.session_state.selected_question = 5
-        st.session_state.step = "접수"
-        st.session_state.store_info = {
-            "business_type": "카페",
-            "location_detail": "역세권/대로변 (유동인구 많음)",
-            "customer_type": "신규 고객 많음",
-            "concern": "계절별로 매출이 크게 변동하는데 대응 전략을 알고 싶어요"
-        }
-        st.rerun()
+        session.update(selected_question=5, step="접수", store_info=dict(PRESET_STORE_INFO[5]))
+        rerun()
     
     st.markdown("---")
     
     # 선택된 질문에 따라 관련 데이터 표시
-    if st.session_state.selected_question == 1:
+    if session.selected_question == 1:
         st.markdown("### 📊 고객 특성별 상관 데이터")
-        df = pd.DataFrame(Q1_CUSTOMER_CORRELATION_DATA)
+        df = correlation_table(1)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 분석 결과")
-    elif st.session_state.selected_question == 2:
+    elif session.selected_question == 2:
         st.markdown("### 📊 재방문율 상관 데이터")
-        df = pd.DataFrame(REVISIT_CORRELATION_DATA)
+        df = correlation_table(2)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 분석 결과")
-    elif st.session_state.selected_question == 3:
+    elif session.selected_question == 3:
         st.markdown("### 📊 재방문 고객 확보 데이터")
-        df = pd.DataFrame(Q3_REVISIT_RELATION_DATA)
+        df = correlation_table(3)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 분석 결과")
-    elif st.session_state.selected_question == 4:
+    elif session.selected_question == 4:
         st.markdown("### 📊 지역별 매출 편차 데이터")
-        df = pd.DataFrame(Q4_REGION_SALES_CORRELATION_DATA)
+        df = correlation_table(4)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 분석 결과")
-    elif st.session_state.selected_question == 5:
+    elif session.selected_question == 5:
         st.markdown("### 📊 계절별 매출 변동 데이터")
-        df = pd.DataFrame(Q5_SEASONAL_CORRELATION_DATA)
+        df = correlation_table(5)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 분석 결과")
     
     st.markdown("---")
     
-    if st.session_state.step != "접수":
+    if session.step != "접수":
         if st.button("🏠 처음으로", use_container_width=True, type="primary"):
-            st.session_state.step = "접수"
-            st.session_state.store_info = {}
-            st.session_state.messages = []
-            st.session_state.selected_question = None
-            st.rerun()
+            session.reset()
+            st.session_state.chat_memory.reset()
+            st.session_state.consultation_digest.reset()
+            st.session_state.speculator.cancel()
+            rerun()
+
+    # 진료 이어하기: 진료 번호(또는 이 주소)로 나중에 같은 진료를 다시 열 수 있음
+    with st.expander("🔑 진료 이어하기", expanded=False):
+        st.caption("진료 번호를 보관하면 나중에 상담과 처방전을 이어서 볼 수 있습니다")
+        st.code(session.token, language=None)
+        resume_token = st.text_input("진료 번호 입력", key="resume_token", placeholder="진료 번호")
+        if st.button("이어하기", use_container_width=True, disabled=not resume_token):
+            if session_store.open(resume_token.strip()) is None:
+                st.error("진료 기록을 찾을 수 없습니다")
+            else:
+                st.query_params["session"] = resume_token.strip()
+                rerun()
+
+    # 응답 속도 (첫 토큰까지 시간, 스트리밍/블로킹 비교용)
+    with st.expander("⏱️ 응답 속도", expanded=False):
+        st.caption(f"모드: {'스트리밍' if STREAMING else '블로킹'}")
+        for stage, label in [("diagnosis", "초기 진단"), ("chat", "상담"), ("prescription", "처방전")]:
+            for mode in ("stream", "blocking", "parallel", "speculative", "cache", "similar"):
+                ttft = metrics.summary("llm_ttft_seconds", stage=stage, mode=mode)
+                if ttft["count"]:
+                    total = metrics.summary("llm_latency_seconds", stage=stage, mode=mode)
+                    if total["count"]:
+                        st.caption(f"{label} ({mode}): 첫 토큰 p50 {ttft['p50']:.2f}초 / 전체 p50 {total['p50']:.2f}초 · {ttft['count']}회")
+                    else:
+                        st.caption(f"{label} ({mode}): p50 {ttft['p50'] * 1000:.1f}ms · {ttft['count']}회")
+        # 프롬프트 부분별 입력 토큰 (추정치 평균)
+        for stage, label in [("diagnosis", "초기 진단"), ("chat", "상담"), ("prescription", "처방전")]:
+            parts = []
+            for part in ("system", "instructions", "reference", "history", "request"):
+                tokens = metrics.summary("prompt_part_tokens", stage=stage, part=part)
+                if tokens["count"]:
+                    parts.append(f"{part} {tokens['mean']:.0f}")
+            if parts:
+                st.caption(f"{label} 입력 토큰: " + " · ".join(parts))
+        # 요청당 실제 전송 입력 토큰과 컨텍스트 캐시로 아낀 토큰, 출력 토큰 (상한 대비)
+        for stage, label in [("diagnosis", "초기 진단"), ("chat", "상담"), ("prescription", "처방전")]:
+            sent = metrics.summary("llm_input_tokens", stage=stage)
+            if sent["count"]:
+                saved = metrics.summary("llm_cached_input_tokens", stage=stage)
+                output = metrics.summary("llm_output_tokens", stage=stage)
+                st.caption(
+                    f"{label} 전송 입력: 평균 {sent['mean']:.0f} 토큰 · 캐시 {saved['mean']:.0f} 토큰"
+                    + (f" · 출력 평균 {output['mean']:.0f}/{OUTPUT_LIMITS.get(stage)} 토큰" if output["count"] else "")
+                )
+        started_total = metrics.counter("speculation_started_total", stage="diagnosis")
+        if started_total:
+            st.caption(
+                f"진단 미리 생성: 시작 {started_total:.0f} · 사용 {metrics.counter('speculation_hits_total', stage='diagnosis'):.0f} · "
+                f"취소 {metrics.counter('speculation_cancelled_total', stage='diagnosis') + metrics.counter('speculation_discarded_total', stage='diagnosis'):.0f}"
+            )
+        if backend is not None:
+            gate = backend.stats()
+            wait = metrics.summary("llm_queue_wait_seconds", operation="stream" if STREAMING else "generate")
+            st.caption(
+                f"호출 관문: 실행 {gate['in_flight']}/{gate['max_concurrency']} · 대기 {gate['waiting']} · "
+                f"브레이커 {gate['circuit']} · 재시도 {metrics.total('llm_retries_total'):.0f}회"
+                + (f" · 대기 p95 {wait['p95'] * 1000:.0f}ms" if wait["count"] else "")
+            )
+            if hasattr(backend, "routing_stats"):
+                routes = [
+                    f"{row['stage']}→{row['model']}"
+                    + (f" p95 {row['p95']:.2f}초" if row["p95"] is not None else "")
+                    + (" (강등)" if row["demoted"] else "")
+                    for row in backend.routing_stats()
+                ]
+                fallbacks = sum(metrics.total("llm_route_decisions_total", reason=f"fallback_{why}") for why in ("p95", "errors"))
+                if routes:
+                    st.caption(f"모델 라우팅: {' · '.join(routes)} · 대체 {fallbacks:.0f}회")
+            if hasattr(backend, "hedging_stats"):
+                hedging = backend.hedging_stats()
+                thresholds = [f"{stage} {seconds:.2f}초" for stage, seconds in hedging["thresholds"].items() if seconds is not None]
+                st.caption(
+                    f"헤징: 최근 {hedging['hedge_rate']:.0%} (상한 {hedging['max_rate']:.0%}) · "
+                    f"헤지 승 {metrics.total('llm_hedge_total', outcome='hedge_won'):.0f}회"
+                    + (f" · 기준 {' · '.join(thresholds)}" if thresholds else "")
+                )
+            if hasattr(backend, "coalescing_stats"):
+                coalescing = backend.coalescing_stats()
+                if coalescing["followers"]:
+                    st.caption(
+                        f"요청 병합: 합류 {coalescing['followers']} / 전체 {coalescing['leaders'] + coalescing['followers']} "
+                        f"({coalescing['ratio']:.0%}) · 진행 중 {coalescing['in_flight']}"
+                    )
+        digest = metrics.summary("consultation_digest_seconds")
+        if digest["count"]:
+            wait = metrics.summary("consultation_digest_wait_seconds")
+            st.caption(
+                f"상담 노트: 갱신 {digest['count']}회 · 평균 {digest['mean']:.2f}초 (백그라운드)"
+                + (f" · 발급 시 대기 p50 {wait['p50'] * 1000:.0f}ms" if wait["count"] else "")
+            )
+        store_stats = session_store.stats()
+        st.caption(f"진료 세션: 메모리 {store_stats['in_memory']}/{store_stats['max_sessions']} · 저장 {store_stats['stored']}건")
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            st.caption(f"응답 캐시: 적중 {cache_stats['hits']} / 미스 {cache_stats['misses']} ({cache_stats['hit_rate']:.0%}) · {cache_stats['entries']}건")
+        if question_cache is not None:
+            similar_stats = question_cache.stats()
+            st.caption(
+                f"유사 질문 캐시: 적중 {similar_stats['hits']} / 미스 {similar_stats['misses']} ({similar_stats['hit_rate']:.0%}) · "
+                f"{similar_stats['entries']}건 · 세그먼트 {similar_stats['segments']} · 기준 {similar_stats['threshold']:.2f} · "
+                f"어절 달라 제외 {similar_stats['rejected']}"
+            )
+
+    # 디버그 패널: 단계별 프롬프트 조립 / 호출 시간, 토큰, 오류, 캐시 적중 + Prometheus 원문
+    if DEBUG_PANEL:
+        with st.expander("🔧 계측", expanded=False):
+            rows = []
+            for stage in ("diagnosis", "chat", "prescription", "prescription_section"):
+                build = metrics.summary("prompt_build_seconds", stage=stage)
+                mode = "parallel" if stage.endswith("_section") else ("stream" if STREAMING else "blocking")
+                request = metrics.summary("llm_request_seconds", stage=stage, mode=mode)
+                rows.append({
+                    "단계": stage,
+                    "조립 p50(ms)": round(build["p50"] * 1000, 2) if build["count"] else None,
+                    "호출": request["count"],
+                    "호출 p95(초)": round(request["p95"], 2) if request["count"] else None,
+                    "입력 토큰": metrics.counter("llm_tokens_total", stage=stage, kind="input"),
+                    "캐시 입력": metrics.counter("llm_tokens_total", stage=stage, kind="cached_input"),
+                    "출력 토큰": metrics.counter("llm_tokens_total", stage=stage, kind="output"),
+                    "오류": metrics.total("llm_request_errors_total", stage=stage),
+                    "캐시 적중": metrics.counter("llm_cache_hits_total", stage=stage),
+                })
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            refresh = metrics.summary("reference_refresh_seconds")
+            rerun_time = metrics.summary("script_rerun_seconds", step=session.step)
+            st.caption(
+                f"문서 갱신: {refresh['count']}회" + (f" · p50 {refresh['p50'] * 1000:.0f}ms" if refresh["count"] else "")
+                + (f" · 화면 실행({session.step}) p50 {rerun_time['p50'] * 1000:.0f}ms" if rerun_time["count"] else "")
+            )
+            if st.checkbox("Prometheus 텍스트 보기", key="debug_prometheus"):
+                st.code(metrics.prometheus_text(), language="text")
+            # 저장된 모든 진료의 처방전 묶음 (운영자용, 누를 때 저장소를 조금씩 읽어 생성)
+            st.download_button(
+                label="📦 저장된 처방전 전체 (zip)",
+                data=lambda: prescription_exporter.zip(stored_documents(session_store)),
+                file_name=f"처방전_전체_{datetime.now().strftime('%Y%m%d')}.zip",
+                mime="application/zip",
+                key="download_store_zip",
+                on_click="ignore",
+                use_container_width=True
+            )
+            export_stats = prescription_exporter.stats()
+            st.caption(f"처방전 내보내기 캐시: {export_stats['entries']}건 · {export_stats['bytes'] / 1024:.0f}KB")
 
 # 1단계: 접수
-if st.session_state.step == "접수":
+@timed_fragment("intake")
+def intake_desk():
+    """접수 화면 (위젯 조작은 이 영역만 다시 실행)
+
+    지역/상세 위치/업종은 입력 칸 구성과 진단 미리 생성에 바로 쓰이므로 일반 위젯으로 두고,
+    나머지(가맹점명, 상권/손님 특성, 고객층 10개, 고민)는 폼으로 묶어 제출할 때 한 번에 보낸다.
+    """
     st.header("📋 접수 데스크")
     
     question_titles = {
@@ -276,25 +716,25 @@ if st.session_state.step == "접수":
         5: "질문 5: 계절별 매출 변동"
     }
     
-    initial_store_info = st.session_state.store_info
+    initial_store_info = session.store_info
     
-    if st.session_state.selected_question:
-        st.info(f"✅ 선택: {question_titles[st.session_state.selected_question]} (정보 확인 후 '진료 접수하기')")
+    if session.selected_question:
+        st.info(f"✅ 선택: {question_titles[session.selected_question]} (정보 확인 후 '진료 접수하기')")
     
     st.subheader("가맹점 기본 정보")
     
-    col1, col2 = st.columns(2)
+    # 지역에 따라 상세 위치 입력 칸이 바뀌므로 폼 밖에 둠
+    col1, col2, col3 = st.columns(3)
     
     with col1:
-        store_name = st.text_input("🏪 가맹점명", placeholder="예: 달구 성수점", value=initial_store_info.get("store_name", ""))
-        
         region_options = ["선택하세요", "서울 성동구", "서울 강남구", "서울 강서구", "서울 마포구", "서울 종로구", "부산", "대구", "기타"]
         region_choice = st.selectbox(
             "🗺️ 지역",
             region_options,
             index=region_options.index(initial_store_info.get("region", "선택하세요")) if initial_store_info.get("region") in region_options else 0
         )
-        
+    
+    with col2:
         location_options = ["선택하세요", "성수동1가", "성수동2가", "서울숲길", "왕십리", "행당동", "금호동", "옥수동", "마장동", "응봉동"]
         if region_choice == "서울 성동구":
             location = st.selectbox(
@@ -306,78 +746,107 @@ if st.session_state.step == "접수":
             location = st.text_input("📍 상세 위치", placeholder="예: 역삼동", value=initial_store_info.get("location", ""))
         else:
             location = "선택하세요"
-        
+    
+    with col3:
         business_type_options = ["선택하세요", "카페", "한식-육류/고기", "한식-일반", "일식", "중식", "양식", "치킨", "분식", "베이커리", "기타"]
         business_type = st.selectbox(
             "🍽️ 업종",
             business_type_options,
             index=business_type_options.index(initial_store_info.get("business_type", "선택하세요")) if initial_store_info.get("business_type") in business_type_options else 0
         )
+    
+    # 나머지 입력은 제출 전까지 rerun 없이 브라우저에서만 바뀜
+    # (제출 전 값은 프리셋/이전 접수값이므로 진단 미리 생성은 그 값 기준, 바꿔서 제출하면 새로 생성)
+    with st.form("intake_form", border=False):
+        store_name = st.text_input("🏪 가맹점명", placeholder="예: 달구 성수점", value=initial_store_info.get("store_name", ""))
         
-    with col2:
-        location_detail_options = ["역세권/대로변 (유동인구 많음)", "주택가/골목 (거주민 중심)", "오피스/업무지구 (직장인 중심)"]
-        location_detail = st.radio(
-            "🏢 상권 특성",
-            location_detail_options,
-            index=location_detail_options.index(initial_store_info.get("location_detail", location_detail_options[0])) if initial_store_info.get("location_detail") in location_detail_options else 0
-        )
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            location_detail_options = ["역세권/대로변 (유동인구 많음)", "주택가/골목 (거주민 중심)", "오피스/업무지구 (직장인 중심)"]
+            location_detail = st.radio(
+                "🏢 상권 특성",
+                location_detail_options,
+                index=location_detail_options.index(initial_store_info.get("location_detail", location_detail_options[0])) if initial_store_info.get("location_detail") in location_detail_options else 0
+            )
+        
+        with col2:
+            customer_type_options = ["단골 손님 많음", "신규 고객 많음", "단골/신규 비슷", "잘 모르겠음"]
+            customer_type = st.radio(
+                "👥 손님 특성",
+                customer_type_options,
+                index=customer_type_options.index(initial_store_info.get("customer_type", customer_type_options[0])) if initial_store_info.get("customer_type") in customer_type_options else 0
+            )
+        
+        # 고객 성별/연령 비중
+        st.markdown("### 👩👨 주요 고객 성별/연령 (상위 2개 선택)")
+        st.caption("주로 방문하는 고객층 2개를 선택해주세요 (선택사항)")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**여성 고객**")
+            female_20 = st.checkbox("여성 20대 이하", value=initial_store_info.get("female_20", False))
+            female_30 = st.checkbox("여성 30대", value=initial_store_info.get("female_30", False))
+            female_40 = st.checkbox("여성 40대", value=initial_store_info.get("female_40", False))
+            female_50 = st.checkbox("여성 50대", value=initial_store_info.get("female_50", False))
+            female_60 = st.checkbox("여성 60대 이상", value=initial_store_info.get("female_60", False))
+        
+        with col2:
+            st.markdown("**남성 고객**")
+            male_20 = st.checkbox("남성 20대 이하", value=initial_store_info.get("male_20", False))
+            male_30 = st.checkbox("남성 30대", value=initial_store_info.get("male_30", False))
+            male_40 = st.checkbox("남성 40대", value=initial_store_info.get("male_40", False))
+            male_50 = st.checkbox("남성 50대", value=initial_store_info.get("male_50", False))
+            male_60 = st.checkbox("남성 60대 이상", value=initial_store_info.get("male_60", False))
         
-        customer_type_options = ["단골 손님 많음", "신규 고객 많음", "단골/신규 비슷", "잘 모르겠음"]
-        customer_type = st.radio(
-            "👥 손님 특성",
-            customer_type_options,
-            index=customer_type_options.index(initial_store_info.get("customer_type", customer_type_options[0])) if initial_store_info.get("customer_type") in customer_type_options else 0
+        concern = st.text_area(
+            "😰 현재 고민",
+            placeholder="예: 손님은 많은데 단골이 안 생겨요 / 재방문율이 낮아요",
+            height=100,
+            value=initial_store_info.get("concern", "")
         )
+        
+        submitted = st.form_submit_button("🏥 진료 접수하기", type="primary", use_container_width=True)
     
-    # 고객 성별/연령 비중
-    st.markdown("### 👩👨 주요 고객 성별/연령 (상위 2개 선택)")
-    st.caption("주로 방문하는 고객층 2개를 선택해주세요 (선택사항)")
+    # 선택된 고객층 정리 (여성 먼저)
+    selected_customers = []
+    if female_20: selected_customers.append("여성 20대 이하")
+    if female_30: selected_customers.append("여성 30대")
+    if female_40: selected_customers.append("여성 40대")
+    if female_50: selected_customers.append("여성 50대")
+    if female_60: selected_customers.append("여성 60대 이상")
+    if male_20: selected_customers.append("남성 20대 이하")
+    if male_30: selected_customers.append("남성 30대")
+    if male_40: selected_customers.append("남성 40대")
+    if male_50: selected_customers.append("남성 50대")
+    if male_60: selected_customers.append("남성 60대 이상")
     
-    col1, col2 = st.columns(2)
+    customer_demographics = ", ".join(selected_customers) if selected_customers else "미선택"
     
-    with col1:
-        st.markdown("**여성 고객**")
-        female_20 = st.checkbox("여성 20대 이하", value=initial_store_info.get("female_20", False))
-        female_30 = st.checkbox("여성 30대", value=initial_store_info.get("female_30", False))
-        female_40 = st.checkbox("여성 40대", value=initial_store_info.get("female_40", False))
-        female_50 = st.checkbox("여성 50대", value=initial_store_info.get("female_50", False))
-        female_60 = st.checkbox("여성 60대 이상", value=initial_store_info.get("female_60", False))
+    # 진단에 쓰는 입력 (가맹점명/접수일은 진단 내용과 무관하므로 제외, 응답 캐시 키로도 사용)
+    diagnosis_inputs = {
+        "question_type": session.selected_question,
+        "region": region_choice,
+        "location": location,
+        "location_detail": location_detail,
+        "business_type": business_type,
+        "customer_type": customer_type,
+        "customer_demographics": customer_demographics,
+        "concern": concern,
+    }
     
-    with col2:
-        st.markdown("**남성 고객**")
-        male_20 = st.checkbox("남성 20대 이하", value=initial_store_info.get("male_20", False))
-        male_30 = st.checkbox("남성 30대", value=initial_store_info.get("male_30", False))
-        male_40 = st.checkbox("남성 40대", value=initial_store_info.get("male_40", False))
-        male_50 = st.checkbox("남성 50대", value=initial_store_info.get("male_50", False))
-        male_60 = st.checkbox("남성 60대 이상", value=initial_store_info.get("male_60", False))
-    
-    concern = st.text_area(
-        "😰 현재 고민",
-        placeholder="예: 손님은 많은데 단골이 안 생겨요 / 재방문율이 낮아요",
-        height=100,
-        value=initial_store_info.get("concern", "")
-    )
+    # 지역/위치/업종이 정해지면 제출 전에 초기 진단을 미리 생성 (폼 항목은 아직 제출 전 값 기준)
+    # 제출 시점에는 새로 시작하지 않음: 폼 값이 바뀌었으면 아래에서 스트리밍으로 바로 생성
+    if (not submitted and SPECULATIVE_DIAGNOSIS and MODEL_AVAILABLE and location and location != "선택하세요" and
+        business_type != "선택하세요" and region_choice != "선택하세요" and concern):
+        speculate_diagnosis(diagnosis_inputs, diagnosis_inputs)
     
-    if st.button("🏥 진료 접수하기", type="primary", use_container_width=True):
-        # 선택된 고객층 정리 (여성 먼저)
-        selected_customers = []
-        if female_20: selected_customers.append("여성 20대 이하")
-        if female_30: selected_customers.append("여성 30대")
-        if female_40: selected_customers.append("여성 40대")
-        if female_50: selected_customers.append("여성 50대")
-        if female_60: selected_customers.append("여성 60대 이상")
-        if male_20: selected_customers.append("남성 20대 이하")
-        if male_30: selected_customers.append("남성 30대")
-        if male_40: selected_customers.append("남성 40대")
-        if male_50: selected_customers.append("남성 50대")
-        if male_60: selected_customers.append("남성 60대 이상")
-        
-        customer_demographics = ", ".join(selected_customers) if selected_customers else "미선택"
-        
+    if submitted:
         if (store_name and location and location != "선택하세요" and 
             business_type != "선택하세요" and region_choice != "선택하세요" and concern):
             
-            st.session_state.store_info = {
+            session.update(store_info={
                 "store_name": store_name,
                 "region": region_choice,
                 "location": location,
@@ -387,65 +856,170 @@ if st.session_state.step == "접수":
                 "customer_demographics": customer_demographics,
                 "concern": concern,
                 "date": datetime.now().strftime("%Y년 %m월 %d일"),
-                "question_type": st.session_state.selected_question,
+                "question_type": session.selected_question,
                 # 체크박스 저장
                 "male_20": male_20, "male_30": male_30, "male_40": male_40, "male_50": male_50, "male_60": male_60,
                 "female_20": female_20, "female_30": female_30, "female_40": female_40, "female_50": female_50, "female_60": female_60
-            }
+            })
             
             if not MODEL_AVAILABLE:
                 st.error("⚠️ API 키 미설정")
             else:
                 with st.spinner("🔬 초기 검사 중..."):
-                    question_context = ""
-                    if st.session_state.selected_question == 1:
-                        question_context = "\n\n[중요] 카페 고객 특성 및 마케팅 채널 추천에 집중"
-                    elif st.session_state.selected_question == 2:
-                        question_context = "\n\n[중요] 재방문율 개선 전략에 집중"
-                    elif st.session_state.selected_question == 3:
-                        question_context = "\n\n[중요] 요식업 문제 분석에 집중"
-                    elif st.session_state.selected_question == 4:
-                        question_context = "\n\n[중요] 지역별 매출 편차 분석에 집중"
-                    elif st.session_state.selected_question == 5:
-                        question_context = "\n\n[중요] 계절별 매출 변동 분석에 집중"
-                    
-                    initial_prompt = f"""
-                    {SYSTEM_PROMPT}
-                    {question_context}
-                    
-                    가맹점:
-                    - 이름: {store_name}
-                    - 지역: {region_choice} - {location} ({location_detail})
-                    - 업종: {business_type}
-                    - 손님 특성: {customer_type}
-                    - 주요 고객층: {customer_demographics}
-                    - 고민: {concern}
-                    
-                    다음 형식으로 **3-4줄 요약** 진단:
-                    
-                    ## 🔬 초기 검사 결과
-                    
-                    **📍 상권 유형:** [유동형/거주형/직장형] (근거: 신한카드 XX개 매장, 고객 구성 유동XX%/거주XX%)
-                    
-                    **👥 고객 분석:** 주 고객층은 [{customer_demographics}]으로 추정. 신한카드 데이터에서 [특징] (매출건수 XXX%, 재방문 상관 ±X.XX)
-                    
-                    **⚠️ 핵심 문제:** {concern} → 원인은 [1가지 핵심 원인 + 상관계수/비율 근거]
-                    
-                    **💊 우선 처방:** [즉시 실행 가능한 액션 1개]
-                    """
-                    
                     try:
-                        response = model.generate_content(initial_prompt)
-                        st.session_state.diagnosis_result["initial"] = response.text
-                        st.session_state.step = "진료"
-                        st.rerun()
+                        started = time.perf_counter()
+                        # 같은 입력으로 미리 만든 진단이 있으면 사용 (진행 중이면 끝날 때까지 대기)
+                        diagnosis = None
+                        if SPECULATIVE_DIAGNOSIS:
+                            speculation_key = model_caller.response_key(
+                                "diagnosis", diagnosis_inputs, prompt_builder.diagnosis(diagnosis_inputs))
+                            diagnosis = st.session_state.speculator.take(speculation_key, timeout=120)
+                        if diagnosis is not None:
+                            metrics.observe("llm_ttft_seconds", time.perf_counter() - started, stage="diagnosis", mode="speculative")
+                            result = diagnosis_fields(diagnosis)
+                        else:
+                            # JSON 진단 → 화면용 마크다운(initial) + 구조화 결과(structured)
+                            # (읽지 못하면 출력 상한을 늘려 한 번 더, 그래도 안 되면 DiagnosisError 로 아래 오류 표시)
+                            initial_prompt = prompt_builder.diagnosis(session.store_info)
+                            result = generate_diagnosis(
+                                lambda limit: generate_text(initial_prompt, "diagnosis", cache_inputs=diagnosis_inputs, show=False,
+                                                            validate=diagnosis_valid, max_output_tokens=limit),
+                                OUTPUT_LIMITS["diagnosis"],
+                            )
+                        with st.container(border=True):
+                            show_diagnosis(result)
+                        session.update(diagnosis_result=result)
+                        session.update(step="진료")
+                        rerun()
                     except Exception as e:
                         st.error(f"진단 오류: {str(e)}")
         else:
             st.error("⚠️ 필수 항목을 입력해주세요!")
 
 # 2단계: 진료
-elif st.session_state.step == "진료":
+@timed_fragment("consultation")
+def consultation_room():
+    """상담 채팅과 처방전 발급 (질문을 보내도 이 영역만 다시 실행)"""
+    st.markdown("---")
+    st.markdown("### 💬 전문의 상담")
+    
+    if session.message_count == 0:
+        initial_msg = f"""안녕하세요, **{session.store_info.get('store_name', '')}** 점주님!
+
+초기 진단을 완료했습니다. 추가 질문이나 더 알고 싶은 전략을 물어보세요."""
+        session.append("assistant", initial_msg)
+    
+    # 메모리 밖으로 밀려난 이전 대화는 요청할 때만 디스크에서 읽음
+    if session.offset and st.checkbox(f"이전 대화 {session.offset}개 보기", key="show_older_messages"):
+        for message in session.all_messages()[:session.offset]:
+            with st.chat_message(message["role"], avatar="🏥" if message["role"] == "assistant" else "👤"):
+                st.markdown(message["content"])
+    
+    for message in session.messages:
+        with st.chat_message(message["role"], avatar="🏥" if message["role"] == "assistant" else "👤"):
+            st.markdown(message["content"])
+    
+    if prompt := st.chat_input("💬 전문의에게 질문하기..."):
+        session.append("user", prompt)
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(prompt)
+        
+        if not MODEL_AVAILABLE:
+            st.error("⚠️ API 키 미설정")
+        else:
+            try:
+                # 같은 세그먼트 / 같은 진단에서 거의 같은 첫 질문이 있었으면 그 답변을 바로 재사용
+                # (이전 대화가 있으면 답변이 대화에 따라 달라지므로 조회도 저장도 하지 않음)
+                # 세그먼트 모델은 경로 표가 이 요청을 보내는 모델이라 요청 크기를 알도록 프롬프트를 먼저 만든다
+                started = time.perf_counter()
+                diagnosis = diagnosis_context(session.diagnosis_result)
+                first_turn = not any(m["role"] == "user" for m in session.all_messages()[:-1])
+                similarity = question_cache if first_turn else None
+                # 방금 입력한 질문을 뺀 이전 대화 (최근 턴 원문 + 요약)
+                history = st.session_state.chat_memory.history(session.all_messages()[:-1])
+                context = prompt_builder.chat(
+                    session.store_info,
+                    diagnosis,
+                    prompt,
+                    history=history,
+                )
+                segment = segment_key(model_caller.key_model("chat", context), reference_snapshot.version,
+                                      session.store_info, diagnosis)
+                similar = similarity.lookup(segment, prompt) if similarity is not None else None
+                
+                with st.chat_message("assistant", avatar="🏥"):
+                    if similar is not None:
+                        answer = similar.answer
+                        st.markdown(answer)
+                        st.caption(f"♻️ 비슷한 질문(\"{similar.question}\", 유사도 {similar.score:.2f})의 답변입니다")
+                        metrics.observe("llm_ttft_seconds", time.perf_counter() - started, stage="chat", mode="similar")
+                    else:
+                        remember = None
+                        if similarity is not None:
+                            remember = functools.partial(similarity.put, segment, prompt)
+                        answer = generate_text(context, "chat", remember=remember)
+                
+                session.append("assistant", answer)
+                # 윈도 밖으로 밀려난 턴은 응답 출력 후 백그라운드에서 요약, 처방전용 노트도 이번 턴까지 갱신
+                st.session_state.chat_memory.update(session.all_messages(), backend)
+                st.session_state.consultation_digest.update(session.all_messages(), backend)
+            except Exception as e:
+                st.error(f"⚠️ 상담 오류: {str(e)}")
+    
+    st.markdown("---")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.info("💊 충분한 상담 후 처방전을 발급받으세요!")
+    with col2:
+        issue_prescription = st.button("📋 처방전 발급", type="primary", use_container_width=True)
+    
+    # 처방전은 전체 폭으로 스트리밍 출력
+    if issue_prescription:
+        if not MODEL_AVAILABLE:
+            st.error("⚠️ API 키 미설정")
+        else:
+            with st.spinner("📝 처방전 작성 중..."):
+                try:
+                    issued = datetime.now().strftime('%Y년 %m월 %d일')
+                    # 상담 노트 (턴마다 미리 갱신돼 있으므로 보통 바로 준비됨) + 아직 반영되지 않은 메시지
+                    consultation = st.session_state.consultation_digest.context(
+                        session.all_messages(), backend, timeout=float(get_setting("CONSULTATION_DIGEST_WAIT", DIGEST_WAIT))
+                    )
+                    
+                    st.markdown("### 💊 처방전 내용")
+                    with st.container(border=True):
+                        if PRESCRIPTION_MODE == "parallel":
+                            # 섹션별 동시 작성 (머리말은 가맹점 정보로 바로 채움)
+                            prescription = generate_sections(
+                                prescription_header(session.store_info, issued),
+                                prompt_builder.prescription_sections(
+                                    session.store_info,
+                                    diagnosis_context(session.diagnosis_result),
+                                    consultation,
+                                    issued=issued,
+                                ),
+                                "prescription",
+                                issued,
+                            )
+                        else:
+                            prescription_prompt = prompt_builder.prescription(
+                                session.store_info,
+                                diagnosis_context(session.diagnosis_result),
+                                consultation,
+                                issued=issued,
+                            )
+                            prescription = generate_text(prescription_prompt, "prescription")
+                    session.set_result("prescription", prescription)
+                    session.update(step="처방전")
+                    rerun()
+                except Exception as e:
+                    st.error(f"⚠️ 처방전 오류: {str(e)}")
+
+# 단계별 화면 (접수 폼 / 상담 채팅은 위 프래그먼트 안에서만 다시 실행)
+if session.step == "접수":
+    intake_desk()
+
+elif session.step == "진료":
     question_titles = {
         1: "질문 1: 카페 고객 타겟팅",
         2: "질문 2: 재방문율 개선",
@@ -457,13 +1031,13 @@ elif st.session_state.step == "진료":
     st.markdown(f"""
         <div style='background: linear-gradient(135deg, #E8F5E9 0%, #C8E6C9 100%); padding: 1.5rem; border-radius: 10px; border-left: 5px solid #4CAF50; margin-bottom: 1.5rem;'>
             <h2 style='margin: 0; color: #1B5E20;'>🩺 진료실</h2>
-            <p style='margin: 0.5rem 0 0 0; color: #2E7D32;'><strong>{st.session_state.store_info.get('store_name', '')}</strong> | {question_titles.get(st.session_state.store_info.get('question_type'), '일반 진료')}</p>
+            <p style='margin: 0.5rem 0 0 0; color: #2E7D32;'><strong>{session.store_info.get('store_name', '')}</strong> | {question_titles.get(session.store_info.get('question_type'), '일반 진료')}</p>
         </div>
     """, unsafe_allow_html=True)
     
     # 환자 차트
     with st.expander("📄 환자 차트", expanded=False):
-        info = st.session_state.store_info
+        info = session.store_info
         col1, col2 = st.columns(2)
         with col1:
             st.markdown(f"""
@@ -481,165 +1055,45 @@ elif st.session_state.step == "진료":
             """)
     
     # 선택된 질문에 따라 관련 데이터 표시
-    if st.session_state.store_info.get('question_type') == 1:
+    if session.store_info.get('question_type') == 1:
         st.markdown("### 📊 고객 특성별 상관 데이터")
-        df = pd.DataFrame(Q1_CUSTOMER_CORRELATION_DATA)
+        df = correlation_table(1, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 - 고객 유형별 상관계수")
         st.markdown("---")
-    elif st.session_state.store_info.get('question_type') == 2:
+    elif session.store_info.get('question_type') == 2:
         st.markdown("### 📊 재방문율 상관 데이터")
-        df = pd.DataFrame(REVISIT_CORRELATION_DATA)
+        df = correlation_table(2, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 - 재방문 고객 비중과의 상관계수")
         st.markdown("---")
-    elif st.session_state.store_info.get('question_type') == 3:
+    elif session.store_info.get('question_type') == 3:
         st.markdown("### 📊 재방문 고객 확보 데이터")
-        df = pd.DataFrame(Q3_REVISIT_RELATION_DATA)
+        df = correlation_table(3, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 - 재방문 관련 주요 지표")
         st.markdown("---")
-    elif st.session_state.store_info.get('question_type') == 4:
+    elif session.store_info.get('question_type') == 4:
         st.markdown("### 📊 지역별 매출 편차 데이터")
-        df = pd.DataFrame(Q4_REGION_SALES_CORRELATION_DATA)
+        df = correlation_table(4, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 - 지역 매출 영향 요인")
         st.markdown("---")
-    elif st.session_state.store_info.get('question_type') == 5:
+    elif session.store_info.get('question_type') == 5:
         st.markdown("### 📊 계절별 매출 변동 데이터")
-        df = pd.DataFrame(Q5_SEASONAL_CORRELATION_DATA)
+        df = correlation_table(5, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
         st.caption("※ 신한카드 빅데이터 - 월별 고객 패턴 상관계수")
         st.markdown("---")
     
     st.markdown("### 🔬 초기 검사 결과")
     with st.container(border=True):
-        st.markdown(st.session_state.diagnosis_result.get("initial", "진단 중..."))
+        show_diagnosis(session.diagnosis_result)
     
-    st.markdown("---")
-    st.markdown("### 💬 전문의 상담")
-    
-    if len(st.session_state.messages) == 0:
-        initial_msg = f"""안녕하세요, **{st.session_state.store_info.get('store_name', '')}** 점주님!
-
-초기 진단을 완료했습니다. 추가 질문이나 더 알고 싶은 전략을 물어보세요."""
-        st.session_state.messages.append({"role": "assistant", "content": initial_msg})
-    
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"], avatar="🏥" if message["role"] == "assistant" else "👤"):
-            st.markdown(message["content"])
-    
-    if prompt := st.chat_input("💬 전문의에게 질문하기..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(prompt)
-        
-        if not MODEL_AVAILABLE:
-            st.error("⚠️ API 키 미설정")
-        else:
-            try:
-                context = f"""
-                {SYSTEM_PROMPT}
-                
-                가맹점 정보:
-                - 이름: {st.session_state.store_info.get('store_name', '')}
-                - 업종: {st.session_state.store_info.get('business_type', '')}
-                - 위치: {st.session_state.store_info.get('region', '')} - {st.session_state.store_info.get('location', '')}
-                - 상권: {st.session_state.store_info.get('location_detail', '')}
-                - 손님 특성: {st.session_state.store_info.get('customer_type', '')}
-                - 주요 고객: {st.session_state.store_info.get('customer_demographics', '')}
-                - 고민: {st.session_state.store_info.get('concern', '')}
-                
-                초기 진단:
-                {st.session_state.diagnosis_result.get('initial', '')}
-                
-                점주 질문: {prompt}
-                
-                신한카드 데이터의 구체적 수치로 답변하세요.
-                """
-                
-                response = model.generate_content(context)
-                answer = response.text
-                
-                st.session_state.messages.append({"role": "assistant", "content": answer})
-                with st.chat_message("assistant", avatar="🏥"):
-                    st.markdown(answer)
-            except Exception as e:
-                st.error(f"⚠️ 상담 오류: {str(e)}")
-    
-    st.markdown("---")
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        st.info("💊 충분한 상담 후 처방전을 발급받으세요!")
-    with col2:
-        if st.button("📋 처방전 발급", type="primary", use_container_width=True):
-            if not MODEL_AVAILABLE:
-                st.error("⚠️ API 키 미설정")
-            else:
-                with st.spinner("📝 처방전 작성 중..."):
-                    try:
-                        prescription_prompt = f"""
-                        {SYSTEM_PROMPT}
-                        
-                        가맹점 최종 처방전:
-                        
-                        - 이름: {st.session_state.store_info.get('store_name', '')}
-                        - 업종: {st.session_state.store_info.get('business_type', '')}
-                        - 위치: {st.session_state.store_info.get('region', '')} - {st.session_state.store_info.get('location', '')}
-                        - 상권: {st.session_state.store_info.get('location_detail', '')}
-                        - 손님: {st.session_state.store_info.get('customer_type', '')}
-                        - 주요 고객: {st.session_state.store_info.get('customer_demographics', '')}
-                        - 고민: {st.session_state.store_info.get('concern', '')}
-                        
-                        초기 진단:
-                        {st.session_state.diagnosis_result.get('initial', '')}
-                        
-                        상담 기록:
-                        {chr(10).join([f"- {msg['content'][:150]}..." for msg in st.session_state.messages[-10:]])}
-                        
-                        다음 형식의 처방전:
-                        
-                        # 💊 마케팅 처방전
-                        
-                        ## 📋 환자 정보
-                        - 환자명: {st.session_state.store_info.get('store_name', '')}
-                        - 업종: {st.session_state.store_info.get('business_type', '')}
-                        - 위치: {st.session_state.store_info.get('region', '')} - {st.session_state.store_info.get('location', '')}
-                        - 발급일: {st.session_state.store_info.get('date', '')}
-                        
-                        ## 🔬 종합 진단
-                        [상권 유형 + 고객 구조 + 핵심 문제 3가지 (신한카드 데이터 근거)]
-                        
-                        ## 💊 처방 내역
-                        
-                        ### 우선순위 1위
-                        **처방명:** [구체적 전략]
-                        **목표:** [수치 목표]
-                        **근거:** 신한카드 데이터 [상관계수, 비율]
-                        **실행:**
-                        1. [실행 1]
-                        2. [실행 2]
-                        3. [실행 3]
-                        **효과:** [구체적 수치]
-                        
-                        ### 우선순위 2위
-                        (동일 형식)
-                        
-                        ## ⚠️ 주의사항
-                        [주의점 3가지 + 데이터 근거]
-                        
-                        **발급일:** {datetime.now().strftime('%Y년 %m월 %d일')}
-                        """
-                        
-                        prescription = model.generate_content(prescription_prompt)
-                        st.session_state.diagnosis_result["prescription"] = prescription.text
-                        st.session_state.step = "처방전"
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"⚠️ 처방전 오류: {str(e)}")
+    consultation_room()
 
 # 3단계: 처방전
-elif st.session_state.step == "처방전":
+elif session.step == "처방전":
     st.markdown(f"""
         <div style='text-align: center; padding: 1.5rem; background: #E8F5E9; border-radius: 10px; margin-bottom: 2rem;'>
             <div style='font-size: 2.5rem; margin-bottom: 0.5rem;'>🏥</div>
@@ -648,7 +1102,7 @@ elif st.session_state.step == "처방전":
         </div>
     """, unsafe_allow_html=True)
 
-    info = st.session_state.store_info
+    info = session.store_info
     st.markdown("### 📋 환자 차트")
     st.info(f"""
     - **환자명:** {info.get('store_name', 'N/A')}
@@ -658,32 +1112,32 @@ elif st.session_state.step == "처방전":
     """)
     
     # 선택된 질문에 따라 관련 데이터 표시 (처방전 단계)
-    if st.session_state.store_info.get('question_type') == 1:
+    if session.store_info.get('question_type') == 1:
         st.markdown("#### 📊 고객 특성별 상관계수 참고")
-        df = pd.DataFrame(Q1_CUSTOMER_CORRELATION_DATA)
+        df = correlation_table(1, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
-    elif st.session_state.store_info.get('question_type') == 2:
+    elif session.store_info.get('question_type') == 2:
         st.markdown("#### 📊 재방문율 상관계수 참고")
-        df = pd.DataFrame(REVISIT_CORRELATION_DATA)
+        df = correlation_table(2, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
-    elif st.session_state.store_info.get('question_type') == 3:
+    elif session.store_info.get('question_type') == 3:
         st.markdown("#### 📊 재방문 고객 확보 데이터 참고")
-        df = pd.DataFrame(Q3_REVISIT_RELATION_DATA)
+        df = correlation_table(3, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
-    elif st.session_state.store_info.get('question_type') == 4:
+    elif session.store_info.get('question_type') == 4:
         st.markdown("#### 📊 지역별 매출 편차 데이터 참고")
-        df = pd.DataFrame(Q4_REGION_SALES_CORRELATION_DATA)
+        df = correlation_table(4, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
-    elif st.session_state.store_info.get('question_type') == 5:
+    elif session.store_info.get('question_type') == 5:
         st.markdown("#### 📊 계절별 매출 변동 데이터 참고")
-        df = pd.DataFrame(Q5_SEASONAL_CORRELATION_DATA)
+        df = correlation_table(5, session.store_info)
         st.dataframe(df, use_container_width=True, hide_index=True)
     
     st.markdown("---")
     st.markdown("### 💊 처방전 내용")
     
     with st.container(border=True):
-        st.markdown(st.session_state.diagnosis_result.get("prescription", "⏳ 생성 중..."))
+        st.markdown(session.diagnosis_result.get("prescription", "⏳ 생성 중..."))
     
     st.markdown("---")
     st.success("⚕️ 처방전을 저장하여 마케팅 전략을 실행하세요")
@@ -692,54 +1146,48 @@ elif st.session_state.step == "처방전":
     
     with col1:
         if st.button("🔄 새로운 환자 접수", use_container_width=True):
-            st.session_state.step = "접수"
-            st.session_state.store_info = {}
-            st.session_state.messages = []
-            st.session_state.diagnosis_result = {}
-            st.session_state.selected_question = None
-            st.rerun()
+            session.reset()
+            st.session_state.chat_memory.reset()
+            st.session_state.consultation_digest.reset()
+            rerun()
+    
+    # 내보낼 문서는 내용이 같으면 해시도 같아서 다시 그려도 렌더링은 캐시에서 꺼냄
+    document = prescription_document(info, session.diagnosis_result.get("prescription", ""))
+    # 이 브라우저에서 발급한 처방전 (묶음 내려받기용, 새 환자를 접수해도 남음)
+    # 최근 ISSUED_PRESCRIPTIONS_MAX 건만 두고 오래된 것부터 뺌 (다시 그릴 때마다 내용이 바뀌어도 늘지 않게)
+    issued_prescriptions = st.session_state.setdefault("issued_prescriptions", OrderedDict())
+    issued_prescriptions[document.digest] = document
+    issued_prescriptions.move_to_end(document.digest)
+    while len(issued_prescriptions) > ISSUED_PRESCRIPTIONS_MAX:
+        issued_prescriptions.popitem(last=False)
     
     with col2:
-        prescription_text = st.session_state.diagnosis_result.get("prescription", "")
-        store_name = info.get('store_name', '미입력')
-        business_type = info.get('business_type', '미입력')
-        region = info.get('region', '미입력')
-        location = info.get('location', '미입력')
-        date = info.get('date', datetime.now().strftime('%Y년 %m월 %d일'))
-
-        full_prescription = f"""
-┌────────────────────────────────────────────┐
-│       상권 마케팅 처방 클리닉                │
-│   Marketing Prescription Clinic              │
-└────────────────────────────────────────────┘
-
-환자명: {store_name}
-업종: {business_type}
-위치: {region} - {location}
-발급일: {date}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-📊 신한카드 빅데이터 기반 분석
-
-{prescription_text}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-본 처방전은 신한카드 빅데이터 분석 기반
-발급: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        """
-        
-        st.download_button(
-            label="📥 처방전 다운로드",
-            data=full_prescription,
-            file_name=f"처방전_{store_name}_{datetime.now().strftime('%Y%m%d')}.txt",
-            mime="text/plain",
-            use_container_width=True
-        )
+        # 누를 때만 렌더링 (버튼이 화면을 다시 실행하지 않음)
+        for fmt, (mime, _, label) in EXPORT_FORMATS.items():
+            st.download_button(
+                label=f"📥 처방전 다운로드 ({label})",
+                data=functools.partial(prescription_exporter.render, document, fmt),
+                file_name=document.file_name(fmt),
+                mime=mime,
+                key=f"download_{fmt}",
+                on_click="ignore",
+                use_container_width=True
+            )
     
     with col3:
         st.info("💡 실행!")
+    
+    issued = list(st.session_state.issued_prescriptions.values())
+    if issued:
+        st.download_button(
+            label=f"📦 이번 접속에서 발급한 최근 처방전 {len(issued)}건 묶음 (zip)",
+            data=functools.partial(prescription_exporter.zip, issued),
+            file_name=f"처방전_묶음_{datetime.now().strftime('%Y%m%d')}.zip",
+            mime="application/zip",
+            key="download_session_zip",
+            on_click="ignore",
+            use_container_width=True
+        )
 
 # 진행 단계
 st.markdown("---")
@@ -749,13 +1197,13 @@ step_names = ["접수", "진료", "처방전"]
 
 for idx, (col, step_icon, step_name) in enumerate(zip(cols, steps, step_names)):
     with col:
-        if st.session_state.step == step_name:
+        if session.step == step_name:
             st.markdown(f"""
                 <div style='background: #4CAF50; color: white; padding: 1rem; border-radius: 10px; text-align: center; font-weight: bold;'>
                     {step_icon}
                 </div>
             """, unsafe_allow_html=True)
-        elif step_names.index(st.session_state.step) > idx:
+        elif step_names.index(session.step) > idx:
             st.markdown(f"""
                 <div style='background: #C8E6C9; color: #1B5E20; padding: 1rem; border-radius: 10px; text-align: center;'>
                     ✅ {step_icon}
@@ -767,3 +1215,5 @@ for idx, (col, step_icon, step_name) in enumerate(zip(cols, steps, step_names)):
                     {step_icon}
                 </div>
             """, unsafe_allow_html=True)
+
+finish_rerun()
@@ -0,0 +1,465 @@
+"""여러 가맹점 일괄 진단 → 처방전 (헤드리스 CLI)
+
+사용법:
+    python batch.py stores.csv --out results.jsonl [--markdown results.md] [--concurrency 4] [--limit 100]
+
+입력은 CSV 또는 JSONL (확장자로 구분), 열/키는 화면의 store_info 와 같다:
+store_name, region, location, location_detail, business_type, customer_type,
+customer_demographics, concern, question_type(선택), store_id(선택 — 없으면 입력 내용 해시).
+
+가맹점마다 화면과 같은 프롬프트(prompts.PromptBuilder)로 초기 진단 → 처방전을 만들고
+끝나는 대로 결과 JSONL(--out)과 마크다운(--markdown)에 한 건씩 기록한다.
+결과 JSONL 이 체크포인트이므로 중단 후 같은 명령을 다시 실행하면 성공한 가맹점은 건너뛴다
+(실패한 가맹점은 다시 시도하며, 같은 id 가 여러 줄이면 마지막 줄이 최종 결과).
+Ctrl-C 를 누르면 새 가맹점은 시작하지 않고 진행 중인 것만 마무리해 기록한다.
+
+설정은 환경변수로 화면과 같은 이름을 쓴다 (LLM_BACKEND, GEMINI_API_KEY, GEMINI_MODEL, LLM_* 관문,
+LLM_CACHE*, CONTEXT_CACHE*, PRESCRIPTION_MODE, REFERENCE_TOKEN_BUDGET, CORRELATION_DATA_PATH, METRICS_FILE,
+MAX_OUTPUT_TOKENS_*, MODEL_ROUTING / MODEL_TIERS / MODEL_ROUTES, LLM_COALESCE, HEDGING / HEDGE_*).
+초기 진단은 화면과 같은 키로 응답 캐시를 함께 쓴다. 참고 문서는 저장소에 포함된 사본을 사용한다.
+비용은 응답한 모델별 가격(100만 토큰당 USD)으로 계산한다: LLM_PRICES ({"모델": {"input", "cached_input", "output"}} JSON)
+와 기본 표(DEFAULT_PRICES)에 없는 모델은 LLM_PRICE_INPUT / LLM_PRICE_CACHED_INPUT / LLM_PRICE_OUTPUT.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+
+import metrics
+from metrics_export import exporter_from_settings
+from call_gate import gate_from_settings
+from model_router import router_from_settings
+from model_calls import ModelCaller
+from coalescing import coalescer_from_settings
+from hedging import hedging_from_settings
+from context_cache import ContextCacheManager, DEFAULT_TTL as CONTEXT_CACHE_TTL
+from correlations import CorrelationStore, DEFAULT_PATH as CORRELATION_DATA_PATH
+from doc_retrieval import DEFAULT_TOKEN_BUDGET
+from llm_backend import create_backend
+from prompts import PromptBuilder, OUTPUT_TOKEN_LIMITS, prescription_header, assemble_prescription
+from diagnosis import generate as generate_diagnosis, valid as diagnosis_valid, context as diagnosis_context
+from reference_doc import ReferenceDocument
+from response_cache import ResponseCache, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from sectioned import SectionedGeneration
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LOCAL_DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+# 필수 입력 (화면 접수와 같은 기준)
+REQUIRED_FIELDS = ("store_name", "region", "location", "business_type", "concern")
+STORE_FIELDS = (
+    "store_name", "region", "location", "location_detail", "business_type",
+    "customer_type", "customer_demographics", "concern", "question_type",
+)
+# 초기 진단 응답 캐시 키에 쓰는 입력 (app.py 의 diagnosis_inputs 와 같음)
+DIAGNOSIS_INPUTS = (
+    "question_type", "region", "location", "location_detail", "business_type",
+    "customer_type", "customer_demographics", "concern",
+)
+
+
+def get_setting(name, default=None):
+    return os.environ.get(name, default)
+
+
+def _enabled(name, default):
+    return str(get_setting(name, default)).lower() not in ("0", "false", "no", "off")
+
+
+# ==================== 입력 ====================
+def normalize_store(record):
+    """입력 한 행 → store_info (빈 값 정리, question_type 은 정수)"""
+    info = {key: str(record.get(key) or "").strip() for key in STORE_FIELDS}
+    question = info.pop("question_type")
+    info["question_type"] = int(float(question)) if question else None
+    info["customer_demographics"] = info["customer_demographics"] or "미선택"
+    store_id = str(record.get("store_id") or "").strip()
+    if not store_id:
+        payload = json.dumps(info, ensure_ascii=False, sort_keys=True)
+        store_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+    return store_id, info
+
+
+def read_stores(path):
+    """CSV / JSONL → [(id, store_info)] (입력 순서)"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+    return [normalize_store(record) for record in records]
+
+
+# ==================== 비용 ====================
+@dataclass
+class Pricing:
+    """100만 토큰당 USD (기본값: Gemini 2.0 Flash 유료 등급 공시 가격)"""
+    input: float = 0.10
+    cached_input: float = 0.025
+    output: float = 0.40
+
+    def cost(self, usage):
+        return (usage["input_tokens"] * self.input + usage["cached_tokens"] * self.cached_input
+                + usage["output_tokens"] * self.output) / 1_000_000
+
+
+# 모델별 공시 가격 (라우터가 고른 모델마다 따로 계산, 표에 없는 모델은 기본 가격)
+DEFAULT_PRICES = {
+    "gemini-2.0-flash": Pricing(),
+    "gemini-2.0-flash-lite": Pricing(input=0.075, cached_input=0.01875, output=0.30),
+}
+
+
+class PriceTable:
+    """모델명 → Pricing ("stub:" 접두어는 떼고 찾음)"""
+
+    def __init__(self, prices=None, default=None):
+        self.prices = dict(DEFAULT_PRICES if prices is None else prices)
+        self.default = default or Pricing()
+
+    def for_model(self, model):
+        model = (model or "").removeprefix("stub:").removeprefix("models/")
+        return self.prices.get(model, self.default)
+
+    def cost(self, usage):
+        """usage["models"] 의 모델별 토큰 수 × 모델별 가격"""
+        return sum(self.for_model(model).cost(tokens) for model, tokens in usage["models"].items())
+
+
+def pricing_from_settings():
+    """LLM_PRICE_* (표에 없는 모델의 기본 가격) + LLM_PRICES ({"모델": {"input", "cached_input", "output"}} JSON)"""
+    defaults = Pricing()
+    default = Pricing(
+        input=float(get_setting("LLM_PRICE_INPUT", defaults.input)),
+        cached_input=float(get_setting("LLM_PRICE_CACHED_INPUT", defaults.cached_input)),
+        output=float(get_setting("LLM_PRICE_OUTPUT", defaults.output)),
+    )
+    prices = dict(DEFAULT_PRICES)
+    for model, row in json.loads(get_setting("LLM_PRICES") or "{}").items():
+        prices[model] = Pricing(**row)
+    return PriceTable(prices, default)
+
+
+def empty_tokens():
+    return {"input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+
+
+def empty_usage():
+    return {"calls": 0, "cache_hits": 0, "shared": 0, **empty_tokens(), "models": {}}
+
+
+def add_usage(usage, result, stage):
+    """응답 하나의 토큰 수를 usage (전체 + 모델별) 와 metrics(llm_tokens_total) 에 더함 (input 은 캐시 제외분)
+
+    병합된 요청이 받은 응답(shared)은 호출 / 토큰 / 비용 없이 shared 횟수만 센다 (대표 요청이 집계).
+    """
+    if result.shared:
+        usage["shared"] += 1
+        return
+    usage["calls"] += 1
+    by_model = usage["models"].setdefault(result.model, empty_tokens())
+    cached = result.cached_tokens or 0
+    if result.prompt_tokens is not None:
+        for tokens in (usage, by_model):
+            tokens["input_tokens"] += result.prompt_tokens - cached
+            tokens["cached_tokens"] += cached
+        metrics.inc("llm_tokens_total", result.prompt_tokens - cached, stage=stage, kind="input")
+        metrics.inc("llm_tokens_total", cached, stage=stage, kind="cached_input")
+    if result.output_tokens is not None:
+        for tokens in (usage, by_model):
+            tokens["output_tokens"] += result.output_tokens
+        metrics.inc("llm_tokens_total", result.output_tokens, stage=stage, kind="output")
+
+
+# ==================== 진단 → 처방전 ====================
+class BatchPipeline:
+    """가맹점 하나의 초기 진단 → 처방전 (여러 스레드에서 동시에 호출)"""
+
+    def __init__(self, backend, builder, response_cache=None, context_cache=None,
+                 prescription_mode="single", pricing=None, output_limits=None):
+        self.backend = backend
+        self.builder = builder
+        self.response_cache = response_cache
+        self.prescription_mode = prescription_mode
+        self.pricing = pricing or PriceTable()
+        # 키 / 호출 방식은 화면과 같은 model_calls.ModelCaller (응답 캐시 공유)
+        self.caller = ModelCaller(backend, builder, output_limits, context_cache)
+
+    def generate(self, prompt, stage, usage, cache_inputs=None, validate=None, max_output_tokens=None):
+        """app.py 의 generate_text 와 같은 캐시 규칙 (validate 가 거짓인 응답은 캐시에 넣지도, 캐시에서 쓰지도 않음)"""
+        cache_key = None
+        if self.response_cache is not None and cache_inputs is not None:
+            cache_key = self.caller.response_key(stage, cache_inputs, prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None and (validate is None or validate(cached)):
+                metrics.inc("llm_cache_hits_total", stage=stage)
+                usage["cache_hits"] += 1
+                return cached
+            metrics.inc("llm_cache_misses_total", stage=stage)
+        with metrics.span("llm_request", stage=stage, mode="batch"):
+            result = self.caller.call(prompt, stage, stream=False, max_output_tokens=max_output_tokens)
+        add_usage(usage, result, stage)
+        if (cache_key is not None and result.text and self.caller.cacheable(result)
+                and (validate is None or validate(result.text))):
+            self.response_cache.put(cache_key, result.text, stage=stage)
+        return result.text
+
+    def prescription(self, store_info, diagnosis, issued, usage):
+        if self.prescription_mode != "parallel":
+            prompt = self.builder.prescription(store_info, diagnosis, "", issued=issued)
+            return self.generate(prompt, "prescription", usage)
+        sections = self.builder.prescription_sections(store_info, diagnosis, "", issued=issued)
+        generation = SectionedGeneration([
+            (name, title, lambda prompt=prompt: self.caller.call(prompt, "prescription_section", stream=True))
+            for name, title, prompt in sections
+        ]).start().wait()
+        for state in generation.sections:
+            metrics.observe("llm_request_seconds", state.finished, stage="prescription_section", mode="batch")
+        generation.raise_for_error()
+        for state in generation.sections:
+            add_usage(usage, state.result, "prescription_section")
+        header = prescription_header(store_info, issued)
+        return assemble_prescription(header, [(s.name, s.title, s.text) for s in generation.sections], issued)
+
+    def run(self, store_id, store_info):
+        """결과 레코드 (실패해도 예외 대신 status=error 레코드)"""
+        started = time.perf_counter()
+        usage = empty_usage()
+        issued = datetime.now().strftime("%Y년 %m월 %d일")
+        info = dict(store_info, date=issued)
+        record = {"id": store_id, "store_info": info}
+        missing = [key for key in REQUIRED_FIELDS if not info.get(key)]
+        try:
+            if missing:
+                raise ValueError(f"필수 항목 누락: {', '.join(missing)}")
+            prompt = self.builder.diagnosis(info)
+            cache_inputs = {key: info.get(key) for key in DIAGNOSIS_INPUTS}
+            diagnosis = generate_diagnosis(
+                lambda limit: self.generate(prompt, "diagnosis", usage, cache_inputs=cache_inputs,
+                                            validate=diagnosis_valid, max_output_tokens=limit),
+                self.caller.output_limits["diagnosis"],
+            )
+            record["diagnosis"] = diagnosis["initial"]
+            if diagnosis.get("structured"):
+                record["diagnosis_structured"] = diagnosis["structured"]
+            record["prescription"] = self.prescription(info, diagnosis_context(diagnosis), issued, usage)
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        record["usage"] = usage
+        record["cost_usd"] = round(self.pricing.cost(usage), 8)
+        metrics.observe("batch_store_seconds", record["seconds"], status=record["status"])
+        metrics.inc("batch_stores_total", status=record["status"])
+        return record
+
+
+# ==================== 결과 기록 ====================
+class ResultWriter:
+    """결과 JSONL(체크포인트) + 마크다운에 한 건씩 추가 기록 (작업 스레드에서 호출)"""
+
+    def __init__(self, out_path, markdown_path=None):
+        self.out_path = out_path
+        self.markdown_path = markdown_path
+        self._lock = threading.Lock()
+
+    def completed(self):
+        """이미 성공한 가맹점 id (중간에 끊긴 마지막 줄은 무시)"""
+        done = {}
+        if not os.path.exists(self.out_path):
+            return set()
+        with open(self.out_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[record.get("id")] = record.get("status")
+        return {store_id for store_id, status in done.items() if status == "ok"}
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.out_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.markdown_path and record["status"] == "ok":
+                info = record["store_info"]
+                with open(self.markdown_path, "a", encoding="utf-8") as f:
+                    f.write(f"# {info.get('store_name')} ({record['id']})\n\n"
+                            f"{record['diagnosis']}\n\n{record['prescription']}\n\n---\n\n")
+
+
+# ==================== 실행 ====================
+def build_pipeline(prescription_mode):
+    """환경변수 설정으로 백엔드 / 프롬프트 빌더 / 캐시 구성 (화면과 같은 기본값)"""
+    backend = create_backend(get_setting)
+    if backend is None:
+        raise SystemExit("GEMINI_API_KEY 를 설정하거나 LLM_BACKEND=stub 으로 실행하세요.")
+    backend = router_from_settings(gate_from_settings(backend, get_setting), get_setting)
+    backend = coalescer_from_settings(hedging_from_settings(backend, get_setting), get_setting)
+    snapshot = ReferenceDocument(None, LOCAL_DOC_PATH).snapshot
+    full_reference = str(get_setting("CONTEXT_CACHE", "false")).lower() in ("1", "true", "yes", "on")
+    builder = PromptBuilder(
+        snapshot.text, snapshot.version,
+        int(get_setting("REFERENCE_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+        full_reference=full_reference,
+        correlations=CorrelationStore(get_setting("CORRELATION_DATA_PATH", CORRELATION_DATA_PATH)),
+    )
+    response_cache = None
+    if _enabled("LLM_CACHE", "true"):
+        response_cache = ResponseCache(
+            get_setting("LLM_CACHE_PATH", os.path.join(ROOT, ".cache", "llm_responses.sqlite3")),
+            ttl=float(get_setting("LLM_CACHE_TTL", DEFAULT_TTL)),
+            max_entries=int(get_setting("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+    context_cache = None
+    if full_reference:
+        context_cache = ContextCacheManager(
+            backend,
+            ttl=int(get_setting("CONTEXT_CACHE_TTL", CONTEXT_CACHE_TTL)),
+            min_tokens=int(get_setting("CONTEXT_CACHE_MIN_TOKENS", 0)),
+        )
+    return BatchPipeline(
+        backend, builder,
+        response_cache=response_cache, context_cache=context_cache,
+        prescription_mode=prescription_mode, pricing=pricing_from_settings(),
+        output_limits={
+            stage: int(get_setting(f"MAX_OUTPUT_TOKENS_{stage.upper()}", limit))
+            for stage, limit in OUTPUT_TOKEN_LIMITS.items()
+        },
+    )
+
+
+def run_batch(pipeline, stores, writer, concurrency, progress=None):
+    """stores 를 최대 concurrency 건씩 동시에 처리, 끝난 레코드 목록 반환 (Ctrl-C 면 진행 중인 것만 마무리)"""
+    records = []
+    pending = iter(stores)
+    in_flight = set()
+    interrupted = False
+
+    def work(store_id, info):
+        record = pipeline.run(store_id, info)
+        writer.write(record)
+        return record
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        while True:
+            while not interrupted and len(in_flight) < concurrency:
+                item = next(pending, None)
+                if item is None:
+                    break
+                in_flight.add(executor.submit(work, *item))
+            if not in_flight:
+                break
+            try:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                interrupted = True
+                print(f"\n중단: 진행 중인 {len(in_flight)}건만 마무리합니다 (다시 실행하면 이어서 처리)", file=sys.stderr)
+                continue
+            for future in finished:
+                record = future.result()
+                records.append(record)
+                if progress is not None:
+                    progress(record)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return records, interrupted
+
+
+def summarize(records, elapsed, skipped):
+    ok = [r for r in records if r["status"] == "ok"]
+    seconds = sorted(r["seconds"] for r in ok)
+    usage = empty_usage()
+    for record in records:
+        for key, value in record["usage"].items():
+            if key != "models":
+                usage[key] += value
+        for model, tokens in record["usage"]["models"].items():
+            total = usage["models"].setdefault(model, empty_tokens())
+            for key in total:
+                total[key] += tokens[key]
+    cost = sum(r["cost_usd"] for r in records)
+    return {
+        "processed": len(records),
+        "ok": len(ok),
+        "errors": len(records) - len(ok),
+        "skipped": skipped,
+        "elapsed_s": round(elapsed, 3),
+        "stores_per_minute": round(len(ok) / elapsed * 60, 2) if elapsed > 0 else None,
+        "store_p50_s": round(statistics.median(seconds), 3) if seconds else None,
+        "store_p95_s": round(seconds[int(0.95 * (len(seconds) - 1))], 3) if seconds else None,
+        "usage": usage,
+        "cost_usd": round(cost, 6),
+        "cost_per_store_usd": round(cost / len(ok), 8) if ok else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="여러 가맹점 일괄 진단 → 처방전")
+    parser.add_argument("input", help="가맹점 목록 (.csv / .jsonl)")
+    parser.add_argument("--out", required=True, help="결과 JSONL (체크포인트 겸용, 이어쓰기)")
+    parser.add_argument("--markdown", help="처방전 마크다운 (이어쓰기)")
+    parser.add_argument("--concurrency", type=int, default=int(float(get_setting("LLM_MAX_CONCURRENCY", 4))),
+                        help="동시에 처리할 가맹점 수 (모델 호출 수는 LLM_MAX_CONCURRENCY 관문이 한 번 더 제한)")
+    parser.add_argument("--limit", type=int, help="이번 실행에서 처리할 최대 가맹점 수")
+    parser.add_argument("--prescription-mode", default=str(get_setting("PRESCRIPTION_MODE", "single")).lower(),
+                        choices=("single", "parallel"))
+    parser.add_argument("--summary-json", help="요약을 JSON 파일로도 저장")
+    parser.add_argument("--quiet", action="store_true", help="가맹점별 진행 출력 생략")
+    args = parser.parse_args(argv)
+
+    exporter_from_settings(get_setting)
+    stores = read_stores(args.input)
+    writer = ResultWriter(args.out, args.markdown)
+    done = writer.completed()
+    todo = [(store_id, info) for store_id, info in stores if store_id not in done]
+    skipped = len(stores) - len(todo)
+    if args.limit is not None:
+        todo = todo[: args.limit]
+    print(f"가맹점 {len(stores)}곳 · 완료 {skipped}곳 건너뜀 · 이번 실행 {len(todo)}곳 · 동시 {args.concurrency}", file=sys.stderr)
+
+    pipeline = build_pipeline(args.prescription_mode)
+    count = [0]
+
+    def progress(record):
+        count[0] += 1
+        if args.quiet:
+            return
+        name = record["store_info"].get("store_name")
+        detail = record.get("error") or f"${record['cost_usd']:.5f}"
+        print(f"[{count[0]}/{len(todo)}] {record['status']:<5} {name} ({record['id']}) "
+              f"{record['seconds']:.1f}s {detail}", file=sys.stderr)
+
+    started = time.perf_counter()
+    records, interrupted = run_batch(pipeline, todo, writer, max(args.concurrency, 1), progress)
+    summary = summarize(records, time.perf_counter() - started, skipped)
+    summary["interrupted"] = interrupted
+
+    usage = summary["usage"]
+    print(f"처리 {summary['processed']}곳 (성공 {summary['ok']}, 실패 {summary['errors']}) · {summary['elapsed_s']:.1f}초 · "
+          f"{summary['stores_per_minute'] or 0:.1f}곳/분 · 가맹점당 p50 {summary['store_p50_s'] or 0:.1f}초 "
+          f"p95 {summary['store_p95_s'] or 0:.1f}초", file=sys.stderr)
+    print(f"토큰: 입력 {usage['input_tokens']} · 캐시 입력 {usage['cached_tokens']} · 출력 {usage['output_tokens']} · "
+          f"호출 {usage['calls']} · 병합 {usage['shared']} · 응답 캐시 적중 {usage['cache_hits']}", file=sys.stderr)
+    print(f"비용: 합계 ${summary['cost_usd']:.4f} · 가맹점당 ${summary['cost_per_store_usd'] or 0:.6f}", file=sys.stderr)
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 130 if interrupted else (1 if summary["errors"] else 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""순간 몰림에서 호출 관문 유무 비교 (사용자에게 보이는 오류 / 지연시간 / 재시도)
+
+사용법:
+    python benchmarks/bench_call_gate.py [--requests 60] [--threads 20] [--error-429 0.2] [--outage 0] [--json out.json]
+
+스텁 백엔드에 스레드 여러 개로 동시에 요청을 보낸다. --outage 초 동안은 모든 호출이 500 으로 실패해
+서킷 브레이커가 여는지(바로 실패) 확인할 수 있다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from call_gate import CallGate  # noqa: E402
+from llm_backend import ServerError, StubBackend, StubProfile  # noqa: E402
+
+
+class OutageStub(StubBackend):
+    """시작 후 outage 초 동안 모든 호출이 500"""
+
+    def __init__(self, profile, outage):
+        super().__init__(profile)
+        self._outage_until = time.monotonic() + outage
+
+    def stream(self, prompt, model=None, **options):
+        if time.monotonic() < self._outage_until:
+            with self._lock:
+                self.calls += 1
+            raise ServerError("stub: outage")
+        return super().stream(prompt, model=model, **options)
+
+
+def run(backend, requests, threads):
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            for _ in backend.stream(f"요청 {i}"):
+                pass
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": wall,
+        "p50_s": statistics.median(latencies) if latencies else None,
+        "p95_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        "backend_calls": backend.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--error-429", type=float, default=0.2)
+    parser.add_argument("--outage", type=float, default=0.0, help="시작 후 전부 실패하는 시간 (초)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    profile = StubProfile(ttft_ms=400, output_tokens=40, error_429=args.error_429, seed=7, time_scale=args.time_scale)
+    results = {}
+
+    backend = OutageStub(profile, args.outage)
+    results["direct"] = run(backend, args.requests, args.threads)
+
+    metrics.reset()
+    stub = OutageStub(profile, args.outage)
+    gate = CallGate(stub, max_concurrency=args.concurrency, rate_per_second=args.rate, burst=args.concurrency,
+                    backoff_base=0.05, backoff_max=0.5, cooldown=max(args.outage / 2, 0.5))
+    results["gated"] = run(gate, args.requests, args.threads)
+    results["gated"]["backend_calls"] = stub.calls
+    wait = metrics.summary("llm_queue_wait_seconds", operation="stream")
+    results["gated"].update({
+        "retries": metrics.total("llm_retries_total"),
+        "circuit_rejections": metrics.total("llm_circuit_rejections_total"),
+        "queue_wait_p95_s": wait.get("p95"),
+        "circuit": gate.stats()["circuit"],
+    })
+
+    for name, r in results.items():
+        p50 = f"{r['p50_s']:.2f}s" if r["p50_s"] is not None else "-"
+        p95 = f"{r['p95_s']:.2f}s" if r["p95_s"] is not None else "-"
+        print(f"{name:>7}: 성공 {r['ok']}/{args.requests}, 오류 {r['errors'] or '없음'}, "
+              f"p50 {p50} p95 {p95}, 백엔드 호출 {r['backend_calls']}회, 전체 {r['wall_s']:.2f}s")
+    gated = results["gated"]
+    print(f"관문: 재시도 {gated['retries']:.0f}회, 브레이커 거절 {gated['circuit_rejections']:.0f}회, "
+          f"대기 p95 {(gated['queue_wait_p95_s'] or 0) * 1000:.0f}ms, 브레이커 {gated['circuit']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
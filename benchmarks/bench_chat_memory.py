@@ -0,0 +1,105 @@
+"""긴 상담에서 턴별 프롬프트 크기/지연시간: 전체 대화 삽입 vs 최근 턴 + 요약
+
+사용법:
+    python benchmarks/bench_chat_memory.py [--turns 30] [--time-scale 0.05] [--json out.json]
+
+스텁 백엔드로 같은 질문 흐름을 두 방식으로 진행해 턴별 입력 토큰(추정)과 응답 지연시간을 비교한다.
+요약은 백그라운드에서 갱신되므로 memory 방식의 지연시간에는 포함되지 않는다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from chat_memory import ConversationMemory, DEFAULT_HISTORY_TOKENS, DEFAULT_MAX_TURNS, format_turns  # noqa: E402
+from doc_retrieval import estimate_tokens  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+QUESTIONS = [
+    "인스타그램 광고는 어떤 고객층에 효과적인가요?",
+    "재방문 쿠폰은 얼마나 자주 발행해야 하나요?",
+    "주말 매출을 올리려면 어떻게 해야 하나요?",
+    "경쟁 매장과 차별화하려면 무엇부터 해야 하나요?",
+    "여름철 매출 하락은 어떻게 대비하나요?",
+]
+
+
+def run(mode, builder, backend, store_info, turns, memory):
+    messages = [{"role": "assistant", "content": "안녕하세요, 점주님! 초기 진단을 완료했습니다."}]
+    rows = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        messages.append({"role": "user", "content": question})
+        if mode == "memory":
+            history = memory.history(messages[:-1])
+        else:
+            history = format_turns(messages[1:-1])
+        prompt = builder.chat(store_info, "초기 진단 결과", question, history=history)
+        started = time.perf_counter()
+        answer = backend.generate(prompt.text).text
+        latency = time.perf_counter() - started
+        messages.append({"role": "assistant", "content": answer})
+        if mode == "memory":
+            memory.update(messages, backend)
+        counts = prompt.token_counts()
+        rows.append({
+            "turn": turn + 1,
+            "prompt_tokens": estimate_tokens(prompt.text),
+            "history_tokens": counts.get("history", 0),
+            "latency_s": latency,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--history-tokens", type=int, default=DEFAULT_HISTORY_TOKENS)
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS)
+    parser.add_argument("--time-scale", type=float, default=0.05, help="스텁 대기시간 배율")
+    parser.add_argument("--input-tps", type=float, default=2000, help="스텁 입력 처리 속도 (토큰/초)")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        builder = PromptBuilder(f.read())
+    store_info = dict(PRESET_STORE_INFO[2], store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                      customer_demographics="여성 30대", question_type=2)
+    profile = StubProfile(latency="fixed", ttft_ms=300, output_tokens=150, input_tokens_per_second=args.input_tps,
+                          seed=1, time_scale=args.time_scale)
+
+    results = {}
+    for mode in ("full", "memory"):
+        memory = ConversationMemory(history_tokens=args.history_tokens, max_turns=args.max_turns)
+        results[mode] = run(mode, builder, StubBackend(profile), store_info, args.turns, memory)
+        memory.wait()
+
+    print(f"{'턴':>3} {'전체 tok':>9} {'기억 tok':>9} {'전체 지연':>9} {'기억 지연':>9}")
+    for full, mem in zip(results["full"], results["memory"]):
+        print(f"{full['turn']:>3} {full['prompt_tokens']:>9} {mem['prompt_tokens']:>9} "
+              f"{full['latency_s']:>9.3f} {mem['latency_s']:>9.3f}")
+
+    last = slice(-5, None)
+    for mode, rows in results.items():
+        print(f"{mode}: 마지막 5턴 평균 입력 {statistics.fmean(r['prompt_tokens'] for r in rows[last]):.0f} 토큰, "
+              f"지연 {statistics.fmean(r['latency_s'] for r in rows[last]):.3f}s")
+    summary = metrics.summary("chat_summary_seconds")
+    if summary["count"]:
+        print(f"백그라운드 요약: {summary['count']}회, 평균 {summary['mean']:.3f}s")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
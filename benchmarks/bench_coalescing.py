@@ -0,0 +1,102 @@
+"""동시에 같은 사전 질문으로 접수할 때 요청 병합 전/후 실제 호출 수와 응답 시간
+
+사용법:
+    python benchmarks/bench_coalescing.py [--users 20] [--distinct 1,4] [--time-scale 0.05] [--json out.json]
+
+--users 명이 동시에(Barrier) 초기 진단 스트림을 요청한다. 프롬프트는 --distinct 가지 중 하나
+(사전 질문 버튼이 같으면 같은 프롬프트, 공백만 다른 경우 포함).
+관문(LLM_* 기본값: 동시 4 / 초당 5)을 거치는 스텁 백엔드에서
+병합 없음 / RequestCoalescer 의 실제 호출 수, 병합 비율, 전체 응답 시간 p50/p95 를 비교한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from call_gate import CallGate  # noqa: E402
+from coalescing import RequestCoalescer  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO, generation_options  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+
+def prompts_for(builder, distinct):
+    texts = []
+    for n in range(distinct):
+        info = dict(PRESET_STORE_INFO[n % 5 + 1], store_name="", region="서울 성동구", location="성수동1가",
+                    customer_demographics="여성 30대", question_type=n % 5 + 1)
+        texts.append(builder.diagnosis(info).text)
+    return texts
+
+
+def burst(backend, texts, users):
+    barrier = threading.Barrier(users)
+    options = generation_options("diagnosis")
+
+    def user(n):
+        text = texts[n % len(texts)]
+        if n % 3 == 2:
+            text = text.replace("\n", "\n ")  # 공백만 다른 같은 요청
+        barrier.wait()
+        started = time.perf_counter()
+        stream = backend.stream(text, **options)
+        for _ in stream:
+            pass
+        return time.perf_counter() - started, stream.text
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        return list(pool.map(user, range(users)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--distinct", default="1,4", help="서로 다른 프롬프트 수 (쉼표로 여러 경우)")
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        builder = PromptBuilder(f.read())
+
+    results = {}
+    print(f"{'프롬프트':>8} {'방식':<8} {'실제 호출':>9} {'병합 비율':>9} {'p50(초)':>8} {'p95(초)':>8}")
+    for distinct in (int(n) for n in args.distinct.split(",")):
+        texts = prompts_for(builder, distinct)
+        for label, coalesce in (("병합 없음", False), ("병합", True)):
+            metrics.reset()
+            stub = StubBackend(StubProfile(ttft_ms=1500, tokens_per_second=60, output_tokens=150,
+                                           time_scale=args.time_scale, seed=1))
+            backend = CallGate(stub)
+            if coalesce:
+                backend = RequestCoalescer(backend)
+            rows = burst(backend, texts, args.users)
+            seconds = sorted(row[0] / args.time_scale for row in rows)
+            ratio = backend.coalescing_stats()["ratio"] if coalesce else 0.0
+            results[f"{distinct}/{label}"] = {
+                "calls": stub.calls,
+                "coalescing_ratio": ratio,
+                "p50_s": statistics.median(seconds),
+                "p95_s": seconds[int(0.95 * (len(seconds) - 1))],
+                "answers": len({row[1] for row in rows}),
+            }
+            row = results[f"{distinct}/{label}"]
+            print(f"{distinct:>8} {label:<8} {row['calls']:>9} {row['coalescing_ratio']:>9.0%} "
+                  f"{row['p50_s']:>8.2f} {row['p95_s']:>8.2f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
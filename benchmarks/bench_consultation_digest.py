@@ -0,0 +1,109 @@
+"""처방전 발급 시 상담 기록: 최근 메시지 잘라 넣기 / 대화 기억(요약 + 최근 턴) / 상담 노트 비교
+
+사용법:
+    python benchmarks/bench_consultation_digest.py [--turns 5,15,30] [--time-scale 0.02] [--json out.json]
+
+스텁 백엔드로 --turns 턴의 상담을 진행한 뒤 처방전 프롬프트를 세 방식으로 만든다.
+- log: prompts.consultation_log (최근 10개 메시지, 메시지당 150자)
+- history: chat_memory.ConversationMemory.history (이전 요약 + 최근 턴 원문)
+- digest: consultation_digest.ConsultationDigest.context (턴마다 백그라운드로 갱신한 노트)
+상담 기록 토큰, 처방전 전체 입력 토큰, 반영된 메시지 비율, 발급 시 상담 기록 준비 시간(ms)을 비교한다.
+노트 갱신은 상담 중 백그라운드에서 일어나므로 발급 시간에는 밀린 갱신을 기다린 시간만 들어간다.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from chat_memory import ConversationMemory  # noqa: E402
+from consultation_digest import ConsultationDigest  # noqa: E402
+from doc_retrieval import estimate_tokens  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO, consultation_log  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+QUESTIONS = [
+    "인스타그램 광고는 어떤 고객층에 효과적인가요?",
+    "재방문 쿠폰은 얼마나 자주 발행해야 하나요?",
+    "저희 매장은 평일 오후 2~5시가 한가해요. 이 시간대 전략이 있을까요?",
+    "월 마케팅 예산이 50만원 정도인데 어디에 쓰는 게 좋을까요?",
+    "말씀하신 스탬프 적립은 바로 시작해 볼게요. 목표는 어떻게 잡을까요?",
+]
+
+
+def converse(backend, builder, store_info, turns, memory, digest):
+    messages = [{"role": "assistant", "content": "안녕하세요, 점주님! 초기 진단을 완료했습니다."}]
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        messages.append({"role": "user", "content": question})
+        prompt = builder.chat(store_info, "초기 진단 결과", question, history=memory.history(messages[:-1]))
+        messages.append({"role": "assistant", "content": backend.generate(prompt.text).text})
+        memory.update(messages, backend)
+        digest.update(messages, backend)
+    return messages
+
+
+def reflected(mode, messages):
+    """상담 기록에 (원문, 요약, 노트 어느 형태로든) 반영된 대화 메시지 비율"""
+    dialogue = len(messages) - 1
+    if mode == "log":
+        return min(10, dialogue) / dialogue
+    return 1.0  # 요약 + 최근 턴 / 노트 + 반영 전 메시지
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", default="5,15,30")
+    parser.add_argument("--time-scale", type=float, default=0.02)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        builder = PromptBuilder(f.read())
+    store_info = dict(PRESET_STORE_INFO[2], store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                      customer_demographics="여성 30대", question_type=2)
+
+    results = {}
+    print(f"{'턴':>3} {'방식':<8} {'상담 기록 tok':>12} {'처방전 입력 tok':>14} {'반영 비율':>8} {'준비(ms)':>9}")
+    for turns in (int(n) for n in args.turns.split(",")):
+        metrics.reset()
+        backend = StubBackend(StubProfile(latency="fixed", ttft_ms=300, output_tokens=250, seed=1,
+                                          time_scale=args.time_scale))
+        memory, digest = ConversationMemory(), ConsultationDigest()
+        messages = converse(backend, builder, store_info, turns, memory, digest)
+        memory.wait()
+        for mode in ("log", "history", "digest"):
+            started = time.perf_counter()
+            if mode == "log":
+                consultation = consultation_log(messages)
+            elif mode == "history":
+                consultation = memory.history(messages)
+            else:
+                consultation = digest.context(messages, backend)
+            ready_ms = (time.perf_counter() - started) * 1000
+            prompt = builder.prescription(store_info, "초기 진단 결과", consultation, issued="2026년 10월 18일")
+            row = results[f"{turns}/{mode}"] = {
+                "consultation_tokens": estimate_tokens(consultation),
+                "prompt_tokens": estimate_tokens(prompt.text),
+                "reflected": reflected(mode, messages),
+                "ready_ms": ready_ms,
+            }
+            print(f"{turns:>3} {mode:<8} {row['consultation_tokens']:>12} {row['prompt_tokens']:>14} "
+                  f"{row['reflected']:>8.0%} {row['ready_ms']:>9.1f}")
+        updates = metrics.summary("consultation_digest_seconds")
+        results[f"{turns}/digest"]["background_updates"] = updates["count"]
+        print(f"    노트 갱신 {updates['count']}회 (백그라운드, 평균 {updates.get('mean', 0) / args.time_scale:.2f}초 환산)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
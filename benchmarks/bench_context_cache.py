@@ -0,0 +1,124 @@
+"""컨텍스트 캐시 효과: 요청당 전송 입력 토큰 / 첫 토큰까지 지연
+
+사용법:
+    python benchmarks/bench_context_cache.py [--repeat 5] [--input-tps 2000] [--time-scale 0.1] [--json out.json]
+
+사전 질문 5개 x 단계 3개(초기 진단/상담/처방전)를 세 가지 방식으로 호출한다.
+  excerpt: 요청별 보고서 발췌 (캐시 없음, 기본 동작)
+  full:    압축한 보고서 전체를 매번 전송
+  cached:  압축한 보고서 전체를 고정 앞부분으로 캐시 등록, 뒷부분만 전송
+기본은 스텁 백엔드이고, LLM_BACKEND=gemini 와 GEMINI_API_KEY 가 있으면 실제 API 로 측정한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from context_cache import ContextCacheManager  # noqa: E402
+from llm_backend import StubBackend, StubProfile, create_backend  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+STAGES = ("diagnosis", "chat", "prescription")
+
+
+def prompts_for(builder, question, info):
+    store_info = dict(info, store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                      customer_demographics="여성 30대", question_type=question)
+    history = "최근 대화:\n점주: 쿠폰은 언제 주나요?\n전문의: 두 번째 방문 직후가 좋습니다."
+    return {
+        "diagnosis": builder.diagnosis(store_info),
+        "chat": builder.chat(store_info, "초기 진단 결과", "주말 매출을 올리려면?", history=history),
+        "prescription": builder.prescription(store_info, "초기 진단 결과", history, issued="2025년 01월 01일"),
+    }
+
+
+def call(backend, text, cached_context=None):
+    """(첫 토큰까지 초, 전송 입력 토큰, 캐시 토큰)"""
+    started = time.perf_counter()
+    stream = backend.stream(text, cached_context=cached_context, max_output_tokens=64)
+    ttft = None
+    for _ in stream:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    cached = stream.cached_tokens or 0
+    return ttft, (stream.prompt_tokens or 0) - cached, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--input-tps", type=float, default=2000, help="스텁 입력 처리 속도 (토큰/초)")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="스텁 대기시간 배율")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    backend = None
+    if os.environ.get("LLM_BACKEND", "stub") == "gemini":
+        backend = create_backend(os.environ.get)
+    if backend is None:
+        backend = StubBackend(StubProfile(latency="fixed", ttft_ms=300, input_tokens_per_second=args.input_tps,
+                                          time_scale=args.time_scale))
+    print(f"백엔드: {backend.name} ({backend.model_name})")
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        html = f.read()
+    excerpt_builder = PromptBuilder(html)
+    full_builder = PromptBuilder(html, full_reference=True)
+    manager = ContextCacheManager(backend)
+
+    samples = {(mode, stage): {"ttft": [], "sent": [], "cached": []}
+               for mode in ("excerpt", "full", "cached") for stage in STAGES}
+    for _ in range(args.repeat):
+        for question, info in PRESET_STORE_INFO.items():
+            excerpt = prompts_for(excerpt_builder, question, info)
+            full = prompts_for(full_builder, question, info)
+            for stage in STAGES:
+                runs = {
+                    "excerpt": lambda: call(backend, excerpt[stage].text),
+                    "full": lambda: call(backend, full[stage].text),
+                    "cached": lambda: call(backend, full[stage].dynamic_tail,
+                                           manager.get(stage, full[stage].static_prefix, "bench")),
+                }
+                for mode, run in runs.items():
+                    ttft, sent, cached = run()
+                    bucket = samples[(mode, stage)]
+                    bucket["ttft"].append(ttft)
+                    bucket["sent"].append(sent)
+                    bucket["cached"].append(cached)
+    manager.invalidate()
+
+    rows = []
+    print(f"\n{'단계':<13}{'방식':<9}{'전송 tok':>9}{'캐시 tok':>9}{'TTFT p50 ms':>13}")
+    for stage in STAGES:
+        for mode in ("excerpt", "full", "cached"):
+            bucket = samples[(mode, stage)]
+            row = {
+                "stage": stage,
+                "mode": mode,
+                "sent_tokens": statistics.fmean(bucket["sent"]),
+                "cached_tokens": statistics.fmean(bucket["cached"]),
+                "ttft_p50_ms": statistics.median(bucket["ttft"]) * 1000,
+            }
+            rows.append(row)
+            print(f"{stage:<13}{mode:<9}{row['sent_tokens']:>9.0f}{row['cached_tokens']:>9.0f}{row['ttft_p50_ms']:>13.1f}")
+
+    by_key = {(r["stage"], r["mode"]): r for r in rows}
+    print()
+    for stage in STAGES:
+        full, cached = by_key[(stage, "full")], by_key[(stage, "cached")]
+        print(f"{stage}: 요청당 전송 입력 {full['sent_tokens'] - cached['sent_tokens']:.0f} 토큰 절약, "
+              f"TTFT {full['ttft_p50_ms'] - cached['ttft_p50_ms']:.1f}ms 단축 (full 대비)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "backend": backend.model_name, "rows": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
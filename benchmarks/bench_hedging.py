@@ -0,0 +1,85 @@
+"""꼬리가 긴 지연에서 헤징 전/후 첫 토큰 p50/p99 와 추가 호출 비용
+
+사용법:
+    python benchmarks/bench_hedging.py [--requests 1000] [--concurrency 8] [--max-rates 0.05,0.1]
+                                       [--time-scale 0.01] [--json out.json]
+
+스텁 백엔드의 pareto 지연(중앙값 --ttft-ms, alpha --alpha)으로 초기 진단 스트림을 보내고
+헤징 없음 / hedging.HedgingBackend(p90 대기 기준, 헤지 비율 상한 --max-rates) 의
+첫 토큰 p50/p90/p99 와 요청당 실제 호출 수(추가 호출 비용)를 비교한다.
+처음 min_samples 건은 기준이 없어 헤지 없이 나가므로 결과에 포함해도 차이는 작다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from hedging import HedgingBackend  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run(backend, requests, concurrency, time_scale):
+    def one(n):
+        started = time.perf_counter()
+        stream = backend.stream(f"가맹점 {n} 초기 진단")
+        ttft = None
+        for _ in stream:
+            if ttft is None:
+                ttft = time.perf_counter() - started
+        return ttft / time_scale
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sorted(pool.map(one, range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft-ms", type=float, default=800)
+    parser.add_argument("--alpha", type=float, default=1.3, help="pareto 꼬리 두께 (작을수록 두꺼움)")
+    parser.add_argument("--max-rates", default="0.05,0.1")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    profile = StubProfile(latency="pareto", ttft_ms=args.ttft_ms, jitter=args.alpha, output_tokens=20,
+                          tokens_per_second=400, time_scale=args.time_scale, seed=11)
+    results = {}
+    print(f"{'방식':<16} {'p50(초)':>8} {'p90(초)':>8} {'p99(초)':>8} {'평균(초)':>8} {'호출/요청':>9} {'헤지 승':>7}")
+    cases = [("헤징 없음", None)] + [(f"헤징 상한 {float(rate):.0%}", float(rate)) for rate in args.max_rates.split(",")]
+    for label, max_rate in cases:
+        metrics.reset()
+        stub = StubBackend(profile)
+        backend = stub if max_rate is None else HedgingBackend(stub, max_rate=max_rate)
+        ttfts = run(backend, args.requests, args.concurrency, args.time_scale)
+        results[label] = {
+            "p50_s": percentile(ttfts, 50),
+            "p90_s": percentile(ttfts, 90),
+            "p99_s": percentile(ttfts, 99),
+            "mean_s": statistics.fmean(ttfts),
+            "calls_per_request": stub.calls / args.requests,
+            "hedge_won": metrics.total("llm_hedge_total", outcome="hedge_won"),
+        }
+        row = results[label]
+        print(f"{label:<16} {row['p50_s']:>8.2f} {row['p90_s']:>8.2f} {row['p99_s']:>8.2f} {row['mean_s']:>8.2f} "
+              f"{row['calls_per_request']:>9.3f} {row['hedge_won']:>7.0f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
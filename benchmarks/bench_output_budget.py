@@ -0,0 +1,120 @@
+"""단계별 출력 토큰 / 지연시간: 자유 형식 + 상한 없음(before) vs JSON 진단 + 단계별 상한(after)
+
+사용법:
+    python benchmarks/bench_output_budget.py [--repeat 2] [--free-tokens 700] [--time-scale 0.05] [--json out.json]
+
+사전 질문 5개로 초기 진단 → 상담 1회 → 처방전을 차례로 호출한다.
+- before: 생성 옵션 없음, 이후 프롬프트에 진단 원문 전체를 넣음
+- after: prompts.generation_options (단계별 max_output_tokens, 진단은 JSON 스키마), 이후 프롬프트에 한 줄 요약
+단계별 출력 토큰 / 입력 토큰 / 첫 토큰·전체 시간 중앙값과, 이후 프롬프트에 들어간 진단 토큰 수를 비교한다.
+기본은 스텁 백엔드이며 상한 없는 응답 길이는 --free-tokens 로 흉내 낸다.
+LLM_BACKEND=gemini 와 GEMINI_API_KEY 가 있으면 실제 API 로 측정한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from diagnosis import result_fields, context  # noqa: E402
+from doc_retrieval import estimate_tokens  # noqa: E402
+from llm_backend import StubBackend, StubProfile, create_backend  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO, generation_options  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+STAGES = ("diagnosis", "chat", "prescription")
+QUESTION = "재방문 쿠폰은 언제 주는 게 좋을까요?"
+
+
+def call(backend, prompt, stage, budgeted):
+    options = generation_options(stage) if budgeted else {}
+    started = time.perf_counter()
+    stream = backend.stream(prompt.text, **options)
+    ttft = None
+    for _ in stream:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    output = stream.output_tokens if stream.output_tokens is not None else estimate_tokens(stream.text)
+    prompt_tokens = stream.prompt_tokens if stream.prompt_tokens is not None else estimate_tokens(prompt.text)
+    return stream.text, {"ttft_s": ttft or 0.0, "total_s": time.perf_counter() - started,
+                         "output_tokens": output, "input_tokens": prompt_tokens}
+
+
+def run(backend, builder, store_info, budgeted):
+    rows = {}
+    text, rows["diagnosis"] = call(backend, builder.diagnosis(store_info), "diagnosis", budgeted)
+    if budgeted:
+        fields = result_fields(text)
+        diagnosis, parsed = context(fields), fields is not None
+    else:
+        diagnosis, parsed = text, None
+    _, rows["chat"] = call(backend, builder.chat(store_info, diagnosis, QUESTION), "chat", budgeted)
+    _, rows["prescription"] = call(
+        backend, builder.prescription(store_info, diagnosis, "", issued="2025년 01월 01일"), "prescription", budgeted
+    )
+    return rows, estimate_tokens(diagnosis), parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--free-tokens", type=int, default=700, help="스텁: 상한 없을 때 응답 토큰 수")
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    backend = None
+    if os.environ.get("LLM_BACKEND", "stub") == "gemini":
+        backend = create_backend(os.environ.get)
+    if backend is None:
+        backend = StubBackend(StubProfile(ttft_ms=600, tokens_per_second=60, output_tokens=args.free_tokens,
+                                          seed=3, time_scale=args.time_scale))
+    print(f"백엔드: {backend.name} ({backend.model_name})")
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        builder = PromptBuilder(f.read())
+
+    results = {}
+    for label, budgeted in (("before", False), ("after", True)):
+        samples = {stage: [] for stage in STAGES}
+        injected, parsed = [], []
+        for _ in range(args.repeat):
+            for question, info in PRESET_STORE_INFO.items():
+                store_info = dict(info, store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                                  customer_demographics="여성 30대", question_type=question)
+                rows, diagnosis_tokens, ok = run(backend, builder, store_info, budgeted)
+                for stage in STAGES:
+                    samples[stage].append(rows[stage])
+                injected.append(diagnosis_tokens)
+                if ok is not None:
+                    parsed.append(ok)
+        results[label] = {
+            stage: {key: statistics.median(row[key] for row in rows) for key in rows[0]}
+            for stage, rows in samples.items()
+        }
+        results[label]["diagnosis_context_tokens"] = statistics.median(injected)
+        if parsed:
+            results[label]["diagnosis_parse_rate"] = sum(parsed) / len(parsed)
+
+    print(f"{'단계':<14} {'':>6} {'출력 토큰':>9} {'입력 토큰':>9} {'첫 토큰(s)':>10} {'전체(s)':>8}")
+    for stage in STAGES:
+        for label in ("before", "after"):
+            row = results[label][stage]
+            print(f"{stage:<14} {label:>6} {row['output_tokens']:>9.0f} {row['input_tokens']:>9.0f} "
+                  f"{row['ttft_s']:>10.2f} {row['total_s']:>8.2f}")
+    print(f"이후 프롬프트의 진단 토큰: before {results['before']['diagnosis_context_tokens']:.0f} → "
+          f"after {results['after']['diagnosis_context_tokens']:.0f}"
+          + (f" · JSON 파싱 성공률 {results['after']['diagnosis_parse_rate']:.0%}"
+             if "diagnosis_parse_rate" in results["after"] else ""))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""처방전 생성: 한 번에 작성(single) vs 섹션별 동시 작성(parallel) 벽시계 시간
+
+사용법:
+    python benchmarks/bench_prescription.py [--repeat 5] [--output-tokens 800] [--time-scale 0.1] [--json out.json]
+
+기본은 스텁 백엔드이고 처방전 전체 길이를 --output-tokens, 섹션은 그 1/4 로 둔다.
+LLM_BACKEND=gemini 와 GEMINI_API_KEY 가 있으면 실제 API 로 (길이 제한 없이) 측정한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_backend import StubBackend, StubProfile, create_backend  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO, PRESCRIPTION_SECTIONS  # noqa: E402
+from sectioned import SectionedGeneration  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+
+def single(backend, prompt, max_tokens):
+    started = time.perf_counter()
+    stream = backend.stream(prompt.text, max_output_tokens=max_tokens)
+    ttft = None
+    for _ in stream:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    return ttft, time.perf_counter() - started
+
+
+def parallel(backend, sections, max_tokens):
+    generation = SectionedGeneration([
+        (name, title, lambda prompt=prompt: backend.stream(prompt.text, max_output_tokens=max_tokens))
+        for name, title, prompt in sections
+    ]).start().wait()
+    generation.raise_for_error()
+    return generation.first_token, generation.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output-tokens", type=int, default=800)
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    backend, single_cap, section_cap = None, args.output_tokens, args.output_tokens // len(PRESCRIPTION_SECTIONS)
+    if os.environ.get("LLM_BACKEND", "stub") == "gemini":
+        backend = create_backend(os.environ.get)
+        single_cap = section_cap = None
+    if backend is None:
+        backend = StubBackend(StubProfile(ttft_ms=600, tokens_per_second=60, output_tokens=args.output_tokens,
+                                          seed=3, time_scale=args.time_scale))
+    print(f"백엔드: {backend.name} ({backend.model_name})")
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        builder = PromptBuilder(f.read())
+    history = "최근 대화:\n점주: 쿠폰은 언제 주나요?\n전문의: 두 번째 방문 직후가 좋습니다."
+
+    rows = []
+    for _ in range(args.repeat):
+        for question, info in PRESET_STORE_INFO.items():
+            store_info = dict(info, store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                              customer_demographics="여성 30대", question_type=question)
+            full = builder.prescription(store_info, "초기 진단 결과", history, issued="2025년 01월 01일")
+            sections = builder.prescription_sections(store_info, "초기 진단 결과", history, issued="2025년 01월 01일")
+            s_ttft, s_total = single(backend, full, single_cap)
+            p_ttft, p_total = parallel(backend, sections, section_cap)
+            rows.append({"question": question, "single_ttft_s": s_ttft, "single_total_s": s_total,
+                         "parallel_ttft_s": p_ttft, "parallel_total_s": p_total})
+
+    def med(key):
+        return statistics.median(r[key] for r in rows)
+
+    print(f"{'방식':<9}{'TTFT p50':>10}{'전체 p50':>10}")
+    print(f"{'single':<9}{med('single_ttft_s'):>9.2f}s{med('single_total_s'):>9.2f}s")
+    print(f"{'parallel':<9}{med('parallel_ttft_s'):>9.2f}s{med('parallel_total_s'):>9.2f}s")
+    print(f"전체 시간 {med('single_total_s') / med('parallel_total_s'):.1f}배 단축 ({len(rows)}회)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "backend": backend.model_name, "rows": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""단계별 프롬프트 부분 토큰 수 / 조립 시간
+
+사용법:
+    python benchmarks/bench_prompts.py [--budget 1500] [--turns 4] [--repeat 200] [--json out.json]
+
+사전 질문 5개로 초기 진단 / 상담 / 처방전 프롬프트를 만들어 부분(system, instructions,
+reference, data, request)별 추정 토큰 수와 조립 시간을 출력한다 (data: 조건에 맞는 상관 데이터 행). 원본 HTML 과 압축본 크기도 함께 비교한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doc_retrieval import DEFAULT_TOKEN_BUDGET, estimate_tokens  # noqa: E402
+from correlations import CorrelationStore  # noqa: E402
+from prompts import PromptBuilder, PRESET_STORE_INFO  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+PARTS = ("system", "instructions", "reference", "data", "request")
+
+# 상담 단계 샘플 질문
+QUESTIONS = [
+    "인스타그램 광고는 어떤 고객층에 효과적인가요?",
+    "재방문 쿠폰은 얼마나 자주 발행해야 하나요?",
+    "주말 매출을 올리려면 어떻게 해야 하나요?",
+    "경쟁 매장과 차별화하려면 무엇부터 해야 하나요?",
+]
+
+
+def sample_store(question, info):
+    return dict(info, store_name="샘플 매장", region="서울 성동구", location="성수동1가",
+                customer_demographics="여성 20대 이하, 여성 30대", question_type=question)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return result, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--turns", type=int, default=4, help="처방전 프롬프트에 넣을 상담 턴 수")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        html = f.read()
+
+    started = time.perf_counter()
+    builder = PromptBuilder(html, token_budget=args.budget, correlations=CorrelationStore())
+    compact = builder.compact_reference
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"문서: 원본 {len(html)}자 / {estimate_tokens(html)} 토큰(추정) → "
+          f"압축본 {len(compact)}자 / {estimate_tokens(compact)} 토큰, 빌더 생성 {build_ms:.1f}ms")
+
+    rows = []
+    for question, info in PRESET_STORE_INFO.items():
+        store_info = sample_store(question, info)
+        diagnosis, diagnosis_us = timed(lambda: builder.diagnosis(store_info), args.repeat)
+        diagnosis_text = "초기 진단 " * 60
+        chat, chat_us = timed(lambda: builder.chat(store_info, diagnosis_text, QUESTIONS[0]), args.repeat)
+        messages = []
+        for i in range(args.turns):
+            messages.append({"role": "user", "content": QUESTIONS[i % len(QUESTIONS)]})
+            messages.append({"role": "assistant", "content": "답변 " * 100})
+        prescription, prescription_us = timed(
+            lambda: builder.prescription(store_info, diagnosis_text, messages, issued="2025년 01월 01일"), args.repeat)
+        for stage, prompt, render_us in (("diagnosis", diagnosis, diagnosis_us), ("chat", chat, chat_us),
+                                         ("prescription", prescription, prescription_us)):
+            counts = prompt.token_counts()
+            rows.append({
+                "question": question,
+                "stage": stage,
+                **{part: counts.get(part, 0) for part in PARTS},
+                "total": estimate_tokens(prompt.text),
+                "static_prefix": estimate_tokens(prompt.static_prefix),
+                "render_us": round(render_us, 1),
+            })
+
+    print(f"\n{'Q':>2} {'단계':<13}" + "".join(f"{part:>13}" for part in PARTS)
+          + f"{'합계':>8}{'고정 앞부분':>10}{'조립 µs':>9}")
+    for row in rows:
+        print(f"{row['question']:>2} {row['stage']:<13}" + "".join(f"{row[part]:>13}" for part in PARTS)
+              + f"{row['total']:>8}{row['static_prefix']:>12}{row['render_us']:>10.1f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "budget": args.budget,
+                "html_tokens_est": estimate_tokens(html),
+                "compact_tokens_est": estimate_tokens(compact),
+                "build_ms": build_ms,
+                "rows": rows,
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""상담 유사 질문 캐시 적중률 / 오적중률 / 조회 시간 (threshold 별)
+
+사용법:
+    python benchmarks/bench_question_cache.py [--thresholds 0.6,0.7,0.75,0.8,0.9] [--entries 200] [--json out.json]
+
+의도가 같은 질문 묶음(바꿔 말하기)을 준비해 묶음마다 첫 질문만 캐시에 넣고 나머지로 조회한다.
+- 적중률: 같은 묶음의 바꿔 말한 질문이 저장된 답변을 찾은 비율
+- 오적중률: 다른 묶음의 답변이 돌아온 비율 (낮을수록 좋음)
+- 반대 오적중률: 한 단어만 바꿔 뜻이 반대인 질문(OPPOSITES)이 저장된 답변을 받은 비율 (0 이어야 함)
+- 조회 시간: 세그먼트에 --entries 개를 채운 상태에서 lookup 1회 중앙값 (µs)
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from question_cache import QuestionCache, segment_key  # noqa: E402
+from prompts import PRESET_STORE_INFO  # noqa: E402
+
+# 의도가 같은 질문 묶음 (첫 질문을 저장, 나머지로 조회)
+GROUPS = [
+    ["단골 늘리는 방법?", "단골을 늘리는 방법이 있을까요?", "단골 손님 늘리는 방법 알려주세요", "단골을 늘리려면 어떻게 하나요?"],
+    ["SNS 마케팅 추천?", "SNS 마케팅 추천해주세요", "sns 마케팅 뭐가 좋을까요?", "SNS 마케팅은 어떤 걸 추천하나요"],
+    ["인스타그램 광고 효과 있나요?", "인스타그램 광고가 효과가 있을까요?", "인스타 광고 효과 있어요?"],
+    ["재방문 쿠폰은 얼마나 자주 발행해야 하나요?", "재방문 쿠폰 발행 주기는?", "재방문 쿠폰을 얼마나 자주 주면 되나요"],
+    ["주말 매출을 올리려면?", "주말 매출 올리는 방법", "주말에 매출을 올리려면 어떻게 해야 하나요?"],
+    ["배달 매출 늘리는 방법?", "배달 매출을 늘리려면?", "배달 주문 매출 늘리는 방법 알려주세요"],
+    ["경쟁 매장과 차별화하려면?", "경쟁 매장이랑 차별화하는 방법", "경쟁 매장과 어떻게 차별화하나요?"],
+    ["객단가 올리는 방법?", "객단가를 올리려면 어떻게 하나요", "객단가 높이는 방법 있을까요?"],
+    ["점심 시간 손님 늘리기", "점심 시간에 손님을 늘리려면?", "점심 손님 늘리는 방법"],
+    ["리뷰 이벤트 효과 있나요?", "리뷰 이벤트가 효과 있을까요?", "리뷰 이벤트 해볼까요? 효과 있나요"],
+]
+
+# 한 단어만 달라 뜻이 반대인 질문 쌍 (앞 질문을 저장, 뒤 질문으로 조회 → 적중하면 안 됨)
+OPPOSITES = [
+    ("인스타그램 광고 예산은 얼마가 적당한가요?", "인스타그램 광고 예산은 얼마가 과한가요?"),
+    ("재방문 쿠폰을 늘려야 할까요?", "재방문 쿠폰을 줄여야 할까요?"),
+    ("주말 영업시간을 늘리는 게 좋을까요?", "주말 영업시간을 줄이는 게 좋을까요?"),
+    ("배달 수수료가 높은 편인가요?", "배달 수수료가 낮은 편인가요?"),
+]
+
+# 채우기용 다른 질문 (조회 시간 측정 시 세그먼트 크기를 늘림)
+FILLER = "{i}번째 메뉴 가격 조정 효과와 {j}월 프로모션 일정 문의"
+
+
+def run(threshold, segment):
+    cache = QuestionCache(threshold=threshold, ttl=0)
+    for index, group in enumerate(GROUPS):
+        cache.put(segment, group[0], f"answer-{index}")
+    hits = false_hits = total = 0
+    scores = []
+    for index, group in enumerate(GROUPS):
+        for question in group[1:]:
+            total += 1
+            match = cache.lookup(segment, question)
+            if match is None:
+                continue
+            scores.append(match.score)
+            if match.answer == f"answer-{index}":
+                hits += 1
+            else:
+                false_hits += 1
+    opposite_hits = 0
+    for index, (stored, query) in enumerate(OPPOSITES):
+        cache.put(segment, stored, f"opposite-{index}")
+        match = cache.lookup(segment, query)
+        if match is not None:
+            opposite_hits += 1
+    return {
+        "threshold": threshold,
+        "queries": total,
+        "hit_rate": hits / total,
+        "false_hit_rate": false_hits / total,
+        "opposite_hit_rate": opposite_hits / len(OPPOSITES),
+        "min_score": min(scores) if scores else None,
+    }
+
+
+def lookup_us(threshold, segment, entries, repeat):
+    cache = QuestionCache(threshold=threshold, max_per_segment=entries + len(GROUPS), ttl=0)
+    for i in range(entries):
+        cache.put(segment, FILLER.format(i=i, j=i % 12 + 1), f"filler-{i}")
+    for index, group in enumerate(GROUPS):
+        cache.put(segment, group[0], f"answer-{index}")
+    queries = [question for group in GROUPS for question in group[1:]]
+    samples = []
+    for n in range(repeat):
+        started = time.perf_counter()
+        cache.lookup(segment, queries[n % len(queries)])
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--thresholds", default="0.6,0.7,0.75,0.8,0.9")
+    parser.add_argument("--entries", type=int, default=200, help="조회 시간 측정 시 세그먼트 항목 수")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    segment = segment_key("bench", "v1", dict(PRESET_STORE_INFO[2], question_type=2))
+    results = []
+    print(f"{'threshold':>9} {'적중률':>7} {'오적중률':>8} {'반대 오적중률':>10} {'최저 유사도':>10} {'조회 µs':>8}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        result = run(threshold, segment)
+        result["lookup_us_p50"] = lookup_us(threshold, segment, args.entries, args.repeat)
+        results.append(result)
+        min_score = f"{result['min_score']:.2f}" if result["min_score"] is not None else "-"
+        print(f"{threshold:>9.2f} {result['hit_rate']:>8.0%} {result['false_hit_rate']:>9.0%} "
+              f"{result['opposite_hit_rate']:>12.0%} {min_score:>11} {result['lookup_us_p50']:>9.0f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": args.entries, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""상호작용별 rerun 비용: 스크립트 전체 vs 프래그먼트 / 폼 범위
+
+사용법:
+    python benchmarks/bench_reruns.py [--repeat 3] [--questions 3] [--app app.py] [--json out.json]
+
+스텁 백엔드(대기 없음)로 접수 입력(지역, 위치, 고객층 체크박스 10개, 가맹점명) → 제출 → 상담 질문 순서로
+AppTest 로 조작한다. AppTest 는 상호작용마다 스크립트 전체를 실행하므로
+- 전체: 스크립트 한 번 실행 시간 (기존에는 모든 상호작용이 이 비용)
+- 범위: 실제 서버에서 그 상호작용이 다시 실행하는 부분의 시간
+  (폼 안의 위젯은 제출 전까지 0, 프래그먼트 안의 위젯은 fragment_rerun_seconds{fragment})
+를 함께 기록한다. 변경 전 코드와 비교하려면 --app 으로 이전 app.py 사본(저장소 루트에 두어야 import 가 됨)을 준다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+
+CHECKBOXES = ["여성 20대 이하", "여성 30대", "여성 40대", "여성 50대", "여성 60대 이상",
+              "남성 20대 이하", "남성 30대", "남성 40대", "남성 50대", "남성 60대 이상"]
+QUESTIONS = ["단골 늘리는 방법?", "SNS 마케팅 추천해주세요", "객단가를 올리려면 어떻게 하나요?", "리뷰를 늘리는 방법은?"]
+
+
+def fragment_samples():
+    """{fragment_rerun_seconds 키: 지금까지 기록된 샘플}"""
+    samples = metrics.snapshot()["samples"]
+    return {key: list(values) for key, values in samples.items() if key.startswith("fragment_rerun_seconds")}
+
+
+def interact(rows, name, at, action, widget=None, fragment=None):
+    """위젯 하나 조작 → (전체 실행 시간, 실제 서버에서 다시 실행되는 범위의 시간) 기록
+
+    fragment: 그 위젯이 들어 있을 프래그먼트 이름 — 앱에 그 프래그먼트가 있을 때만(실행 시간이 기록됐을 때) 적용
+    """
+    in_form = bool(getattr(widget, "form_id", "")) if widget is not None else False
+    key = f'fragment_rerun_seconds{{fragment="{fragment}"}}'
+    before = len(fragment_samples().get(key, []))
+    started = time.perf_counter()
+    action()
+    full = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].message}")
+    samples = fragment_samples().get(key, [])
+    if in_form:
+        scope, scoped = "form", 0.0
+    elif fragment is not None and len(samples) > before:
+        scope, scoped = fragment, samples[-1]
+    else:
+        scope, scoped = "app", full
+    rows.append({"interaction": name, "scope": scope, "full_s": full, "scoped_s": scoped})
+
+
+def run_once(app_path, questions, rows):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.run()
+    # 사이드바 버튼 / 제출(단계 이동)은 앱 전체 rerun
+    interact(rows, "preset", at, lambda: at.sidebar.button(key="btn_q2").click().run())
+    interact(rows, "region", at, lambda: at.selectbox[0].select("서울 성동구").run(), at.selectbox[0], "intake")
+    interact(rows, "location", at, lambda: at.selectbox[1].select("성수동1가").run(), at.selectbox[1], "intake")
+    for label in CHECKBOXES:
+        box = next(c for c in at.checkbox if c.label == label)
+        interact(rows, "checkbox", at, lambda box=box: box.check().run(), box, "intake")
+    store_name = next(t for t in at.text_input if "가맹점명" in t.label)
+    interact(rows, "store_name", at, lambda: store_name.input("벤치마크점").run(), store_name, "intake")
+    # 제출: 폼이면 입력값을 제출과 같은 실행에 넣어야 반영됨
+    submit = next(b for b in at.button if "진료 접수" in b.label)
+    next(t for t in at.text_input if "가맹점명" in t.label).input("벤치마크점")
+    interact(rows, "submit", at, lambda: submit.click().run())
+    for k in range(questions):
+        question = QUESTIONS[k % len(QUESTIONS)]
+        interact(rows, "chat", at, lambda: at.chat_input[0].set_value(question).run(), fragment="consultation")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--app", default="app.py", help="저장소 루트 기준 경로")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    os.environ.update(LLM_BACKEND="stub", STUB_TIME_SCALE="0", LLM_CACHE="false", SPECULATIVE_DIAGNOSIS="false",
+                      REFERENCE_REFRESH_SECONDS="86400")
+    os.environ.setdefault("SESSION_DB_PATH", os.path.join(ROOT, ".cache", "bench_reruns_sessions.sqlite3"))
+
+    app_path = os.path.join(ROOT, args.app)
+    rows = []
+    run_once(app_path, 1, [])  # 예열 (import, cache_resource)
+    for _ in range(args.repeat):
+        run_once(app_path, args.questions, rows)
+
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row["interaction"]].append(row)
+    print(f"{'상호작용':<12}{'범위':<14}{'전체 p50':>10}{'범위 p50':>10}")
+    summary = {}
+    for name, items in grouped.items():
+        full = statistics.median(r["full_s"] for r in items) * 1000
+        scoped = statistics.median(r["scoped_s"] for r in items) * 1000
+        scope = items[-1]["scope"]
+        summary[name] = {"scope": scope, "full_ms": full, "scoped_ms": scoped, "count": len(items)}
+        print(f"{name:<12}{scope:<14}{full:>8.1f}ms{scoped:>8.1f}ms")
+    intake = [r for r in rows if r["interaction"] in ("region", "location", "checkbox", "store_name")]
+    print(f"접수 입력 {len(intake) // args.repeat}회당 합계: 전체 {sum(r['full_s'] for r in intake) / args.repeat * 1000:.0f}ms → "
+          f"범위 {sum(r['scoped_s'] for r in intake) / args.repeat * 1000:.0f}ms")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary, "rows": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""참고 자료 전체 삽입 vs 섹션 검색 프롬프트 크기/지연시간 비교
+
+사용법:
+    python benchmarks/bench_retrieval.py [--budget 1500] [--repeat 3] [--json out.json]
+
+GEMINI_API_KEY 환경변수가 있거나 LLM_BACKEND=stub 이면 모델 호출로 토큰 수와
+end-to-end 지연시간도 측정한다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doc_retrieval import DEFAULT_TOKEN_BUDGET, estimate_tokens  # noqa: E402
+from llm_backend import create_backend  # noqa: E402
+from prompts import PromptBuilder, DIAGNOSIS_TEMPLATE, PRESET_STORE_INFO  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+def build_prompts(builder, html, store_info):
+    """보고서 전체 삽입(전) / 섹션 검색(후) 초기 진단 프롬프트"""
+    fields = dict(store_info, focus="")
+    before = DIAGNOSIS_TEMPLATE.render(reference=html, **fields).text
+    started = time.perf_counter()
+    after = builder.diagnosis(store_info).text
+    build_ms = (time.perf_counter() - started) * 1000
+    return before, after, build_ms
+
+
+def measure_latency(backend, prompt, repeat):
+    latencies, tokens = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = backend.generate(prompt)
+        latencies.append(time.perf_counter() - started)
+        tokens = response.prompt_tokens
+    return statistics.median(latencies), tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    with open(DOC_PATH, encoding="utf-8") as f:
+        html = f.read()
+
+    started = time.perf_counter()
+    builder = PromptBuilder(html, token_budget=args.budget)
+    index = builder.index
+    index_ms = (time.perf_counter() - started) * 1000
+    print(f"인덱스: 섹션 {len(index)}개, {index.total_tokens} 토큰(추정), 파싱 {index_ms:.1f}ms")
+
+    model = create_backend(os.environ.get)
+
+    rows = []
+    for question, info in PRESET_STORE_INFO.items():
+        store_info = dict(info, question_type=question, customer_demographics="미선택")
+        before, after, build_ms = build_prompts(builder, html, store_info)
+        row = {
+            "question": question,
+            "before_chars": len(before),
+            "after_chars": len(after),
+            "before_tokens_est": estimate_tokens(before),
+            "after_tokens_est": estimate_tokens(after),
+            "retrieval_ms": round(build_ms, 3),
+        }
+        if model is not None:
+            row["before_latency_s"], row["before_tokens"] = measure_latency(model, before, args.repeat)
+            row["after_latency_s"], row["after_tokens"] = measure_latency(model, after, args.repeat)
+        rows.append(row)
+
+    print(f"\n{'Q':>2} {'전 chars':>9} {'후 chars':>9} {'전 tok':>7} {'후 tok':>7} {'검색 ms':>8}"
+          + (f" {'전 지연 s':>9} {'후 지연 s':>9}" if model else ""))
+    for row in rows:
+        line = (f"{row['question']:>2} {row['before_chars']:>9} {row['after_chars']:>9} "
+                f"{row['before_tokens_est']:>7} {row['after_tokens_est']:>7} {row['retrieval_ms']:>8.2f}")
+        if model:
+            line += f" {row['before_latency_s']:>9.2f} {row['after_latency_s']:>9.2f}"
+        print(line)
+    if model is None:
+        print("\n(GEMINI_API_KEY 미설정, LLM_BACKEND=stub 아님: 지연시간 측정 생략)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"budget": args.budget, "index_ms": index_ms, "rows": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""모델 라우팅: 기본 모델이 느려지거나 오류가 늘 때 빠른 등급으로 대체되는 비율과 첫 토큰 p95
+
+사용법:
+    python benchmarks/bench_routing.py [--requests 200] [--time-scale 0.01] [--json out.json]
+
+스텁 백엔드에 모델별 지연 분포를 주고 (quality: 보통 0.8초, fast: 0.3초)
+정상 → 기본 모델 악화 (꼬리가 긴 6초 + 500 오류 15%) → 회복 세 구간을 차례로 보낸다.
+라우팅 없이 항상 기본 모델을 쓴 경우와 model_router.ModelRouter 를 쓴 경우의
+구간별 첫 토큰 p50/p95, 오류율, 대체 비율을 비교한다.
+요청 간격은 가상 시계로 1초씩 흐르게 해 판단 기간(window) / 강등 시간(cooldown)을 요청 수로 맞춘다.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from dataclasses import replace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+from llm_backend import BackendError, StubBackend, StubProfile  # noqa: E402
+from model_router import ModelRouter, Route  # noqa: E402
+
+QUALITY, FAST = "stub:quality", "stub:fast"
+SLO_P95 = 4.0
+PHASES = (
+    ("정상", StubProfile(latency="lognormal", ttft_ms=800, jitter=0.3)),
+    ("악화", StubProfile(latency="pareto", ttft_ms=6000, jitter=1.5, error_500=0.15)),
+    ("회복", StubProfile(latency="lognormal", ttft_ms=800, jitter=0.3)),
+)
+FAST_PROFILE = StubProfile(latency="lognormal", ttft_ms=300, jitter=0.3)
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def first_token(backend, decision, time_scale):
+    """첫 토큰까지 시간(가상 초) 또는 오류면 None"""
+    started = time.perf_counter()
+    try:
+        stream = backend.stream("재방문 쿠폰은 언제 주는 게 좋을까요?", route=decision) if decision is not None \
+            else backend.stream("재방문 쿠폰은 언제 주는 게 좋을까요?", model=QUALITY)
+        for _ in stream:
+            break
+        stream.close()
+    except BackendError:
+        return None
+    return (time.perf_counter() - started) / time_scale
+
+
+def run(routed, requests, time_scale, seed):
+    stub = StubBackend(StubProfile(time_scale=time_scale, output_tokens=5, seed=seed), model_name=QUALITY,
+                       model_profiles={"fast": FAST_PROFILE})
+    clock = VirtualClock()
+    # SLO 는 실제 측정 시간 기준이므로 time_scale 을 곱함
+    router = ModelRouter(stub, {"quality": QUALITY, "fast": FAST},
+                         routes=[Route("chat", "quality", slo_p95=SLO_P95 * time_scale)],
+                         window=60.0, min_samples=10, cooldown=60.0, clock=clock)
+    results = {}
+    for phase, profile in PHASES:
+        stub.model_profiles["quality"] = replace(profile, time_scale=time_scale)
+        latencies, errors, fallbacks = [], 0, 0
+        for _ in range(requests):
+            clock.now += 1.0
+            decision = router.route("chat", 20) if routed else None
+            if decision is not None and decision.model != QUALITY:
+                fallbacks += 1
+            seconds = first_token(router, decision, time_scale)
+            if seconds is None:
+                errors += 1
+            else:
+                latencies.append(seconds)
+        latencies.sort()
+        results[phase] = {
+            "p50_s": statistics.median(latencies),
+            "p95_s": latencies[int(0.95 * (len(latencies) - 1))],
+            "error_rate": errors / requests,
+            "fallback_share": fallbacks / requests,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="구간별 요청 수")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    results = {}
+    for label, routed in (("고정 모델", False), ("라우팅", True)):
+        metrics.reset()
+        results[label] = run(routed, args.requests, args.time_scale, args.seed)
+        results[label]["demotions"] = metrics.total("llm_route_demotions_total")
+
+    print(f"SLO: 첫 토큰 p95 {SLO_P95:.1f}초 · 오류율 20% (기본 모델 → 빠른 모델)")
+    print(f"{'':<10} {'구간':<4} {'p50(초)':>8} {'p95(초)':>8} {'오류율':>7} {'대체 비율':>9}")
+    for label in results:
+        for phase, _ in PHASES:
+            row = results[label][phase]
+            print(f"{label:<10} {phase:<4} {row['p50_s']:>8.2f} {row['p95_s']:>8.2f} "
+                  f"{row['error_rate']:>7.0%} {row['fallback_share']:>9.0%}")
+    print(f"라우팅 강등 {results['라우팅']['demotions']:.0f}회")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
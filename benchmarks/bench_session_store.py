@@ -0,0 +1,145 @@
+"""세션당 메모리: st.session_state 에 전부 보관(before) vs 세션 저장소(after)
+
+사용법:
+    python benchmarks/bench_session_store.py [--sessions 500] [--turns 10] [--max-sessions 50] [--window 40] [--json out.json]
+
+세션마다 접수 정보, 초기 진단, 상담 --turns 턴, 처방전을 만든다.
+before 는 모든 세션의 데이터를 dict 로 들고 있는 기존 방식, after 는 세션 저장소(SQLite)에 쓰고
+브라우저 세션에는 토큰만 남기는 방식이다. 파이썬 힙은 tracemalloc 으로 재고
+(SQLite 페이지 캐시는 C 메모리라 RSS 증가분으로 따로 표시), 메모리에서 내려간 세션을 다시 여는 시간도 잰다.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from prompts import PRESET_STORE_INFO  # noqa: E402
+from session_store import SessionStore  # noqa: E402
+
+# 실제 응답과 비슷한 길이의 한글 텍스트
+ANSWER = "재방문 고객 비중이 높은 상권에서는 두 번째 방문 직후 쿠폰을 주는 것이 효과적입니다. " * 8
+DIAGNOSIS = "## 🔬 초기 검사 결과\n" + "동일 업종 매출 순위와 재방문율의 상관계수가 높게 나타났습니다. " * 6
+PRESCRIPTION = "## 💊 처방 내역\n" + "1순위 처방: 스탬프 적립과 재방문 쿠폰을 결합한 단골 프로그램을 운영하세요. " * 20
+
+
+def fake_session(i, turns):
+    """세션 하나 분량의 데이터 (store_info, messages, diagnosis_result)"""
+    store_info = dict(PRESET_STORE_INFO[1 + i % 5], store_name=f"매장 {i}", region="서울 성동구", location="성수동1가")
+    messages = [{"role": "assistant", "content": f"안녕하세요, **매장 {i}** 점주님!"}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"질문 {turn}: 단골을 늘리려면 어떻게 하나요?"})
+        messages.append({"role": "assistant", "content": f"{turn}. {ANSWER}"})
+    return store_info, messages, {"initial": f"{i} {DIAGNOSIS}", "prescription": f"{i} {PRESCRIPTION}"}
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def measure(build):
+    """build() 가 만든 객체를 유지한 채 늘어난 파이썬 힙 / RSS"""
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    started = time.perf_counter()
+    kept = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, heap, rss_bytes() - rss_before, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--max-sessions", type=int, default=50, help="메모리에 둘 세션 수")
+    parser.add_argument("--window", type=int, default=40, help="세션당 메모리에 둘 메시지 수")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    def before():
+        # 기존: 브라우저 세션마다 session_state 에 전부 보관
+        kept = []
+        for i in range(args.sessions):
+            info, messages, result = fake_session(i, args.turns)
+            kept.append({"step": "처방전", "store_info": info, "messages": messages,
+                         "diagnosis_result": result, "selected_question": 1})
+        return kept
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.sqlite3"), max_sessions=args.max_sessions, window=args.window)
+
+        def after():
+            # 저장소: 브라우저 세션에는 토큰만, 내용은 디스크 + 최근 세션만 메모리
+            tokens = []
+            for i in range(args.sessions):
+                info, messages, result = fake_session(i, args.turns)
+                session = store.create()
+                session.update(step="처방전", store_info=info, selected_question=1)
+                for message in messages:
+                    session.append(message["role"], message["content"])
+                session.set_result("initial", result["initial"])
+                session.set_result("prescription", result["prescription"])
+                tokens.append({"session_token": session.token})
+            return tokens
+
+        kept_before, heap_before, rss_before, _ = measure(before)
+        del kept_before
+        tokens, heap_after, rss_after, write_s = measure(after)
+
+        # 메모리에서 내려간 세션 다시 열기 (디스크 → 작업 집합)
+        resume = []
+        for entry in tokens[: min(len(tokens), 200)]:
+            started = time.perf_counter()
+            store.open(entry["session_token"])
+            resume.append(time.perf_counter() - started)
+        db_bytes = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        stats = store.stats()
+
+    result = {
+        "before_heap_per_session": heap_before / args.sessions,
+        "after_heap_per_session": heap_after / args.sessions,
+        "before_rss_delta": rss_before,
+        "after_rss_delta": rss_after,
+        "write_ms_per_session": write_s * 1000 / args.sessions,
+        "resume_p50_ms": statistics.median(resume) * 1000,
+        "resume_p95_ms": sorted(resume)[int(0.95 * (len(resume) - 1))] * 1000,
+        "db_bytes": db_bytes,
+        "in_memory": stats["in_memory"],
+    }
+
+    print(f"세션 {args.sessions}개 · 상담 {args.turns}턴 · 메모리 작업 집합 {args.max_sessions}개 / 메시지 {args.window}개")
+    print(f"{'방식':<8}{'힙/세션':>12}{'RSS 증가':>12}")
+    print(f"{'before':<8}{result['before_heap_per_session'] / 1024:>10.1f}KB{rss_before / 1048576:>10.1f}MB")
+    print(f"{'after':<8}{result['after_heap_per_session'] / 1024:>10.1f}KB{rss_after / 1048576:>10.1f}MB")
+    before_heap, after_heap = result["before_heap_per_session"], result["after_heap_per_session"]
+    # 세션 수가 작업 집합(--max-sessions) 이하면 내려가는 세션이 없어 저장소 부담만큼 늘어남 → 방향에 맞게 표시
+    if after_heap > before_heap:
+        change = f"{after_heap / max(before_heap, 1):.1f}배 증가"
+    else:
+        change = f"{before_heap / max(after_heap, 1):.1f}배 감소"
+    print(f"세션당 힙 {change} · "
+          f"저장 {result['write_ms_per_session']:.2f}ms/세션 · 디스크 {db_bytes / 1048576:.1f}MB")
+    print(f"다시 열기: p50 {result['resume_p50_ms']:.2f}ms · p95 {result['resume_p95_ms']:.2f}ms")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "result": result}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
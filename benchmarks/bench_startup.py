@@ -0,0 +1,122 @@
+"""콜드 스타트: 첫 화면까지 / 첫 진단까지 걸리는 시간
+
+사용법:
+    python benchmarks/bench_startup.py [--runs 5] [--backend stub|gemini] [--think 1.0] [--json out.json]
+
+매 회 새 파이썬 프로세스에서 streamlit AppTest 로 앱을 처음 실행한다.
+- first_paint: 프로세스 시작 → 첫 스크립트 실행 완료 (import + 리소스 초기화 + 접수 화면)
+- first_run: 그중 첫 스크립트 실행만
+- preset: 사전 질문 클릭 (상관 데이터 표가 처음 그려짐)
+- first_diagnosis: 프로세스 시작 → 첫 초기 진단 완료 (입력 조작 포함, 스텁 지연 --time-scale 배)
+  첫 화면 후 사용자가 화면을 읽는 시간 --think 초를 기다렸다가 조작하고, 이 시간은 결과에서 뺀다
+  (서버 시작 시 예열이 그 사이에 끝나는지까지 포함해 측정).
+변경 전과 비교하려면 이전 커밋의 worktree 에 이 파일을 복사해 같은 옵션으로 실행한다.
+--backend gemini 는 GEMINI_API_KEY 가 없으면 더미 키로 첫 화면까지만 잰다 (모델 라이브러리 초기화 비용 확인용).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+
+def child(diagnosis, think):
+    """자식 프로세스: 측정 후 JSON 한 줄 출력"""
+    started = float(os.environ["BENCH_PROCESS_START"])
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    run_started = time.perf_counter()
+    at.run()
+    painted = time.perf_counter()
+    result = {
+        "import_s": imported - started,
+        "first_run_s": painted - run_started,
+        "first_paint_s": painted - started,
+        "errors": [e.value for e in at.error],
+    }
+    if diagnosis and not at.exception:
+        time.sleep(think)
+        step = time.perf_counter()
+        at.sidebar.button(key="btn_q1").click().run()
+        result["preset_s"] = time.perf_counter() - step
+        at.selectbox[0].select("서울 성동구").run()
+        at.selectbox[1].select("성수동1가").run()
+        next(t for t in at.text_input if "가맹점명" in t.label).input("콜드스타트점")
+        step = time.perf_counter()
+        next(b for b in at.button if "진료 접수" in b.label).click().run()
+        done = time.perf_counter()
+        result["submit_s"] = done - step
+        result["first_diagnosis_s"] = done - started - think
+        result["errors"] += [e.value for e in at.error]
+    if at.exception:
+        result["errors"].append(at.exception[0].message)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="stub")
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--think", type=float, default=1.0, help="첫 화면 후 조작 전 대기 (초)")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-diagnosis", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(not args.no_diagnosis, args.think)
+        return
+
+    diagnosis = args.backend != "gemini" or bool(os.environ.get("GEMINI_API_KEY"))
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.runs):
+            env = dict(
+                os.environ,
+                LLM_BACKEND=args.backend,
+                STUB_TIME_SCALE=str(args.time_scale),
+                LLM_CACHE="false",
+                SESSION_DB_PATH=os.path.join(tmp, f"sessions_{i}.sqlite3"),
+                PYTHONWARNINGS="ignore",
+            )
+            env.setdefault("GEMINI_API_KEY", "dummy-key-for-startup-benchmark")
+            command = [sys.executable, os.path.abspath(__file__), "--child", "--think", str(args.think)] + ([] if diagnosis else ["--no-diagnosis"])
+            # 프로세스 시작 시각은 부모가 넘김 (perf_counter 는 시스템 전체 단조 시계)
+            env["BENCH_PROCESS_START"] = repr(time.perf_counter())
+            output = subprocess.run(command, env=env, capture_output=True, text=True, cwd=ROOT, timeout=600)
+            line = next((l for l in reversed(output.stdout.splitlines()) if l.startswith("{")), None)
+            if line is None:
+                print(output.stderr[-2000:], file=sys.stderr)
+                raise SystemExit("측정 실패")
+            rows.append(json.loads(line))
+
+    def med(key):
+        values = [r[key] for r in rows if key in r]
+        return statistics.median(values) if values else None
+
+    print(f"백엔드 {args.backend} · {args.runs}회 (콜드 프로세스)")
+    for key, label in [("import_s", "streamlit import"), ("first_run_s", "첫 스크립트 실행"), ("first_paint_s", "첫 화면"),
+                       ("preset_s", "사전 질문 클릭"), ("submit_s", "접수 → 진단"), ("first_diagnosis_s", "첫 진단")]:
+        value = med(key)
+        if value is not None:
+            print(f"  {label:<16} p50 {value * 1000:8.0f}ms")
+    errors = sorted({e for r in rows for e in r["errors"]})
+    if errors:
+        print(f"  화면 오류: {errors}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "rows": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
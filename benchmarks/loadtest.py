@@ -0,0 +1,351 @@
+"""접수 → 진료 → 처방전 다중 세션 부하 테스트 (streamlit AppTest + 스텁 백엔드)
+
+N개 세션을 동시에 돌려 각 세션이 접수 폼 입력/제출, 상담 질문 K회, 처방전 발급을 수행한다.
+스크립트 rerun 시간, 단계별 지연 분위수, 세션당 메모리, 처리량을 JSON 으로 남긴다.
+
+사용법:
+    python benchmarks/loadtest.py --sessions 20 --concurrency 10 --questions 3
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest_20261001_120000.json
+
+결과는 기본으로 benchmarks/results/loadtest_<시각>.json 에 저장된다.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+QUESTIONS = [
+    "단골 늘리는 방법?",
+    "SNS 마케팅 추천해주세요",
+    "객단가를 올리려면 어떻게 하나요?",
+    "평일 점심 손님을 늘리고 싶어요",
+    "리뷰를 늘리는 방법은?",
+]
+
+
+def current_rss_bytes():
+    """현재 프로세스 RSS (리눅스 /proc 기준, 없으면 최대 RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+_session_store = []
+
+
+def app_session(at):
+    """앱이 쓰는 세션 저장소 파일에서 이 세션의 진료 기록 (세션 상태에는 토큰만 있음)"""
+    if not _session_store:
+        sys.path.insert(0, ROOT)
+        from session_store import SessionStore
+        # 메모리 작업 집합 없이 (max_sessions=0) 매번 디스크에서 최신 상태를 읽음
+        _session_store.append(SessionStore(os.environ["SESSION_DB_PATH"], max_sessions=0, retention=0))
+    return _session_store[0].open(at.session_state["session_token"])
+
+
+def session_payload_bytes(at):
+    """세션 앱 데이터(store_info, messages, diagnosis_result) 직렬화 크기"""
+    session = app_session(at)
+    return sum(
+        len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        for value in (session.store_info, session.all_messages(), session.diagnosis_result)
+    )
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": pick(50),
+        "p90": pick(90),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": values[-1],
+    }
+
+
+class SessionDriver:
+    """AppTest 세션 1개를 조작하며 rerun 시간을 기록"""
+
+    def __init__(self, index, timeout, think=0.0):
+        from streamlit.testing.v1 import AppTest
+        self.index = index
+        self.think = think
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.reruns = []
+        self.steps = defaultdict(list)
+
+    def _timed(self, step, action):
+        if self.think and step != "load":
+            time.sleep(self.think)  # 사용자가 다음 입력까지 걸리는 시간
+        started = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - started
+        self.reruns.append(elapsed)
+        if step:
+            self.steps[step].append(elapsed)
+        if self.at.exception:
+            raise RuntimeError(f"세션 {self.index} {step or 'rerun'} 예외: {self.at.exception[0].message}")
+
+    def _button(self, label):
+        for button in self.at.button:
+            if label in button.label:
+                return button
+        raise LookupError(f"버튼 없음: {label}")
+
+    def run(self, questions):
+        at = self.at
+        preset = self.index % 5 + 1
+        self._timed("load", at.run)
+        self._timed("preset", lambda: at.sidebar.button(key=f"btn_q{preset}").click().run())
+        # 지역/위치는 위젯마다 (접수 프래그먼트) rerun, 가맹점명은 폼 안이라 제출과 함께 전송
+        self._timed(None, lambda: at.selectbox[0].select("서울 성동구").run())
+        self._timed(None, lambda: at.selectbox[1].select("성수동1가").run())
+
+        def submit():
+            next(t for t in at.text_input if "가맹점명" in t.label).input(f"부하테스트 {self.index}호점")
+            self._button("진료 접수").click().run()
+
+        self._timed("submit", submit)
+        if app_session(at).step != "진료":
+            raise RuntimeError(f"세션 {self.index}: 진료 단계로 넘어가지 못함 ({[e.value for e in at.error]})")
+        for k in range(questions):
+            question = QUESTIONS[(self.index + k) % len(QUESTIONS)]
+            self._timed("chat", lambda: at.chat_input[0].set_value(question).run())
+        self._timed("prescription", lambda: self._button("처방전 발급").click().run())
+        if app_session(at).step != "처방전":
+            raise RuntimeError(f"세션 {self.index}: 처방전 발급 실패 ({[e.value for e in at.error]})")
+
+
+def share_mock_runtime():
+    """AppTest 를 여러 스레드에서 동시에 돌릴 수 있게 Runtime 싱글턴 조회를 보정
+
+    AppTest 는 run() 마다 Runtime._instance 를 자기 mock 으로 바꿨다가 끝나면 None 으로 되돌린다.
+    동시 실행 시 다른 세션의 스크립트 스레드가 None 을 보게 되므로, 마지막으로 설정된 mock 을 재사용한다.
+    """
+    from streamlit.runtime.runtime import Runtime
+    original_instance = Runtime.instance.__func__
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in last:
+            return last["runtime"]
+        return original_instance(cls)
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in last
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+    # 실제 서버처럼 컴파일된 스크립트를 세션 간에 공유 (동시 compile() 경합 방지)
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    shared_cache = ScriptCache()
+    app_test.ScriptCache = lambda: shared_cache
+    local_script_runner.ScriptCache = lambda: shared_cache
+
+    # run() 마다 global.appTest 옵션을 켰다 끄는데, 다른 세션 실행 중에 꺼지지 않도록 항상 켜 둠
+    import contextlib
+    from streamlit import config
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+
+
+def configure_environment(args):
+    """앱이 읽는 설정을 환경변수로 지정 (스텁 백엔드)"""
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["STUB_LATENCY"] = args.latency
+    os.environ["STUB_TTFT_MS"] = str(args.ttft_ms)
+    os.environ["STUB_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["STUB_TIME_SCALE"] = str(args.time_scale)
+    os.environ["STUB_SEED"] = str(args.seed)
+    os.environ["STREAMING"] = "true" if args.streaming else "false"
+    if not args.cache:
+        os.environ["LLM_CACHE"] = "false"
+    os.environ["SPECULATIVE_DIAGNOSIS"] = "true" if args.speculative else "false"
+    # 진료 세션은 실행마다 새 임시 파일에 저장 (앱의 .cache 를 건드리지 않음)
+    os.environ["SESSION_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "sessions.sqlite3")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(result, baseline_path):
+    """이전 결과 대비 단계별 p50/p95 변화율 출력"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n기준 결과 대비 ({baseline_path}, {baseline.get('git_revision')})")
+    rows = [("rerun", result["rerun_seconds"], baseline.get("rerun_seconds", {}))]
+    for step, summary in result["step_seconds"].items():
+        rows.append((step, summary, baseline.get("step_seconds", {}).get(step, {})))
+    for name, now, before in rows:
+        for q in ("p50", "p95"):
+            if now.get(q) and before.get(q):
+                change = (now[q] - before[q]) / before[q] * 100
+                print(f"  {name:<13} {q} {before[q] * 1000:8.0f}ms → {now[q] * 1000:8.0f}ms ({change:+.1f}%)")
+    if baseline.get("throughput_sessions_per_min") and result.get("throughput_sessions_per_min"):
+        print(f"  처리량 {baseline['throughput_sessions_per_min']:.1f} → {result['throughput_sessions_per_min']:.1f} 세션/분")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=2, help="세션당 상담 질문 수 (K)")
+    parser.add_argument("--backend", default="stub")
+    parser.add_argument("--latency", default="lognormal", help="스텁 지연 분포")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="스텁 대기시간 배율 (0=대기 없음)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--cache", action="store_true", help="응답 캐시 사용 (기본: 끔)")
+    parser.add_argument("--speculative", action=argparse.BooleanOptionalAction, default=True,
+                        help="접수 화면 초기 진단 미리 생성")
+    parser.add_argument("--think-ms", type=float, default=0, help="사용자 입력 사이 대기 (ms)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="결과 JSON 경로 (기본: benchmarks/results/loadtest_<시각>.json)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--trace-memory", action="store_true", help="tracemalloc 으로 세션당 메모리 측정 (느림)")
+    parser.add_argument("--verbose", action="store_true", help="오류 traceback 출력")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    share_mock_runtime()
+
+    # 1회 예열 (모듈 import, cache_resource 초기화) 후 기준 메모리 측정
+    warmup = SessionDriver(-1, args.timeout)
+    warmup.at.run()
+    del warmup
+    gc.collect()
+    if args.trace_memory:
+        tracemalloc.start()
+    baseline_traced = tracemalloc.get_traced_memory()[0] if args.trace_memory else None
+    baseline_rss = current_rss_bytes()
+
+    drivers, errors = [], []
+    lock = threading.Lock()
+
+    def run_one(index):
+        driver = SessionDriver(index, args.timeout, think=args.think_ms / 1000)
+        driver.run(args.questions)
+        with lock:
+            drivers.append(driver)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_one, i) for i in range(args.sessions)]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                if args.verbose:
+                    traceback.print_exc()
+    wall = time.perf_counter() - started
+
+    # 완료된 세션을 모두 살려둔 상태의 메모리 → 세션당 증가분
+    gc.collect()
+    rss = current_rss_bytes()
+    memory = {
+        "baseline_rss_bytes": baseline_rss,
+        "rss_bytes": rss,
+        "per_session_rss_bytes": (rss - baseline_rss) / len(drivers) if drivers else None,
+        "per_session_payload_bytes": (
+            statistics.fmean(session_payload_bytes(d.at) for d in drivers) if drivers else None
+        ),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if args.trace_memory:
+        current_traced, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update(
+            traced_bytes=current_traced,
+            peak_traced_bytes=peak_traced,
+            per_session_traced_bytes=(current_traced - baseline_traced) / len(drivers) if drivers else None,
+        )
+
+    steps = defaultdict(list)
+    reruns = []
+    for driver in drivers:
+        reruns.extend(driver.reruns)
+        for step, values in driver.steps.items():
+            steps[step].extend(values)
+
+    completed = len(drivers)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "sessions_completed": completed,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_sessions_per_min": completed / wall * 60 if wall else None,
+        "throughput_reruns_per_sec": len(reruns) / wall if wall else None,
+        "rerun_seconds": percentiles(reruns),
+        "step_seconds": {step: percentiles(values) for step, values in sorted(steps.items())},
+        "memory": memory,
+    }
+
+    print(f"세션 {completed}/{args.sessions} 완료, {wall:.1f}초, "
+          f"{result['throughput_sessions_per_min']:.1f} 세션/분, 오류 {len(errors)}건")
+    print(f"rerun p50 {result['rerun_seconds'].get('p50', 0) * 1000:.0f}ms / p95 {result['rerun_seconds'].get('p95', 0) * 1000:.0f}ms")
+    for step, summary in result["step_seconds"].items():
+        print(f"  {step:<13} p50 {summary['p50'] * 1000:8.0f}ms  p95 {summary['p95'] * 1000:8.0f}ms  (n={summary['count']})")
+    if memory["per_session_rss_bytes"] is not None:
+        line = (f"세션당 메모리: RSS 증가 {memory['per_session_rss_bytes'] / 1024:.0f} KiB, "
+                f"세션 데이터 {memory['per_session_payload_bytes'] / 1024:.1f} KiB")
+        if args.trace_memory:
+            line += f", tracemalloc {memory['per_session_traced_bytes'] / 1024:.0f} KiB"
+        print(line)
+    for error in errors[:5]:
+        print("오류:", error)
+
+    if args.compare:
+        compare(result, args.compare)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"결과 저장: {output}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
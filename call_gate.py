@@ -0,0 +1,318 @@
+"""모델 호출 관문 (동시 실행 제한 + 토큰 버킷 + 지터 백오프 재시도 + 서킷 브레이커)
+
+프로세스 전체가 백엔드 하나를 공유하므로 이 관문으로 감싸 두면 세션이 몇 개든
+동시 호출 수와 초당 호출 수가 설정값을 넘지 않는다. 재시도 가능한 오류(429/500/타임아웃)는
+지터를 준 지수 백오프로 다시 시도하고, 연속 실패가 쌓이면 일정 시간 바로 실패시켜 API 회복을 기다린다.
+대기 시간, 재시도 횟수, 브레이커 상태는 metrics 에 기록한다.
+"""
+import random
+import threading
+import time
+import weakref
+
+import metrics
+from llm_backend import BackendError, ClosingPieces, TextStream
+
+# 기본값
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RATE_PER_SECOND = 5.0
+DEFAULT_BURST = 5
+DEFAULT_QUEUE_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 8.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30.0
+
+
+class CircuitOpenError(BackendError):
+    """API 상태가 나빠 호출을 보내지 않음"""
+    status = 503
+
+
+class QueueTimeout(BackendError):
+    """대기열에서 순서를 기다리다 시간 초과"""
+    status = 503
+
+
+# ==================== 토큰 버킷 ====================
+class TokenBucket:
+    """초당 rate 개씩 채워지는 버킷 (최대 burst 개)"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """토큰 하나를 얻을 때까지 대기, deadline(monotonic)을 넘기면 False"""
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# ==================== 서킷 브레이커 ====================
+class CircuitBreaker:
+    """연속 failure_threshold 회 실패하면 cooldown 초 동안 열림(즉시 실패),
+    이후 반열림 상태에서 시험 호출 하나가 성공하면 닫힘"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    PROBE = "probe"
+
+    def allow(self):
+        """호출 가능하면 True, 반열림 상태의 시험 호출이면 PROBE (둘 다 참), 막히면 False"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return self.PROBE
+            return True
+
+    def release(self):
+        """시험 호출이 성공/실패 판정 없이 끝남 (대기 시간 초과, 스트림 중간 종료) → 다음 호출이 다시 시험"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                metrics.inc("llm_circuit_transitions_total", state=self.CLOSED)
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.inc("llm_circuit_transitions_total", state=self.OPEN)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+# ==================== 관문 ====================
+class CallGate:
+    """백엔드를 감싸 같은 인터페이스(generate / stream / ...)로 제공"""
+
+    def __init__(self, backend, max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_per_second=DEFAULT_RATE_PER_SECOND,
+                 burst=DEFAULT_BURST, queue_timeout=DEFAULT_QUEUE_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN, rng=None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def __getattr__(self, name):
+        # name / model_name / count_tokens / create_context_cache 등은 감싼 백엔드 것을 그대로 사용
+        return getattr(self.backend, name)
+
+    # ---------- 자리 확보 ----------
+    def _acquire(self, operation):
+        """동시 실행 자리 + 버킷 토큰 확보 (대기 시간 기록)"""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        with self._lock:
+            self.waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                metrics.inc("llm_queue_timeouts_total", operation=operation)
+                raise QueueTimeout("요청이 많아 대기 시간이 초과되었습니다")
+            if not self.bucket.acquire(deadline):
+                self._slots.release()
+                metrics.inc("llm_queue_timeouts_total", operation=operation)
+                raise QueueTimeout("요청이 많아 대기 시간이 초과되었습니다")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+        metrics.observe("llm_queue_wait_seconds", time.monotonic() - started, operation=operation)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, attempt):
+        """full jitter: 0 ~ min(max, base * 2^attempt) 사이 균등"""
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _run(self, operation, call):
+        """브레이커 확인 → 자리 확보 → 호출, 재시도 가능한 오류는 백오프 후 재시도 → (결과, 시험 호출 여부)"""
+        attempt = 0
+        while True:
+            allowed = self.breaker.allow()
+            if not allowed:
+                metrics.inc("llm_circuit_rejections_total", operation=operation)
+                raise CircuitOpenError("모델 API 상태가 불안정해 잠시 호출을 멈췄습니다")
+            probe = allowed == CircuitBreaker.PROBE
+            try:
+                self._acquire(operation)
+            except QueueTimeout:
+                if probe:
+                    self.breaker.release()
+                raise
+            try:
+                result = call()
+            except BackendError as e:
+                self._release()
+                if e.retryable:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()  # 요청 자체 문제 (API 는 정상 응답)
+                if not e.retryable or attempt >= self.max_retries:
+                    metrics.inc("llm_calls_total", operation=operation, outcome="error")
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                metrics.inc("llm_retries_total", operation=operation, status=e.status)
+                metrics.observe("llm_retry_backoff_seconds", delay, operation=operation)
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._release()
+                self.breaker.failure()  # 분류되지 않은 오류 (네트워크 등)
+                metrics.inc("llm_calls_total", operation=operation, outcome="error")
+                raise
+            return result, probe
+
+    # ---------- 백엔드 인터페이스 ----------
+    def generate(self, prompt, model=None, **options):
+        def once():
+            # _run 이 실패 시 자리를 반납하므로 여기서는 성공 시에만 반납
+            result = self.backend.generate(prompt, model=model, **options)
+            self._release()
+            return result
+
+        result, _ = self._run("generate", once)
+        self.breaker.success()
+        metrics.inc("llm_calls_total", operation="generate", outcome="ok")
+        return result
+
+    def stream(self, prompt, model=None, **options):
+        """호출 시점 오류만 재시도하고, 자리는 응답을 끝까지 읽을 때까지 유지
+
+        시험 호출 스트림이 판정 없이 닫히면 (추측 취소, 헤지 패배, 병합 구독자 이탈) 시험 자리만 반납한다.
+        """
+        inner, probe = self._run("stream", lambda: self.backend.stream(prompt, model=model, **options))
+        released = []
+
+        def release_once():
+            if not released:
+                released.append(True)
+                self._release()
+                if probe:
+                    self.breaker.release()  # 이미 성공/실패로 판정됐으면 아무 일 없음
+
+        def pieces():
+            try:
+                for piece in inner:
+                    yield piece
+            except BackendError as e:
+                if e.retryable:
+                    self.breaker.failure()
+                metrics.inc("llm_calls_total", operation="stream", outcome="error")
+                raise
+            else:
+                self.breaker.success()
+                metrics.inc("llm_calls_total", operation="stream", outcome="ok")
+            finally:
+                inner.close()
+                release_once()
+
+        def finalize(result):
+            result.prompt_tokens = inner.prompt_tokens
+            result.output_tokens = inner.output_tokens
+            result.cached_tokens = inner.cached_tokens
+
+        result = TextStream(ClosingPieces(pieces(), release_once), inner.model, finalize)
+        # 끝까지 읽지 않고 버려진 응답도 자리는 반납
+        weakref.finalize(result, release_once)
+        return result
+
+    def create_context_cache(self, prefix, ttl, model=None, display_name=None):
+        def once():
+            result = self.backend.create_context_cache(prefix, ttl, model=model, display_name=display_name)
+            self._release()
+            return result
+
+        result, _ = self._run("create_context_cache", once)
+        self.breaker.success()
+        return result
+
+    def stats(self):
+        """현재 상태 (사이드바/벤치마크용)"""
+        with self._lock:
+            in_flight, waiting = self.in_flight, self.waiting
+        return {
+            "in_flight": in_flight,
+            "waiting": waiting,
+            "max_concurrency": self.max_concurrency,
+            "circuit": self.breaker.state,
+            "failures": self.breaker.failures,
+        }
+
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def gate_from_settings(backend, get_setting):
+    """LLM_* 설정으로 관문 생성"""
+    return CallGate(
+        backend,
+        max_concurrency=int(_float(get_setting("LLM_MAX_CONCURRENCY"), DEFAULT_MAX_CONCURRENCY)),
+        rate_per_second=_float(get_setting("LLM_RATE_PER_SECOND"), DEFAULT_RATE_PER_SECOND),
+        burst=int(_float(get_setting("LLM_BURST"), DEFAULT_BURST)),
+        queue_timeout=_float(get_setting("LLM_QUEUE_TIMEOUT"), DEFAULT_QUEUE_TIMEOUT),
+        max_retries=int(_float(get_setting("LLM_MAX_RETRIES"), DEFAULT_MAX_RETRIES)),
+        backoff_base=_float(get_setting("LLM_BACKOFF_BASE"), DEFAULT_BACKOFF_BASE),
+        backoff_max=_float(get_setting("LLM_BACKOFF_MAX"), DEFAULT_BACKOFF_MAX),
+        failure_threshold=int(_float(get_setting("LLM_BREAKER_THRESHOLD"), DEFAULT_FAILURE_THRESHOLD)),
+        cooldown=_float(get_setting("LLM_BREAKER_COOLDOWN"), DEFAULT_COOLDOWN),
+    )
@@ -0,0 +1,158 @@
+"""상담 대화 기억 (토큰 예산 안의 최근 턴 + 백그라운드 누적 요약)
+
+최근 턴은 토큰 예산 안에서 원문 그대로 넣고, 예산 밖으로 밀려난 이전 턴은
+요약 한 덩어리로 합친다. 요약 갱신은 응답 출력이 끝난 뒤 별도 스레드에서 하므로
+대화가 길어져도 턴마다 프롬프트 크기와 지연시간이 거의 일정하다.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from doc_retrieval import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 기본값
+DEFAULT_HISTORY_TOKENS = 1200     # 최근 턴 원문에 쓸 토큰 예산
+DEFAULT_MAX_TURNS = 6             # 원문으로 넣을 최대 턴(질문+답변) 수
+DEFAULT_SUMMARY_TOKENS = 300      # 요약 최대 출력 토큰
+PENDING_WIDTH = 120               # 아직 요약되지 않은 밀려난 메시지를 줄여 넣을 글자 수
+
+ROLE_LABELS = {"user": "점주", "assistant": "전문의"}
+
+SUMMARY_PROMPT = """다음은 상권 마케팅 상담 기록입니다.
+기존 요약에 새 대화 내용을 합쳐 {max_tokens} 토큰 이내의 한국어 요약으로 갱신하세요.
+점주가 알려준 사실, 질문한 주제, 전문의가 제안한 전략과 수치만 남기고 인사말은 빼세요.
+
+## 기존 요약
+{summary}
+
+## 새 대화
+{transcript}
+
+## 갱신된 요약"""
+
+# 요약 작업은 세션 간에 공유하는 소수의 스레드에서 처리
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+def format_turns(messages, width=None):
+    """메시지 목록 → '점주: ... / 전문의: ...' 줄 목록"""
+    lines = []
+    for msg in messages:
+        content = " ".join(msg["content"].split())
+        if width and len(content) > width:
+            content = content[:width] + "…"
+        lines.append(f"{ROLE_LABELS.get(msg['role'], msg['role'])}: {content}")
+    return "\n".join(lines)
+
+
+def _dialogue(messages):
+    """첫 질문 이전의 안내 메시지를 뺀 실제 대화"""
+    for i, msg in enumerate(messages):
+        if msg["role"] == "user":
+            return i, messages[i:]
+    return len(messages), []
+
+
+class ConversationMemory:
+    """세션 하나의 상담 기억
+
+    messages 는 화면에 표시하는 st.session_state.messages 를 그대로 받는다.
+    summary 는 messages[:covered] 까지의 요약이다.
+    """
+
+    def __init__(self, history_tokens=DEFAULT_HISTORY_TOKENS, max_turns=DEFAULT_MAX_TURNS,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS):
+        self.history_tokens = history_tokens
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.covered = 0
+        self._lock = threading.Lock()
+        self._future = None
+
+    def reset(self):
+        with self._lock:
+            self.summary = ""
+            self.covered = 0
+            self._future = None
+
+    def _split(self, messages):
+        """(윈도 시작 위치, 최근 메시지) — 뒤에서부터 턴 단위로 예산 안까지"""
+        offset, dialogue = _dialogue(messages)
+        start, used, turns = len(dialogue), 0, 0
+        i = len(dialogue)
+        while i > 0 and turns < self.max_turns:
+            # 질문 하나부터 다음 질문 전까지를 한 턴으로 묶음
+            j = i - 1
+            while j > 0 and dialogue[j]["role"] != "user":
+                j -= 1
+            tokens = estimate_tokens(format_turns(dialogue[j:i]))
+            if turns and used + tokens > self.history_tokens:
+                break
+            used += tokens
+            turns += 1
+            start = i = j
+        return offset + start, messages[offset + start:]
+
+    def history(self, messages):
+        """프롬프트에 넣을 대화 기록 (요약 + 밀려났지만 아직 요약 전인 메시지 + 최근 턴 원문)"""
+        if len(messages) < self.covered:  # 대화가 초기화됨
+            self.reset()
+        start, recent = self._split(messages)
+        with self._lock:
+            summary, covered = self.summary, self.covered
+        offset, _ = _dialogue(messages)
+        # 요약이 계속 실패해도 프롬프트가 커지지 않도록 최근 것만
+        pending = messages[max(covered, offset):start][-2 * self.max_turns:]
+
+        blocks = []
+        if summary:
+            blocks.append(f"이전 상담 요약:\n{summary}")
+        if pending:
+            blocks.append(f"이전 대화 (요약 중):\n{format_turns(pending, PENDING_WIDTH)}")
+        if recent:
+            blocks.append(f"최근 대화:\n{format_turns(recent)}")
+        return "\n\n".join(blocks)
+
+    def update(self, messages, backend, model=None):
+        """윈도 밖으로 밀려난 메시지가 있으면 백그라운드에서 요약 갱신 (이미 진행 중이면 건너뜀)"""
+        if backend is None:
+            return None
+        start, _ = self._split(messages)
+        with self._lock:
+            if start <= self.covered or (self._future is not None and not self._future.done()):
+                return self._future
+            offset, _ = _dialogue(messages)
+            pending = list(messages[max(self.covered, offset):start])
+            self._future = _executor.submit(self._summarize, self.summary, pending, start, backend, model)
+            return self._future
+
+    def _summarize(self, summary, pending, upto, backend, model):
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=self.summary_tokens,
+            summary=summary or "(없음)",
+            transcript=format_turns(pending),
+        )
+        started = time.perf_counter()
+        try:
+            text = backend.generate(prompt, model=model, max_output_tokens=self.summary_tokens).text.strip()
+        except Exception:
+            metrics.inc("chat_summary_errors_total")
+            logger.exception("상담 요약 실패")
+            return None
+        metrics.observe("chat_summary_seconds", time.perf_counter() - started)
+        with self._lock:
+            if upto > self.covered:
+                self.summary = text
+                self.covered = upto
+        return text
+
+    def wait(self, timeout=None):
+        """진행 중인 요약이 끝날 때까지 대기 (벤치마크/처방전 발급용)"""
+        future = self._future
+        if future is not None:
+            future.result(timeout=timeout)
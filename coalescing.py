@@ -0,0 +1,235 @@
+"""동시에 들어온 같은 요청 병합 (프로세스 전체, 정규화한 프롬프트 해시 기준)
+
+여러 점주가 같은 사전 질문으로 동시에 접수하면 응답 캐시가 채워지기 전이라 같은 호출이 N번 나간다.
+진행 중인 호출을 (작업, 모델, 공백을 정리한 프롬프트, 생성 옵션) 해시로 묶어
+- generate: 처음 호출한 쪽만 실제로 보내고 나머지는 같은 Future 의 결과를 받는다
+- stream: 처음 호출한 쪽의 응답 조각을 모든 구독자가 처음부터 같이 받는다 (늦게 합류해도 앞 조각부터)
+호출이 끝나면 묶음을 지우므로 이후 같은 요청은 응답 캐시가 처리한다.
+대표/합류 횟수는 llm_coalesce_total{operation,role=leader|follower} 에 기록한다.
+응답 하나의 토큰 / 비용은 한 번만 집계한다: generate 는 합류한 쪽 응답이 shared=True,
+stream 은 끝까지 읽은 첫 구독자 외에는 shared=True.
+"""
+import copy
+import hashlib
+import json
+import threading
+import weakref
+from concurrent.futures import Future
+
+import metrics
+from llm_backend import TextStream
+
+
+def coalesce_key(operation, prompt, model=None, **options):
+    """같은 응답을 낼 요청이면 같은 키 (공백 차이 무시, 라우터 결정은 모델명만 반영)"""
+    route = options.pop("route", None)
+    cached_context = options.pop("cached_context", None)
+    payload = {
+        "operation": operation,
+        "model": model or (route.model if route is not None else None),
+        "cached_context": cached_context.name if cached_context is not None else None,
+        "options": options,
+        "prompt": " ".join(prompt.split()),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ==================== 스트림 공유 ====================
+class SharedStream:
+    """원본 스트림 하나를 여러 구독자에게 전달
+
+    별도 스레드 없이, 다음 조각이 필요한 구독자 하나가 원본에서 읽어 목록에 붙이고 나머지는 기다린다.
+    구독자가 모두 중간에 그만두면 원본도 닫는다.
+    """
+
+    def __init__(self, inner, on_finish):
+        self.inner = inner
+        self._iter = iter(inner)
+        self._on_finish = on_finish
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.abandoned = False
+        self._accounted = False
+        self._pulling = False
+        self._readers = 0
+        self._cond = threading.Condition()
+
+    def subscribe(self):
+        """구독자용 TextStream (끝난 스트림도 처음부터 다시 읽음, 버려진 스트림이면 None)"""
+        with self._cond:
+            if self.abandoned:
+                return None
+            self._readers += 1
+        left = []
+        stream = TextStream(self._read(left), self.inner.model, self._finalize)
+        # 읽기 시작하지 않고 버려진 구독자도 빠짐
+        weakref.finalize(stream, self._leave, left)
+        return stream
+
+    def _read(self, left):
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self.pieces) and not self.done and self._pulling:
+                        self._cond.wait()
+                    if index < len(self.pieces):
+                        piece = self.pieces[index]
+                    elif self.done:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    else:
+                        self._pulling = True
+                        piece = None
+                if piece is None:
+                    self._pull()
+                    continue
+                index += 1
+                yield piece
+        finally:
+            self._leave(left)
+
+    def _pull(self):
+        try:
+            piece = next(self._iter)
+        except StopIteration:
+            self._finish(None)
+        except Exception as e:
+            self._finish(e)
+        else:
+            with self._cond:
+                self.pieces.append(piece)
+                self._pulling = False
+                self._cond.notify_all()
+
+    def _finish(self, error):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._pulling = False
+            self._cond.notify_all()
+        self._on_finish()
+
+    def _leave(self, left):
+        if left:
+            return
+        left.append(True)
+        with self._cond:
+            self._readers -= 1
+            abandoned = self._readers == 0 and not self.done
+            if abandoned:
+                self.done = self.abandoned = True
+        if abandoned:
+            # 끝까지 읽는 구독자가 없으면 원본 호출도 중단
+            self._iter.close()
+            self.inner.close()
+            self._on_finish()
+
+    def _finalize(self, result):
+        # 끝까지 읽은 첫 구독자만 토큰 / 비용을 집계 (대표가 중간에 그만둬도 한 번은 집계됨)
+        with self._cond:
+            result.shared = self._accounted
+            self._accounted = True
+        result.prompt_tokens = self.inner.prompt_tokens
+        result.output_tokens = self.inner.output_tokens
+        result.cached_tokens = self.inner.cached_tokens
+
+
+# ==================== 병합 ====================
+class RequestCoalescer:
+    """백엔드(보통 ModelRouter / CallGate)를 감싸 같은 인터페이스로 제공"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._calls = {}     # 키 → Future (generate 는 응답, stream 은 SharedStream)
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def __getattr__(self, name):
+        # name / model_name / route / stats / create_context_cache 등은 감싼 백엔드 것을 그대로 사용
+        return getattr(self.backend, name)
+
+    def _count(self, operation, leader):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+        metrics.inc("llm_coalesce_total", operation=operation, role="leader" if leader else "follower")
+
+    def _forget(self, key, entry):
+        with self._lock:
+            if self._calls.get(key) is entry:
+                del self._calls[key]
+
+    def generate(self, prompt, model=None, **options):
+        key = coalesce_key("generate", prompt, model, **options)
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        self._count("generate", leader)
+        if not leader:
+            result = copy.copy(future.result())
+            result.shared = True
+            return result
+        try:
+            result = self.backend.generate(prompt, model=model, **options)
+        except BaseException as e:
+            self._forget(key, future)
+            future.set_exception(e)
+            raise
+        self._forget(key, future)
+        future.set_result(result)
+        return result
+
+    def stream(self, prompt, model=None, **options):
+        """진행 중인 같은 스트림이 있으면 구독, 없으면 새로 호출해 공유 (호출 시점 오류는 합류한 쪽도 같이 받음)"""
+        key = coalesce_key("stream", prompt, model, **options)
+        with self._lock:
+            pending = self._calls.get(key)
+            leader = pending is None
+            if leader:
+                # 관문 대기 중에 들어온 요청도 합류하도록 호출 전에 등록
+                pending = self._calls[key] = Future()
+        self._count("stream", leader)
+        if not leader:
+            subscription = pending.result().subscribe()
+            if subscription is not None:
+                return subscription
+            # 대표가 중간에 그만둔 스트림이면 직접 호출
+            return self.backend.stream(prompt, model=model, **options)
+        try:
+            inner = self.backend.stream(prompt, model=model, **options)
+        except BaseException as e:
+            self._forget(key, pending)
+            pending.set_exception(e)
+            raise
+        shared = SharedStream(inner, lambda: self._forget(key, pending))
+        subscription = shared.subscribe()
+        pending.set_result(shared)
+        return subscription
+
+    def coalescing_stats(self):
+        """대표 / 합류 횟수와 병합 비율 (사이드바/벤치마크용)"""
+        with self._lock:
+            leaders, followers, in_flight = self.leaders, self.followers, len(self._calls)
+        requests = leaders + followers
+        return {
+            "leaders": leaders,
+            "followers": followers,
+            "ratio": followers / requests if requests else 0.0,
+            "in_flight": in_flight,
+        }
+
+
+def coalescer_from_settings(backend, get_setting):
+    """LLM_COALESCE 설정 (기본 켬, false 면 backend 를 그대로 반환)"""
+    if str(get_setting("LLM_COALESCE", "true")).lower() in ("0", "false", "no", "off"):
+        return backend
+    return RequestCoalescer(backend)
@@ -0,0 +1,230 @@
+"""상담 노트 (핵심 사실 / 합의한 전략 / 언급된 수치를 구조화해 턴마다 백그라운드 갱신)
+
+처방전에 상담 기록을 넣을 때 최근 메시지 몇 개를 잘라 넣으면 긴 답변의 요점과 앞쪽 턴이 빠진다.
+상담 한 턴이 끝날 때마다 이전 노트 + 새 턴으로 노트 전체를 갱신해 두고 (DIGEST_SCHEMA JSON),
+처방전 발급 시에는 노트와 아직 반영되지 않은 메시지만 넣는다.
+갱신은 chat_memory 의 요약처럼 응답 출력 뒤 별도 스레드에서 하며,
+진행 중에 새 턴이 오면 끝난 뒤 밀린 턴을 이어서 반영한다.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from chat_memory import format_turns
+from doc_retrieval import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+STAGE = "consultation_digest"
+
+# 기본값
+DEFAULT_DIGEST_TOKENS = 512    # 노트 최대 출력 토큰
+DEFAULT_MAX_ITEMS = 8          # 목록별 최대 항목 수
+DEFAULT_WAIT = 5.0             # 처방전 발급 시 진행 중인 갱신을 기다리는 최대 시간 (초)
+PENDING_WIDTH = 300            # 노트에 아직 반영되지 않은 메시지를 줄여 넣을 글자 수
+
+STRATEGY_STATUS = ["합의", "검토"]
+
+DIGEST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "facts": {"type": "array", "description": "점주가 알려준 가맹점 사실", "items": {"type": "string"}},
+        "strategies": {
+            "type": "array",
+            "description": "상담에서 정한 전략",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "전략 이름"},
+                    "detail": {"type": "string", "description": "실행 방법 / 목표 한 문장"},
+                    "status": {"type": "string", "enum": STRATEGY_STATUS},
+                },
+                "required": ["name", "detail", "status"],
+            },
+        },
+        "numbers": {
+            "type": "array",
+            "description": "대화에서 언급된 수치",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "label": {"type": "string", "description": "무엇의 수치인지"},
+                    "value": {"type": "string", "description": "수치 그대로 (단위 포함)"},
+                },
+                "required": ["label", "value"],
+            },
+        },
+        "open_questions": {"type": "array", "description": "아직 답하지 않은 질문 / 고민", "items": {"type": "string"}},
+    },
+    "required": ["facts", "strategies", "numbers", "open_questions"],
+}
+
+DIGEST_PROMPT = """다음은 상권 마케팅 상담의 누적 노트와 새 대화입니다.
+새 대화 내용을 반영해 노트 전체를 지정된 JSON 형식으로 갱신하세요.
+- facts: 점주가 알려준 가맹점 사실 (운영 시간, 예산, 인력, 이미 하고 있는 것 등)
+- strategies: 전문의가 제안한 전략 (점주가 받아들였으면 합의, 아니면 검토)
+- numbers: 대화에 나온 상관계수, 비율, 목표치를 그대로
+- open_questions: 아직 답하지 않았거나 점주가 고민 중인 점
+기존 항목은 새 대화와 어긋날 때만 고치고, 항목은 한 문장씩, 목록마다 최대 {max_items}개까지 남기세요.
+인사말과 반복 설명은 빼세요.
+
+## 기존 노트
+{digest}
+
+## 새 대화
+{transcript}"""
+
+# 노트 갱신은 세션 간에 공유하는 소수의 스레드에서 처리
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="consultation-digest")
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def parse(text, max_items=DEFAULT_MAX_ITEMS):
+    """모델 응답 → 노트 dict (JSON 이 아니거나 목록 항목이 없으면 None)"""
+    try:
+        data = json.loads(_FENCE.sub("", text or ""))
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(data, dict) or any(not isinstance(data.get(key), list) for key in DIGEST_SCHEMA["required"]):
+        return None
+    return {key: data[key][:max_items] for key in DIGEST_SCHEMA["required"]}
+
+
+def to_text(digest):
+    """처방전 프롬프트에 넣을 노트 (빈 목록은 생략)"""
+    if not digest:
+        return ""
+    blocks = []
+    if digest["facts"]:
+        blocks.append("점주가 알려준 사실:\n" + "\n".join(f"- {fact}" for fact in digest["facts"]))
+    strategies = [s for s in digest["strategies"] if isinstance(s, dict) and s.get("name")]
+    if strategies:
+        blocks.append("상담에서 정한 전략:\n" + "\n".join(
+            f"- [{s.get('status') or '검토'}] {s['name']}: {s.get('detail', '')}" for s in strategies
+        ))
+    numbers = [n for n in digest["numbers"] if isinstance(n, dict) and n.get("value")]
+    if numbers:
+        blocks.append("언급된 수치: " + " · ".join(f"{n.get('label', '')} {n['value']}".strip() for n in numbers))
+    if digest["open_questions"]:
+        blocks.append("남은 질문:\n" + "\n".join(f"- {q}" for q in digest["open_questions"]))
+    return "\n\n".join(blocks)
+
+
+def _first_question(messages):
+    """첫 질문 이전의 안내 메시지를 뺀 대화 시작 위치"""
+    return next((i for i, msg in enumerate(messages) if msg["role"] == "user"), len(messages))
+
+
+class ConsultationDigest:
+    """세션 하나의 상담 노트 (digest 는 messages[:covered] 까지 반영)"""
+
+    def __init__(self, max_tokens=DEFAULT_DIGEST_TOKENS, max_items=DEFAULT_MAX_ITEMS):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.digest = None
+        self.covered = 0
+        self.updates = 0
+        self._messages = []
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._future = None
+
+    def reset(self):
+        with self._lock:
+            self.digest = None
+            self.covered = 0
+            self._messages = []
+            self._generation += 1
+            self._future = None
+
+    def update(self, messages, backend):
+        """새 메시지가 있으면 백그라운드에서 노트 갱신 (진행 중이면 끝난 뒤 이어서 반영)"""
+        if backend is None:
+            return None
+        with self._lock:
+            if len(messages) < self.covered:  # 대화가 초기화됨
+                self.digest, self.covered = None, 0
+                self._generation += 1
+            self._messages = list(messages)
+            if self._future is not None and not self._future.done():
+                return self._future
+            if max(self.covered, _first_question(messages)) >= len(messages):
+                return self._future
+            self._future = _executor.submit(self._run, backend, self._generation)
+            return self._future
+
+    def _run(self, backend, generation):
+        while True:
+            with self._lock:
+                if generation != self._generation:
+                    return None
+                messages, digest = self._messages, self.digest
+                start = max(self.covered, _first_question(messages))
+                pending = messages[start:]
+            if not pending:
+                return digest
+            updated = self._refresh(backend, digest, pending)
+            if updated is None:
+                return None  # 다음 턴에 밀린 메시지와 함께 다시 시도
+            with self._lock:
+                if generation != self._generation:
+                    return None
+                self.digest = updated
+                self.covered = start + len(pending)
+                self.updates += 1
+
+    def _refresh(self, backend, digest, pending):
+        prompt = DIGEST_PROMPT.format(
+            max_items=self.max_items,
+            digest=json.dumps(digest, ensure_ascii=False) if digest else "(없음)",
+            transcript=format_turns(pending),
+        )
+        options = {"max_output_tokens": self.max_tokens, "response_mime_type": "application/json",
+                   "response_schema": DIGEST_SCHEMA}
+        if hasattr(backend, "route"):
+            options["route"] = backend.route(STAGE, estimate_tokens(prompt))
+        started = time.perf_counter()
+        try:
+            text = backend.generate(prompt, **options).text
+        except Exception:
+            metrics.inc("consultation_digest_total", result="error")
+            logger.exception("상담 노트 갱신 실패")
+            return None
+        metrics.observe("consultation_digest_seconds", time.perf_counter() - started)
+        updated = parse(text, self.max_items)
+        metrics.inc("consultation_digest_total", result="ok" if updated is not None else "invalid_json")
+        return updated
+
+    def wait(self, timeout=None):
+        """진행 중인 갱신이 끝날 때까지 대기 (시간 초과면 그대로 진행)"""
+        future = self._future
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def context(self, messages, backend=None, timeout=DEFAULT_WAIT):
+        """처방전 프롬프트에 넣을 상담 기록 (노트 + 아직 반영되지 않은 메시지)
+
+        밀린 메시지가 있으면 갱신을 시작하고 timeout 초까지 기다린 뒤, 그래도 남은 메시지는 줄여서 덧붙인다.
+        """
+        self.update(messages, backend)
+        started = time.perf_counter()
+        self.wait(timeout)
+        metrics.observe("consultation_digest_wait_seconds", time.perf_counter() - started)
+        with self._lock:
+            digest, covered = self.digest, self.covered
+        pending = messages[max(covered, _first_question(messages)):]
+        blocks = []
+        note = to_text(digest)
+        if note:
+            blocks.append(note)
+        if pending:
+            blocks.append(f"최근 대화 (노트 반영 전):\n{format_turns(pending, PENDING_WIDTH)}")
+        return "\n\n".join(blocks)
@@ -0,0 +1,99 @@
+"""고정 프롬프트 앞부분의 공급자측 컨텍스트 캐시 관리
+
+역할/원칙 + 단계별 지시 + 압축한 보고서 전체는 모든 세션의 모든 요청에서 같으므로
+단계마다 한 번만 백엔드 캐시(Gemini CachedContent, 스텁은 흉내)로 등록하고
+요청에는 뒷부분만 보낸다. 참고 문서 버전이 바뀌면 기존 캐시를 지우고 새로 만든다.
+"""
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 기본값
+DEFAULT_TTL = 3600            # 캐시 유지 시간 (초)
+REFRESH_MARGIN = 120          # 만료 이만큼 전에 새로 만듦 (초)
+RETRY_AFTER = 600             # 등록 실패 후 다시 시도하기까지 (초)
+
+
+class ContextCacheManager:
+    """(단계, 문서 버전)별 CachedContext 보관 (프로세스당 1개, 세션 간 공유)"""
+
+    def __init__(self, backend, ttl=DEFAULT_TTL, min_tokens=0, refresh_margin=REFRESH_MARGIN, retry_after=RETRY_AFTER):
+        self.backend = backend
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.version = None
+        self._entries = {}        # 키 → CachedContext
+        self._failed = {}         # 키 → 실패 시각
+        self._lock = threading.Lock()
+
+    def get(self, key, prefix, version, model=None):
+        """key 단계의 캐시 (없거나 곧 만료되면 등록), 쓸 수 없으면 None"""
+        now = time.time()
+        with self._lock:
+            if version != self.version:
+                self._drop_all()
+                self.version = version
+            cached = self._entries.get(key)
+            if cached is not None and cached.expires_at - self.refresh_margin > now:
+                return cached
+            if now - self._failed.get(key, -self.retry_after) < self.retry_after:
+                return None
+            if self.min_tokens and self.backend.count_tokens(prefix, model) < self.min_tokens:
+                self._failed[key] = now
+                return None
+            # 등록은 드물어서 잠금을 잡은 채로 진행 (같은 캐시를 동시에 여러 번 만들지 않음)
+            started = time.perf_counter()
+            try:
+                fresh = self.backend.create_context_cache(
+                    prefix, self.ttl, model=model, display_name=f"clinic-{key}-{version}"[:128],
+                )
+            except Exception as e:
+                self._failed[key] = now
+                metrics.inc("context_cache_errors_total", stage=key)
+                logger.warning("컨텍스트 캐시 등록 실패 (%s): %s", key, e)
+                return None
+            metrics.inc("context_cache_created_total", stage=key)
+            metrics.observe("context_cache_create_seconds", time.perf_counter() - started, stage=key)
+            if cached is not None:
+                self._delete(cached)
+            self._entries[key] = fresh
+            self._failed.pop(key, None)
+            return fresh
+
+    def forget(self, key):
+        """백엔드에서 만료된 캐시 제거 (다음 get 에서 새로 등록)"""
+        with self._lock:
+            cached = self._entries.pop(key, None)
+        if cached is not None:
+            self._delete(cached)
+
+    def invalidate(self, *_):
+        """모든 캐시 삭제 (참고 문서 변경 알림용)"""
+        with self._lock:
+            self._drop_all()
+            self.version = None
+
+    def _drop_all(self):
+        for cached in self._entries.values():
+            self._delete(cached)
+        self._entries.clear()
+        self._failed.clear()
+
+    def _delete(self, cached):
+        try:
+            self.backend.delete_context_cache(cached)
+        except Exception as e:
+            logger.warning("컨텍스트 캐시 삭제 실패: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": {key: cached.tokens for key, cached in self._entries.items()},
+            }
@@ -0,0 +1,269 @@
+"""상관 데이터 저장소 (Parquet 열 기반 파일 + 조회 인덱스)
+
+신한카드 빅데이터 분석 결과(피처별 상관계수/지표)를 data/correlations.parquet 에 한 행씩 둔다.
+업종 × 상권 × 고객층 × 사전 질문을 키로 하는 인덱스를 프로세스당 1회 만들어
+- 화면: 질문별 표 (DataFrame, 조건별로 1회만 생성)
+- 프롬프트: 가맹점 조건에 맞는 행만 짧은 표로 (보고서 HTML 을 통째로 넣지 않음)
+에 쓴다. 키 값 "*" 는 모든 업종/상권/고객층에 해당하는 행이다.
+새 지역·업종 데이터는 코드 수정 없이 행만 추가하면 된다:
+
+    python correlations.py export > rows.csv      # 현재 데이터
+    python correlations.py import rows.csv         # CSV 행 추가 (같은 키+피처는 교체)
+"""
+import argparse
+import csv
+import hashlib
+import logging
+import os
+import sys
+import threading
+from dataclasses import dataclass, fields
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "correlations.parquet")
+ANY = "*"
+
+# 프롬프트에 넣을 최대 행 수
+DEFAULT_PROMPT_ROWS = 8
+
+
+@dataclass(frozen=True)
+class CorrelationRow:
+    """상관 데이터 한 행"""
+    question: int           # 사전 질문 번호 (1~5)
+    topic: str              # 표 이름 (예: 재방문율)
+    business_type: str      # 업종 또는 "*"
+    location_detail: str    # 상권 유형 또는 "*"
+    demographic: str        # 고객층(예: 여성 30대) 또는 "*"
+    feature: str
+    metric: str             # 표 열 이름: 상관계수 / 값
+    value: str              # 표시값
+    coefficient: float = None   # 수치인 경우 (정렬용)
+    rank: int = 0           # 표 안 순서
+
+    @property
+    def specificity(self):
+        """와일드카드가 아닌 키 수 (클수록 가맹점 조건에 딱 맞는 행)"""
+        return sum(key != ANY for key in (self.business_type, self.location_detail, self.demographic))
+
+
+COLUMNS = [f.name for f in fields(CorrelationRow)]
+
+
+def _demographics(store_info):
+    """store_info 의 주요 고객층 문자열 → 고객층 목록"""
+    text = (store_info or {}).get("customer_demographics") or ""
+    return [part.strip() for part in text.split(",") if part.strip() and part.strip() != "미선택"]
+
+
+class CorrelationStore:
+    """상관 데이터 + 조회 인덱스 (프로세스당 1개, 첫 사용 또는 warm_up() 때 파일을 읽음)"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._rows = None
+        self._version = None
+        self._index = {}        # (업종, 상권, 고객층, 질문) → [행]
+        self._questions = ()
+        self._tables = {}       # (질문, 업종, 상권, 고객층들) → DataFrame
+        self._lock = threading.Lock()
+
+    # ---------- 로드 ----------
+    def _load(self):
+        with self._lock:
+            if self._rows is not None:
+                return
+            with metrics.span("correlation_load"):
+                rows = read_rows(self.path)
+                index = {}
+                for row in sorted(rows, key=lambda r: (r.question, r.rank)):
+                    key = (row.business_type, row.location_detail, row.demographic, row.question)
+                    index.setdefault(key, []).append(row)
+                self._index = index
+                self._questions = tuple(sorted({row.question for row in rows}))
+                self._version = rows_version(rows)
+                self._rows = rows
+
+    def warm_up(self):
+        """파일 읽기 + 인덱스 생성 (서버 시작 시 백그라운드에서 호출)"""
+        self._load()
+        return len(self._rows)
+
+    @property
+    def rows(self):
+        self._load()
+        return self._rows
+
+    @property
+    def version(self):
+        """읽은 행 내용의 해시 (행을 추가/교체하면 바뀜 → 응답 캐시 키에 포함)"""
+        self._load()
+        return self._version
+
+    @property
+    def questions(self):
+        self._load()
+        return self._questions
+
+    # ---------- 조회 ----------
+    def lookup(self, store_info=None, question=None):
+        """가맹점 조건에 맞는 행 (피처별로 가장 구체적인 행 1개, 구체적인 것 → 표 순서)
+
+        question 이 없으면 store_info 의 question_type, 그것도 없으면 모든 질문.
+        """
+        self._load()
+        info = store_info or {}
+        question = question if question is not None else info.get("question_type")
+        questions = (question,) if question else self._questions
+        business_types = {info.get("business_type") or ANY, ANY}
+        locations = {info.get("location_detail") or ANY, ANY}
+        demographics = set(_demographics(info)) | {ANY}
+
+        best = {}
+        for q in questions:
+            for business_type in business_types:
+                for location in locations:
+                    for demographic in demographics:
+                        for row in self._index.get((business_type, location, demographic, q), ()):
+                            key = (row.question, row.feature, row.demographic)
+                            current = best.get(key)
+                            if current is None or row.specificity > current.specificity:
+                                best[key] = row
+        return sorted(best.values(), key=lambda r: (-r.specificity, r.question, r.rank))
+
+    def table(self, question, store_info=None):
+        """화면용 표 (피처 / 상관계수 또는 값) — 조건별 1회만 만들고 재사용, 행이 없으면 None"""
+        info = store_info or {}
+        key = (question, info.get("business_type"), info.get("location_detail"), tuple(sorted(_demographics(info))))
+        table = self._tables.get(key)
+        if table is None:
+            rows = sorted(self.lookup(info, question), key=lambda r: r.rank)
+            if not rows:
+                return None
+            import pandas as pd  # 표를 처음 그릴 때만 필요 (보통은 예열 스레드가 먼저 불러둠)
+            metric_names = {row.metric for row in rows}
+            if metric_names == {"상관계수"} and all(row.coefficient is not None for row in rows):
+                column, values = "상관계수", [row.coefficient for row in rows]
+            else:
+                column, values = (rows[0].metric if len(metric_names) == 1 else "값"), [row.value for row in rows]
+            table = pd.DataFrame({"피처 (Feature)": [row.feature for row in rows], column: values})
+            with self._lock:
+                self._tables[key] = table
+        return table
+
+    def prompt_block(self, store_info, limit=DEFAULT_PROMPT_ROWS):
+        """프롬프트용 짧은 표 (조건에 맞는 행만, 없으면 빈 문자열)
+
+        질문이 정해지지 않은 접수는 가맹점 조건에 맞는 행 → 상관계수 절댓값 큰 순으로 limit 개.
+        """
+        rows = self.lookup(store_info)
+        if not (store_info or {}).get("question_type"):
+            rows = sorted(rows, key=lambda r: (-r.specificity, -abs(r.coefficient or 0.0), r.question, r.rank))
+        # 고른 행은 표(질문)별로 묶어서 출력
+        rows = sorted(rows[:limit], key=lambda r: (r.question, -r.specificity, r.rank))
+        if not rows:
+            return ""
+        lines, topic = [], None
+        for row in rows:
+            if row.topic != topic:
+                topic = row.topic
+                lines.append(f"[{topic}]")
+            scope = ", ".join(key for key in (row.business_type, row.location_detail, row.demographic) if key != ANY)
+            lines.append(f"- {row.feature}: {row.metric} {row.value}" + (f" ({scope})" if scope else ""))
+        return "\n".join(lines)
+
+
+# ==================== 파일 읽기 / 쓰기 ====================
+def read_rows(path):
+    """Parquet → [CorrelationRow] (파일이 없거나 읽을 수 없으면 빈 목록)"""
+    try:
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=COLUMNS)
+    except Exception as e:
+        logger.warning("상관 데이터 읽기 실패 (%s): %s", path, e)
+        return []
+    return [_row(record) for record in table.to_pylist()]
+
+
+def rows_version(rows):
+    """행 목록 해시 (파일 안의 행 순서와 무관)"""
+    digest = hashlib.sha256()
+    for line in sorted(repr(tuple(getattr(row, name) for name in COLUMNS)) for row in rows):
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def write_rows(path, rows):
+    """[CorrelationRow] → Parquet (임시 파일에 쓰고 교체)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ("question", pa.int16()), ("topic", pa.string()), ("business_type", pa.string()),
+        ("location_detail", pa.string()), ("demographic", pa.string()), ("feature", pa.string()),
+        ("metric", pa.string()), ("value", pa.string()), ("coefficient", pa.float64()), ("rank", pa.int16()),
+    ])
+    rows = sorted(rows, key=lambda r: (r.question, r.business_type, r.location_detail, r.demographic, r.rank))
+    table = pa.Table.from_pylist([{name: getattr(row, name) for name in COLUMNS} for row in rows], schema=schema)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def _row(record):
+    coefficient = record.get("coefficient")
+    if coefficient in ("", None):
+        coefficient = None
+    else:
+        coefficient = float(coefficient)
+    return CorrelationRow(
+        question=int(record["question"]),
+        topic=str(record["topic"]),
+        business_type=str(record.get("business_type") or ANY),
+        location_detail=str(record.get("location_detail") or ANY),
+        demographic=str(record.get("demographic") or ANY),
+        feature=str(record["feature"]),
+        metric=str(record.get("metric") or "상관계수"),
+        value=str(record.get("value") or (coefficient if coefficient is not None else "")),
+        coefficient=coefficient,
+        rank=int(record.get("rank") or 0),
+    )
+
+
+def merge_rows(existing, added):
+    """같은 (질문, 업종, 상권, 고객층, 피처) 행은 새 행으로 교체"""
+    def key(row):
+        return (row.question, row.business_type, row.location_detail, row.demographic, row.feature)
+    merged = {key(row): row for row in existing}
+    merged.update((key(row), row) for row in added)
+    return list(merged.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="상관 데이터 파일 관리")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="CSV 로 출력")
+    importer = commands.add_parser("import", help="CSV 행 추가 (같은 키+피처는 교체)")
+    importer.add_argument("csv_path")
+    importer.add_argument("--replace", action="store_true", help="기존 행을 모두 지우고 CSV 로 교체")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in read_rows(args.path):
+            writer.writerow({name: "" if getattr(row, name) is None else getattr(row, name) for name in COLUMNS})
+        return
+    with open(args.csv_path, encoding="utf-8-sig", newline="") as f:
+        added = [_row(record) for record in csv.DictReader(f)]
+    rows = added if args.replace else merge_rows(read_rows(args.path) if os.path.exists(args.path) else [], added)
+    write_rows(args.path, rows)
+    print(f"{len(added)}행 반영 → 총 {len(rows)}행 ({args.path})")
+
+
+if __name__ == "__main__":
+    main()
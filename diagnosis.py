@@ -0,0 +1,221 @@
+"""초기 진단 구조화 출력 (JSON 스키마 / 파싱 / 화면용 마크다운 / 프롬프트용 요약)
+
+초기 진단은 자유 형식 대신 DIAGNOSIS_SCHEMA 에 맞는 JSON 으로 받는다 (Gemini response_schema).
+- 화면: 파싱한 항목으로 기존 "초기 검사 결과" 형식의 마크다운을 만든다 (to_markdown)
+- 이후 프롬프트(상담 / 처방전): 마크다운 전체 대신 한 줄 요약만 넣는다 (compact)
+진단 결과는 세션에 initial(마크다운)과 structured(JSON 객체)로 저장하며,
+structured 가 없는 이전 세션은 initial 을 그대로 쓴다 (context).
+JSON 이 잘리거나 깨진 응답은 출력 상한을 늘려 한 번 더 받고 (generate), 그래도 안 되면 DiagnosisError —
+깨진 원문은 화면 / 응답 캐시 / 이후 프롬프트 어디에도 넣지 않는다.
+"""
+import json
+import re
+
+import metrics
+
+# 스키마가 바뀌면 올림 (응답 캐시 키에 포함)
+SCHEMA_VERSION = 1
+
+# JSON 을 읽지 못했을 때 다시 받을 때의 최대 출력 토큰 배율 (보통 출력 상한에서 잘린 경우)
+RETRY_OUTPUT_FACTOR = 2
+
+TRADE_AREA_TYPES = ["유동형", "거주형", "직장형"]
+
+
+def _number(description):
+    return {"type": "number", "description": description, "nullable": True}
+
+
+# Gemini response_schema (OpenAPI 부분집합) — 수치는 참고 자료에 없으면 null
+DIAGNOSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "trade_area": {
+            "type": "object",
+            "description": "상권 유형",
+            "properties": {
+                "type": {"type": "string", "enum": TRADE_AREA_TYPES},
+                "store_count": {"type": "integer", "description": "근거가 된 신한카드 매장 수", "nullable": True},
+                "floating_ratio": _number("유동 고객 비율(%)"),
+                "resident_ratio": _number("거주 고객 비율(%)"),
+                "basis": {"type": "string", "description": "판단 근거 한 문장"},
+            },
+            "required": ["type", "basis"],
+        },
+        "customers": {
+            "type": "object",
+            "description": "고객 분석",
+            "properties": {
+                "segment": {"type": "string", "description": "주 고객층"},
+                "insight": {"type": "string", "description": "신한카드 데이터상 특징 한 문장"},
+                "sales_share": _number("주 고객층 매출건수 비중(%)"),
+                "revisit_correlation": _number("재방문율과의 상관계수 (-1~1)"),
+            },
+            "required": ["segment", "insight"],
+        },
+        "problem": {
+            "type": "object",
+            "description": "핵심 문제",
+            "properties": {
+                "concern": {"type": "string", "description": "점주 고민 요약"},
+                "cause": {"type": "string", "description": "핵심 원인 1가지"},
+                "evidence": {"type": "string", "description": "원인의 데이터 근거 한 문장"},
+                "correlation": _number("근거 상관계수 (-1~1)"),
+            },
+            "required": ["concern", "cause", "evidence"],
+        },
+        "prescription": {
+            "type": "object",
+            "description": "우선 처방",
+            "properties": {
+                "action": {"type": "string", "description": "즉시 실행 가능한 액션 1개"},
+                "expected_effect": {"type": "string", "description": "기대 효과 (수치 포함)"},
+            },
+            "required": ["action"],
+        },
+    },
+    "required": ["trade_area", "customers", "problem", "prescription"],
+}
+
+
+# ==================== 파싱 ====================
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def _coerce_number(value):
+    if value in (None, ""):
+        return None
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except ValueError:
+        return None
+
+
+class DiagnosisError(ValueError):
+    """다시 받아도 진단 JSON 을 읽지 못함"""
+
+
+def _parse(text):
+    """모델 응답 → (진단 dict 또는 None, 결과 ok / invalid_json / missing_field)"""
+    try:
+        data = json.loads(_FENCE.sub("", text or ""))
+    except (json.JSONDecodeError, TypeError):
+        return None, "invalid_json"
+    if not isinstance(data, dict):
+        return None, "invalid_json"
+    for name, schema in DIAGNOSIS_SCHEMA["properties"].items():
+        section = data.get(name)
+        if not isinstance(section, dict) or any(not section.get(key) for key in schema["required"]):
+            return None, "missing_field"
+        for key, spec in schema["properties"].items():
+            if spec["type"] in ("number", "integer"):
+                section[key] = _coerce_number(section.get(key))
+    return data, "ok"
+
+
+def parse(text):
+    """모델 응답 → 진단 dict (필수 항목이 없거나 JSON 이 아니면 None)"""
+    return _parse(text)[0]
+
+
+def valid(text):
+    """응답 캐시에 넣어도 되는 진단 응답인지 (JSON 으로 읽히는지)"""
+    return parse(text) is not None
+
+
+# ==================== 출력 ====================
+def _percent(value):
+    return f"{value:g}%" if value is not None else None
+
+
+def _corr(value):
+    return f"{value:+.2f}" if value is not None else None
+
+
+def _joined(*parts, sep=", "):
+    return sep.join(part for part in parts if part)
+
+
+def to_markdown(data):
+    """화면용 "초기 검사 결과" 마크다운 (이전 자유 형식과 같은 구성)"""
+    area, customers, problem, action = (data[k] for k in ("trade_area", "customers", "problem", "prescription"))
+    composition = _joined(
+        f"유동{_percent(area['floating_ratio'])}" if area.get("floating_ratio") is not None else "",
+        f"거주{_percent(area['resident_ratio'])}" if area.get("resident_ratio") is not None else "",
+        sep="/",
+    )
+    area_basis = _joined(
+        f"신한카드 {area['store_count']:.0f}개 매장" if area.get("store_count") is not None else "",
+        f"고객 구성 {composition}" if composition else "",
+        area.get("basis"),
+    )
+    customer_numbers = _joined(
+        f"매출건수 {_percent(customers['sales_share'])}" if customers.get("sales_share") is not None else "",
+        f"재방문 상관 {_corr(customers['revisit_correlation'])}" if customers.get("revisit_correlation") is not None else "",
+    )
+    problem_basis = _joined(
+        problem.get("evidence"),
+        f"상관계수 {_corr(problem['correlation'])}" if problem.get("correlation") is not None else "",
+    )
+    lines = [
+        "## 🔬 초기 검사 결과",
+        f"**📍 상권 유형:** {area['type']} (근거: {area_basis})",
+        f"**👥 고객 분석:** 주 고객층은 {customers['segment']}으로 추정. {customers['insight']}"
+        + (f" ({customer_numbers})" if customer_numbers else ""),
+        f"**⚠️ 핵심 문제:** {problem['concern']} → 원인은 {problem['cause']} ({problem_basis})",
+        f"**💊 우선 처방:** {action['action']}"
+        + (f" (기대 효과: {action['expected_effect']})" if action.get("expected_effect") else ""),
+    ]
+    return "\n\n".join(lines)
+
+
+def compact(data):
+    """이후 프롬프트에 넣을 한 줄 요약 (항목명 약어 + 수치만)"""
+    area, customers, problem, action = (data[k] for k in ("trade_area", "customers", "problem", "prescription"))
+    area_numbers = _joined(
+        f"매장 {area['store_count']:.0f}" if area.get("store_count") is not None else "",
+        f"유동 {_percent(area['floating_ratio'])}" if area.get("floating_ratio") is not None else "",
+        f"거주 {_percent(area['resident_ratio'])}" if area.get("resident_ratio") is not None else "",
+    )
+    customer_numbers = _joined(
+        f"매출 {_percent(customers['sales_share'])}" if customers.get("sales_share") is not None else "",
+        f"재방문 r={_corr(customers['revisit_correlation'])}" if customers.get("revisit_correlation") is not None else "",
+    )
+    return " | ".join([
+        f"상권: {area['type']}" + (f" ({area_numbers})" if area_numbers else ""),
+        f"고객: {customers['segment']} - {customers['insight']}" + (f" ({customer_numbers})" if customer_numbers else ""),
+        f"문제: {problem['cause']}" + (f" (r={_corr(problem['correlation'])})" if problem.get("correlation") is not None else ""),
+        f"우선 처방: {action['action']}",
+    ])
+
+
+def result_fields(text):
+    """모델 응답 → 세션에 저장할 항목 {initial, structured} (읽지 못하면 None, diagnosis_parse_total 에 기록)"""
+    data, outcome = _parse(text)
+    metrics.inc("diagnosis_parse_total", result=outcome)
+    if data is None:
+        return None
+    return {"initial": to_markdown(data), "structured": data}
+
+
+def generate(call, max_output_tokens):
+    """call(max_output_tokens) → 응답 텍스트 로 진단을 받아 {initial, structured} 반환
+
+    JSON 을 읽지 못하면 최대 출력 토큰을 RETRY_OUTPUT_FACTOR 배로 늘려 한 번 더 받고,
+    그래도 안 되면 DiagnosisError (원문은 버림).
+    """
+    for attempt, limit in enumerate((max_output_tokens, max_output_tokens * RETRY_OUTPUT_FACTOR)):
+        if attempt:
+            metrics.inc("diagnosis_retries_total")
+        result = result_fields(call(limit))
+        if result is not None:
+            return result
+    raise DiagnosisError("진단 결과를 읽지 못했습니다. 잠시 후 다시 시도해 주세요.")
+
+
+def context(diagnosis_result):
+    """상담 / 처방전 프롬프트에 넣을 진단 (구조화 결과가 있으면 한 줄 요약, 없으면 원문)"""
+    result = diagnosis_result or {}
+    if result.get("structured"):
+        return compact(result["structured"])
+    return result.get("initial", "")
@@ -0,0 +1,282 @@
+"""참고 보고서 섹션 단위 검색
+
+보고서 HTML의 <section id="..."> 단위로 텍스트를 뽑아 인덱스를 만들고,
+가맹점 정보(store_info)와 관련된 섹션만 토큰 예산 안에서 골라 프롬프트에 넣는다.
+"""
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+# 기본 토큰 예산 (참고 자료 부분에만 적용, 섹션 경로 머리줄 포함)
+DEFAULT_TOKEN_BUDGET = 1500
+
+# render 에서 섹션 사이 구분
+_SECTION_SEPARATOR = "\n\n"
+
+# 블록 단위 태그 (앞뒤로 줄바꿈)
+_BLOCK_TAGS = {"p", "ul", "ol", "div", "h1", "h2", "h3", "h4", "br"}
+_HEADING_PREFIX = {"h1": "# ", "h2": "## ", "h3": "### ", "h4": "#### "}
+_SKIP_TAGS = {"style", "script", "head", "title"}
+
+# 상권 특성 → 관련 섹션
+LOCATION_SECTIONS = {
+    "역세권": ["A_유동형", "Q4_problem1"],
+    "주택가": ["A_거주형", "Q4_problem2"],
+    "오피스": ["A_직장형", "Q4_problem3"],
+}
+
+# 손님 특성 → 고객 패턴 섹션
+CUSTOMER_TYPE_SECTIONS = {
+    "단골 손님 많음": ["B_충성형"],
+    "신규 고객 많음": ["B_체험형"],
+    "단골/신규 비슷": ["B_확장형"],
+    "단골 손님 적음": ["B_체험형", "B_위기형"],
+}
+
+# 사전 질문 번호 → 보고서 최상위 섹션
+QUESTION_SECTIONS = {1: "Q1", 2: "Q2", 3: "Q3", 4: "Q4", 5: "Q5"}
+
+# 선택 가중치
+_WEIGHT_QUESTION = 10.0
+_WEIGHT_LOCATION = 6.0
+_WEIGHT_CUSTOMER = 5.0
+_WEIGHT_DEMOGRAPHIC = 4.0
+_WEIGHT_KEYWORD = 0.5
+
+# 이 점수 미만 섹션은 예산이 남아도 넣지 않음 (키워드 1~2개 우연 일치 제외)
+MIN_SCORE = 1.5
+
+
+def estimate_tokens(text):
+    """대략적인 토큰 수 추정 (한글 약 1.5자/토큰, 영문·숫자 약 4자/토큰)"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return int(non_ascii / 1.5 + ascii_chars / 4) + 1
+
+
+@dataclass
+class Section:
+    """보고서 섹션 하나 (하위 섹션 본문은 제외한 자체 본문만 보관)"""
+    id: str
+    parent: str = None
+    title: str = ""
+    order: int = 0
+    text: str = ""
+    tokens: int = 0
+    children: list = field(default_factory=list)
+
+
+class _SectionParser(HTMLParser):
+    """<section> 중첩 구조를 따라가며 섹션별 텍스트를 모은다"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = {}
+        self._stack = []       # 열린 section id
+        self._tag_stack = []   # 열린 section 태그 깊이 추적용
+        self._buffers = {}
+        self._skip = 0
+        self._heading = None
+        self._list_depth = 0
+
+    def _current(self):
+        return self._stack[-1] if self._stack else None
+
+    def _write(self, text):
+        current = self._current()
+        if current is not None:
+            self._buffers[current].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+            return
+        if tag == "section":
+            section_id = dict(attrs).get("id")
+            if section_id:
+                section = Section(id=section_id, parent=self._current(), order=len(self.sections))
+                self.sections[section_id] = section
+                if section.parent:
+                    self.sections[section.parent].children.append(section_id)
+                self._stack.append(section_id)
+                self._buffers[section_id] = []
+            self._tag_stack.append(bool(section_id))
+            return
+        if tag in ("ul", "ol"):
+            self._list_depth += 1
+        if tag == "li":
+            self._write("\n" + "  " * max(self._list_depth - 1, 0) + "- ")
+        elif tag in _HEADING_PREFIX:
+            self._heading = tag
+            self._write("\n" + _HEADING_PREFIX[tag])
+        elif tag in _BLOCK_TAGS:
+            self._write("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+            return
+        if tag == "section":
+            if self._tag_stack and self._tag_stack.pop():
+                self._stack.pop()
+            return
+        if tag in ("ul", "ol"):
+            self._list_depth = max(self._list_depth - 1, 0)
+        if tag in _BLOCK_TAGS:
+            self._write("\n")
+        if tag == self._heading:
+            self._heading = None
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        text = re.sub(r"\s+", " ", data)
+        if not text.strip():
+            return
+        current = self._current()
+        if current is not None and self._heading and not self.sections[current].title:
+            self.sections[current].title = text.strip()
+        self._write(text)
+
+
+def _compact(text):
+    """공백/빈 줄 정리"""
+    lines = [line.rstrip() for line in text.split("\n")]
+    lines = [re.sub(r"(?<=\S) {2,}", " ", line) for line in lines if line.strip()]
+    return "\n".join(lines)
+
+
+class ReferenceIndex:
+    """보고서 섹션 인덱스 (문서 1회 파싱 후 재사용)"""
+
+    def __init__(self, sections):
+        self.sections = sections
+        self._terms = {sid: set(_terms(s.title + " " + s.text)) for sid, s in sections.items()}
+        # 예산 계산용: 경로 머리줄 + 본문 + 구분까지 넣은 토큰 수
+        # (부분별 추정치의 합은 이어 붙인 전체 추정치 이상이라 예산이 실제 상한이 됨)
+        self._rendered_tokens = {
+            sid: estimate_tokens(_SECTION_SEPARATOR + self._block(s)) for sid, s in sections.items()
+        }
+
+    @classmethod
+    def from_html(cls, html):
+        parser = _SectionParser()
+        parser.feed(html or "")
+        parser.close()
+        for section_id, section in parser.sections.items():
+            section.text = _compact("".join(parser._buffers[section_id]))
+            section.tokens = estimate_tokens(section.text)
+        return cls(parser.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    @property
+    def total_tokens(self):
+        return sum(s.tokens for s in self.sections.values())
+
+    def score(self, store_info, query=""):
+        """store_info(+질문)에 대한 섹션별 관련도 점수"""
+        store_info = store_info or {}
+        scores = {}
+
+        def add(section_id, weight):
+            if section_id in self.sections:
+                scores[section_id] = scores.get(section_id, 0.0) + weight
+
+        question = QUESTION_SECTIONS.get(store_info.get("question_type"))
+        if question:
+            add(question, _WEIGHT_QUESTION)
+            for section_id in self._descendants(question):
+                add(section_id, _WEIGHT_QUESTION / 2)
+
+        location_detail = store_info.get("location_detail", "")
+        for keyword, section_ids in LOCATION_SECTIONS.items():
+            if keyword in location_detail:
+                for section_id in section_ids:
+                    add(section_id, _WEIGHT_LOCATION)
+
+        for section_id in CUSTOMER_TYPE_SECTIONS.get(store_info.get("customer_type", ""), []):
+            add(section_id, _WEIGHT_CUSTOMER)
+
+        for section_id in demographic_sections(store_info.get("customer_demographics", "")):
+            add(section_id, _WEIGHT_DEMOGRAPHIC)
+
+        query_terms = set(_terms(" ".join([
+            store_info.get("concern", ""), store_info.get("business_type", ""), query or ""
+        ])))
+        if query_terms:
+            for section_id, terms in self._terms.items():
+                overlap = len(query_terms & terms)
+                if overlap:
+                    add(section_id, _WEIGHT_KEYWORD * overlap)
+        return scores
+
+    def select(self, store_info, query="", token_budget=DEFAULT_TOKEN_BUDGET, min_score=MIN_SCORE):
+        """관련도 높은 섹션부터 토큰 예산(render 결과의 경로 머리줄 포함) 안에서 선택 (문서 순서로 반환)"""
+        scores = self.score(store_info, query)
+        ranked = sorted(
+            (sid for sid in scores if scores[sid] >= min_score),
+            key=lambda sid: (-scores[sid], self.sections[sid].order),
+        )
+        chosen, used = [], 0
+        for section_id in ranked:
+            section = self.sections[section_id]
+            if not section.text:
+                continue
+            tokens = self._rendered_tokens[section_id]
+            if used + tokens > token_budget:
+                continue
+            chosen.append(section)
+            used += tokens
+        return sorted(chosen, key=lambda s: s.order)
+
+    def render(self, store_info, query="", token_budget=DEFAULT_TOKEN_BUDGET):
+        """선택된 섹션을 프롬프트용 텍스트로 변환 (결과는 token_budget 토큰 이하)"""
+        chosen = self.select(store_info, query, token_budget)
+        return _SECTION_SEPARATOR.join(self._block(s) for s in chosen)
+
+    def _block(self, section):
+        """섹션 하나의 프롬프트용 텍스트 ([경로] 머리줄 + 본문)"""
+        return f"[{self._path(section.id)}]\n{section.text}"
+
+    def _descendants(self, section_id):
+        result = []
+        for child in self.sections[section_id].children:
+            result.append(child)
+            result.extend(self._descendants(child))
+        return result
+
+    def _path(self, section_id):
+        ids = []
+        while section_id:
+            ids.append(section_id)
+            section_id = self.sections[section_id].parent
+        return " > ".join(reversed(ids))
+
+
+def demographic_sections(customer_demographics):
+    """'여성 30대, 남성 50대' → ['C_여성_30대', 'C_50대이상']"""
+    section_ids = []
+    for item in (customer_demographics or "").split(","):
+        match = re.match(r"\s*(남성|여성)\s*(\d+)대", item)
+        if not match:
+            continue
+        gender, age = match.group(1), int(match.group(2))
+        if age >= 50:
+            section_id = "C_50대이상"
+        elif age <= 20:
+            section_id = f"C_{gender}_20대이하"
+        else:
+            section_id = f"C_{gender}_{age}대"
+        if section_id not in section_ids:
+            section_ids.append(section_id)
+    return section_ids
+
+
+def _terms(text):
+    """키워드 매칭용 단어 (2글자 이상, 조사 일부 제거)"""
+    words = re.findall(r"[0-9A-Za-z가-힣]{2,}", text or "")
+    return [re.sub(r"(은|는|이|가|을|를|의|에|로|으로|과|와|도)$", "", w) for w in words]
@@ -0,0 +1,197 @@
+"""느린 요청 헤징 (적응형 대기 기준 + 헤지 비율 상한 + 진 쪽 취소)
+
+응답 지연은 꼬리가 길어서 (p99 가 중앙값의 몇 배) 드물게 느린 호출 하나가 "초기 검사 중..." 을 오래 붙잡는다.
+요청이 단계별 최근 p90 (HEDGE_PERCENTILE) 안에 첫 조각을 못 받으면 같은 요청을 하나 더 보내고,
+먼저 첫 조각(블로킹은 응답)을 받은 쪽을 쓰며 진 쪽은 첫 조각이 오는 즉시 닫는다 (관문 자리 반납, 생성 중단).
+블로킹 generate 는 보낸 호출을 중간에 멈출 수 없어 결과만 버린다.
+헤지는 최근 요청 중 max_rate 비율까지만 보낸다 (추가 호출 비용 상한).
+대기 기준은 헤지 여부와 무관하게 시도 하나하나의 첫 조각 시간으로 만든다 (min_samples 개 전에는 헤지 없음).
+결과는 llm_hedge_total{stage,outcome=primary|hedge_won|primary_won|budget|failed}, 기준은 llm_hedge_threshold_seconds 에 기록한다.
+"""
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+from llm_backend import ClosingPieces, TextStream
+
+DEFAULT_PERCENTILE = 90
+DEFAULT_MAX_RATE = 0.1       # 최근 요청 대비 헤지 비율 상한
+DEFAULT_MIN_SAMPLES = 20     # 단계별 기록이 이보다 적으면 헤지 없음
+DEFAULT_WINDOW = 200         # 단계별 최근 기록 수 (대기 기준 / 헤지 비율)
+DEFAULT_MAX_WORKERS = 32
+
+
+class HedgingBackend:
+    """백엔드(보통 ModelRouter)를 감싸 같은 인터페이스로 제공 (단계는 route= 의 stage, 없으면 모델명)"""
+
+    def __init__(self, backend, percentile=DEFAULT_PERCENTILE, max_rate=DEFAULT_MAX_RATE,
+                 min_samples=DEFAULT_MIN_SAMPLES, window=DEFAULT_WINDOW, max_workers=DEFAULT_MAX_WORKERS):
+        self.backend = backend
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._latency = defaultdict(lambda: deque(maxlen=window))   # 단계 → 시도별 첫 조각 시간
+        self._recent = deque(maxlen=window)                          # 최근 요청의 헤지 여부
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def __getattr__(self, name):
+        # name / model_name / route / stats / create_context_cache 등은 감싼 백엔드 것을 그대로 사용
+        return getattr(self.backend, name)
+
+    # ---------- 기준 / 예산 ----------
+    def threshold(self, stage):
+        """단계별 대기 기준(초), 기록이 부족하면 None"""
+        with self._lock:
+            values = sorted(self._latency[stage])
+        if len(values) < self.min_samples:
+            return None
+        return values[min(len(values) - 1, int(round(self.percentile / 100 * (len(values) - 1))))]
+
+    def _record(self, stage, seconds):
+        with self._lock:
+            self._latency[stage].append(seconds)
+
+    def _allow_hedge(self):
+        """헤지 비율 상한 안이면 True (이번 요청을 최근 요청 기록에 헤지 여부와 함께 추가)"""
+        with self._lock:
+            allowed = (sum(self._recent) + 1) / (len(self._recent) + 1) <= self.max_rate
+            self._recent.append(allowed)
+            return allowed
+
+    def _no_hedge(self):
+        with self._lock:
+            self._recent.append(False)
+
+    # ---------- 시도 ----------
+    def _attempt(self, stage, call, first_piece):
+        """별도 스레드에서 호출 하나 (스트림이면 첫 조각까지) → (결과, 첫 조각 이터레이터 또는 None)"""
+        def run():
+            started = time.perf_counter()
+            result = call()
+            if not first_piece:
+                self._record(stage, time.perf_counter() - started)
+                return result, None, None
+            pieces = iter(result)
+            first = next(pieces, None)
+            self._record(stage, time.perf_counter() - started)
+            return result, pieces, first
+        return self._pool.submit(run)
+
+    @staticmethod
+    def _discard(future):
+        """진 쪽 시도: 아직 시작 전이면 취소, 스트림이면 첫 조각이 오는 대로 닫음"""
+        if future.cancel():
+            return
+
+        def close(done):
+            if done.cancelled() or done.exception() is not None:
+                return
+            result, pieces, _ = done.result()
+            if pieces is not None:
+                pieces.close()
+                result.close()
+
+        future.add_done_callback(close)
+
+    def _race(self, stage, call, first_piece):
+        """대기 기준을 넘기면 헤지를 보내고 먼저 성공한 시도의 결과 (둘 다 실패하면 기본 시도의 오류)"""
+        threshold = self.threshold(stage)
+        primary = self._attempt(stage, call, first_piece)
+        if threshold is None:
+            self._no_hedge()
+            metrics.inc("llm_hedge_total", stage=stage, outcome="primary")
+            return primary.result()
+        metrics.observe("llm_hedge_threshold_seconds", threshold, stage=stage)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            self._no_hedge()
+            metrics.inc("llm_hedge_total", stage=stage, outcome="primary")
+            return primary.result()
+        if not self._allow_hedge():
+            metrics.inc("llm_hedge_total", stage=stage, outcome="budget")
+            return primary.result()
+        hedge = self._attempt(stage, call, first_piece)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, hedge):
+                if future in done and future.exception() is None:
+                    for other in pending:
+                        self._discard(other)
+                    metrics.inc("llm_hedge_total", stage=stage,
+                                outcome="primary_won" if future is primary else "hedge_won")
+                    return future.result()
+        metrics.inc("llm_hedge_total", stage=stage, outcome="failed")
+        return primary.result()
+
+    # ---------- 백엔드 인터페이스 ----------
+    def generate(self, prompt, model=None, **options):
+        stage = options["route"].stage if options.get("route") is not None else (model or self.backend.model_name)
+        result, _, _ = self._race(stage, lambda: self.backend.generate(prompt, model=model, **options), False)
+        return result
+
+    def stream(self, prompt, model=None, **options):
+        """첫 조각을 먼저 받은 스트림을 이어서 읽음"""
+        stage = options["route"].stage if options.get("route") is not None else (model or self.backend.model_name)
+        inner, pieces, first = self._race(stage, lambda: self.backend.stream(prompt, model=model, **options), True)
+
+        closed = []
+
+        def close_once():
+            # 이긴 시도의 스트림(과 그 관문 자리) 반납 — 진 시도는 _discard 가 닫음
+            if not closed:
+                closed.append(True)
+                pieces.close()
+                inner.close()
+
+        def rest():
+            try:
+                if first is not None:
+                    yield first
+                    yield from pieces
+            finally:
+                close_once()
+
+        def finalize(result):
+            result.prompt_tokens = inner.prompt_tokens
+            result.output_tokens = inner.output_tokens
+            result.cached_tokens = inner.cached_tokens
+
+        # 읽기 전에 close 해도 (rest 의 finally 는 돌지 않음) 바로 반납, 닫지 않고 버려진 응답도 반납
+        result = TextStream(ClosingPieces(rest(), close_once), inner.model, finalize)
+        weakref.finalize(result, close_once)
+        return result
+
+    def hedging_stats(self):
+        """최근 헤지 비율과 단계별 대기 기준 (사이드바/벤치마크용)"""
+        with self._lock:
+            recent = list(self._recent)
+            stages = list(self._latency)
+        return {
+            "hedge_rate": sum(recent) / len(recent) if recent else 0.0,
+            "max_rate": self.max_rate,
+            "thresholds": {stage: self.threshold(stage) for stage in stages},
+        }
+
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def hedging_from_settings(backend, get_setting):
+    """HEDGING 설정 (기본 끔, true 면 HEDGE_PERCENTILE / HEDGE_MAX_RATE / HEDGE_MIN_SAMPLES 로 감쌈)"""
+    if str(get_setting("HEDGING", "false")).lower() not in ("1", "true", "yes", "on"):
+        return backend
+    return HedgingBackend(
+        backend,
+        percentile=_float(get_setting("HEDGE_PERCENTILE"), DEFAULT_PERCENTILE),
+        max_rate=_float(get_setting("HEDGE_MAX_RATE"), DEFAULT_MAX_RATE),
+        min_samples=int(_float(get_setting("HEDGE_MIN_SAMPLES"), DEFAULT_MIN_SAMPLES)),
+    )
@@ -0,0 +1,562 @@
+"""LLM 백엔드 (Gemini / 로컬 스텁)
+
+앱은 generate / stream / count_tokens 와 컨텍스트 캐시(create/delete_context_cache)만 사용한다.
+LLM_BACKEND 설정(secrets 또는 환경변수)으로 선택하며, 스텁은 네트워크 없이
+지연시간 분포, 토큰 속도, 오류(429/500/타임아웃)를 흉내 내 부하 테스트에 쓴다.
+"""
+import datetime
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from doc_retrieval import estimate_tokens
+
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+
+
+# ==================== 오류 ====================
+class BackendError(Exception):
+    """모델 호출 오류 (status: HTTP 상태 코드, retryable: 재시도 가능 여부)"""
+    status = None
+    retryable = False
+
+
+class RateLimitError(BackendError):
+    status = 429
+    retryable = True
+
+
+class ServerError(BackendError):
+    status = 500
+    retryable = True
+
+
+class BackendTimeout(BackendError):
+    status = 504
+    retryable = True
+
+
+class ContextCacheExpired(BackendError):
+    """컨텍스트 캐시가 만료/삭제됨 (새로 만들고 다시 호출)"""
+    status = 404
+
+
+# ==================== 응답 ====================
+@dataclass
+class LLMResponse:
+    """모델 응답 한 건"""
+    text: str
+    model: str
+    prompt_tokens: int = None
+    output_tokens: int = None
+    cached_tokens: int = None     # prompt_tokens 중 컨텍스트 캐시에서 읽은 토큰
+    shared: bool = False          # 병합된 요청이 받은 다른 요청의 응답 (토큰 / 비용은 대표 요청이 집계)
+
+
+@dataclass
+class CachedContext:
+    """백엔드에 등록된 고정 앞부분 (컨텍스트 캐시)"""
+    name: str
+    model: str
+    tokens: int
+    expires_at: float
+    resource: object = None       # 백엔드별 원본 객체
+
+
+class TextStream:
+    """조각 단위 응답. 끝까지 읽으면 text / 토큰 수를 채운다."""
+
+    def __init__(self, pieces, model, finalize=None):
+        self._pieces = pieces
+        self._finalize = finalize
+        self.model = model
+        self.text = ""
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.cached_tokens = None
+        self.shared = False   # 병합된 요청이 받은 다른 요청의 응답 (토큰 / 비용은 대표 요청이 집계)
+        self.done = False
+
+    def __iter__(self):
+        parts = []
+        for piece in self._pieces:
+            if piece:
+                parts.append(piece)
+                yield piece
+        self.text = "".join(parts)
+        if self._finalize is not None:
+            self._finalize(self)
+        self.done = True
+
+    def close(self):
+        """끝까지 읽지 않고 중단 (남은 조각은 버림)"""
+        close = getattr(self._pieces, "close", None)
+        if close is not None:
+            close()
+
+
+class ClosingPieces:
+    """조각 이터레이터 (읽기 시작 전에 close 해도 on_close 를 바로 호출)
+
+    제너레이터는 한 번도 next() 하지 않으면 close 해도 finally 가 돌지 않으므로,
+    감싼 스트림(관문 자리, 헤지 시도 등)을 반납하는 일은 on_close 로 따로 넘긴다.
+    """
+
+    def __init__(self, pieces, on_close):
+        self._pieces = pieces
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self._pieces
+
+    def close(self):
+        self._pieces.close()
+        self._on_close()
+
+
+class LLMBackend:
+    """백엔드 공통 인터페이스
+
+    generate / stream 에 cached_context(CachedContext)를 주면 prompt 는 캐시된 앞부분 뒤에 이어지는 부분만 보낸다.
+    """
+    name = "base"
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+
+    def generate(self, prompt, model=None, cached_context=None, **options):
+        raise NotImplementedError
+
+    def stream(self, prompt, model=None, cached_context=None, **options):
+        raise NotImplementedError
+
+    def count_tokens(self, prompt, model=None):
+        return estimate_tokens(prompt)
+
+    def create_context_cache(self, prefix, ttl, model=None, display_name=None):
+        """고정 앞부분을 ttl 초 동안 캐시로 등록하고 CachedContext 반환"""
+        raise NotImplementedError
+
+    def delete_context_cache(self, cached):
+        pass
+
+    def warm_up(self):
+        """첫 요청 전에 미리 연결 (서버 시작 시 백그라운드에서 호출, 기본은 할 일 없음)"""
+
+
+# ==================== Gemini ====================
+class GeminiBackend(LLMBackend):
+    """google.generativeai 기반 백엔드"""
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        super().__init__(model_name)
+        self._api_key = api_key
+        self._genai = None
+        self._genai_lock = threading.Lock()
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        """google.generativeai (첫 사용 시 불러와 API 키 설정 — 약 1초라 첫 화면 뒤로 미룸)"""
+        with self._genai_lock:
+            if self._genai is None:
+                import google.generativeai as genai  # 스텁만 쓸 때는 불러오지 않음
+                genai.configure(api_key=self._api_key)
+                self._genai = genai
+            return self._genai
+
+    def _model(self, name=None):
+        name = name or self.model_name
+        genai = self._client()
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = genai.GenerativeModel(name)
+            return self._models[name]
+
+    def _cached_model(self, cached):
+        genai = self._client()
+        with self._lock:
+            key = ("cached", cached.name)
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel.from_cached_content(cached.resource or cached.name)
+            return self._models[key]
+
+    def warm_up(self, timeout=10):
+        """라이브러리 로드 + 기본 모델 생성 + 토큰 수 조회(무료)로 생성 API 연결을 미리 수립
+
+        예열은 실패해도 되므로 기본 재시도(최대 60초) 없이 timeout 초 안에 끝낸다.
+        """
+        try:
+            self._model().count_tokens("ping", request_options={"timeout": timeout, "retry": None})
+        except Exception as e:
+            raise _translate_error(e) from e
+
+    def _config(self, options):
+        config = {k: v for k, v in options.items() if v is not None}
+        return config or None
+
+    def _call(self, prompt, model, cached_context, options, stream=False):
+        target = self._cached_model(cached_context) if cached_context else self._model(model)
+        try:
+            return target.generate_content(prompt, stream=stream, generation_config=self._config(options))
+        except Exception as e:
+            raise _translate_error(e, cached_context) from e
+
+    def generate(self, prompt, model=None, cached_context=None, **options):
+        response = self._call(prompt, model, cached_context, options)
+        try:
+            text = response.text
+        except Exception as e:
+            raise _translate_error(e) from e
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            text=text,
+            model=model or self.model_name,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+            cached_tokens=getattr(usage, "cached_content_token_count", None),
+        )
+
+    def stream(self, prompt, model=None, cached_context=None, **options):
+        response = self._call(prompt, model, cached_context, options, stream=True)
+
+        def pieces():
+            try:
+                for chunk in response:
+                    try:
+                        yield chunk.text
+                    except ValueError:  # 안전 필터 등으로 텍스트 없는 조각
+                        continue
+            except Exception as e:
+                raise _translate_error(e) from e
+
+        def finalize(result):
+            usage = getattr(response, "usage_metadata", None)
+            result.prompt_tokens = getattr(usage, "prompt_token_count", None)
+            result.output_tokens = getattr(usage, "candidates_token_count", None)
+            result.cached_tokens = getattr(usage, "cached_content_token_count", None)
+
+        return TextStream(pieces(), model or self.model_name, finalize)
+
+    def count_tokens(self, prompt, model=None):
+        try:
+            return self._model(model).count_tokens(prompt).total_tokens
+        except Exception:
+            return estimate_tokens(prompt)
+
+    def create_context_cache(self, prefix, ttl, model=None, display_name=None):
+        # 캐시는 버전이 고정된 모델명(예: gemini-1.5-flash-001)에서만 만들 수 있음
+        model = model or self.model_name
+        try:
+            resource = self._client().caching.CachedContent.create(
+                model=model if model.startswith("models/") else f"models/{model}",
+                display_name=display_name,
+                system_instruction=prefix,
+                ttl=datetime.timedelta(seconds=ttl),
+            )
+        except Exception as e:
+            raise _translate_error(e) from e
+        return CachedContext(
+            name=resource.name,
+            model=model,
+            tokens=resource.usage_metadata.total_token_count,
+            expires_at=time.time() + ttl,
+            resource=resource,
+        )
+
+    def delete_context_cache(self, cached):
+        with self._lock:
+            self._models.pop(("cached", cached.name), None)
+        try:
+            (cached.resource or self._client().caching.CachedContent.get(cached.name)).delete()
+        except Exception:
+            pass  # 이미 만료된 경우
+
+
+def _translate_error(error, cached_context=None):
+    """google.api_core 예외 → BackendError 계열"""
+    if isinstance(error, BackendError):
+        return error
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return error
+    if cached_context is not None and isinstance(error, (gexc.NotFound, gexc.PermissionDenied)):
+        return ContextCacheExpired(str(error))
+    if isinstance(error, gexc.ResourceExhausted):
+        return RateLimitError(str(error))
+    if isinstance(error, gexc.DeadlineExceeded):
+        return BackendTimeout(str(error))
+    if isinstance(error, (gexc.InternalServerError, gexc.ServiceUnavailable, gexc.BadGateway)):
+        return ServerError(str(error))
+    return error
+
+
+# ==================== 로컬 스텁 ====================
+@dataclass
+class StubProfile:
+    """스텁 동작 설정
+
+    latency: 첫 토큰까지 지연 분포 (fixed / uniform / normal / lognormal / pareto)
+    ttft_ms: 분포의 중앙값(ms), jitter: 분포 폭 (uniform/normal 은 비율, lognormal 은 sigma, pareto 는 alpha)
+    tokens_per_second: 출력 속도, output_tokens: 응답 길이
+    input_tokens_per_second: 프롬프트 처리 속도 (입력이 길수록 첫 토큰이 늦어짐, 0 이면 무시)
+    cached_input_speedup: 컨텍스트 캐시에서 읽는 토큰의 처리 속도 배율
+    error_429 / error_500 / error_timeout: 호출당 오류 확률, timeout_seconds: 타임아웃까지 대기
+    """
+    latency: str = "lognormal"
+    ttft_ms: float = 400.0
+    jitter: float = 0.3
+    tokens_per_second: float = 80.0
+    output_tokens: int = 200
+    input_tokens_per_second: float = 10000.0
+    cached_input_speedup: float = 10.0
+    error_429: float = 0.0
+    error_500: float = 0.0
+    error_timeout: float = 0.0
+    timeout_seconds: float = 5.0
+    seed: int = None
+    time_scale: float = 1.0   # 모든 대기시간 배율 (0 이면 대기 없음)
+
+
+class StubBackend(LLMBackend):
+    """결정적 응답을 내는 로컬 스텁 (네트워크 없음)"""
+    name = "stub"
+
+    def __init__(self, profile=None, model_name="stub", model_profiles=None):
+        super().__init__(model_name)
+        self.profile = profile or StubProfile()
+        # 모델별 동작 (라우팅 시험용 지연 / 오류 분포), 없는 모델은 profile
+        self.model_profiles = dict(model_profiles or {})
+        self._rng = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self._contexts = {}     # 이름 → (앞부분, CachedContext)
+        self._context_seq = 0
+        self.calls = 0
+
+    def profile_for(self, model=None):
+        """모델별 StubProfile ("stub:" 접두어는 떼고 찾음)"""
+        if model and self.model_profiles:
+            return self.model_profiles.get(model.removeprefix("stub:"), self.profile)
+        return self.profile
+
+    def sample_ttft(self, model=None):
+        """첫 토큰까지 지연(초) 샘플"""
+        p = self.profile_for(model)
+        base = p.ttft_ms / 1000
+        with self._lock:
+            if p.latency == "fixed":
+                value = base
+            elif p.latency == "uniform":
+                value = self._rng.uniform(base * (1 - p.jitter), base * (1 + p.jitter))
+            elif p.latency == "normal":
+                value = self._rng.gauss(base, base * p.jitter)
+            elif p.latency == "pareto":
+                # 꼬리가 긴 분포: 중앙값이 base 가 되도록 배율 조정
+                alpha = p.jitter if p.jitter > 1 else 1.5
+                value = base / (2 ** (1 / alpha)) * self._rng.paretovariate(alpha)
+            else:  # lognormal
+                value = self._rng.lognormvariate(math.log(base), p.jitter)
+        return max(value, 0.0)
+
+    def _prefill(self, prompt, cached_tokens=0, model=None):
+        """입력 길이에 비례하는 추가 지연(초), 캐시된 토큰은 cached_input_speedup 배 빠름"""
+        p = self.profile_for(model)
+        rate = p.input_tokens_per_second
+        if rate <= 0:
+            return 0.0
+        return (self.count_tokens(prompt) + cached_tokens / max(p.cached_input_speedup, 1.0)) / rate
+
+    def create_context_cache(self, prefix, ttl, model=None, display_name=None):
+        with self._lock:
+            self._context_seq += 1
+            name = f"cachedContents/stub-{self._context_seq}"
+        cached = CachedContext(name=name, model=model or self.model_name, tokens=self.count_tokens(prefix),
+                               expires_at=time.time() + ttl)
+        self._sleep(self._prefill(prefix))  # 등록 시 한 번만 앞부분 처리
+        with self._lock:
+            self._contexts[name] = (prefix, cached)
+        return cached
+
+    def delete_context_cache(self, cached):
+        with self._lock:
+            self._contexts.pop(cached.name, None)
+
+    def _resolve(self, prompt, cached_context):
+        """(전체 프롬프트, 캐시된 토큰 수), 캐시가 없거나 만료됐으면 ContextCacheExpired"""
+        if cached_context is None:
+            return prompt, 0
+        with self._lock:
+            entry = self._contexts.get(cached_context.name)
+        if entry is None or entry[1].expires_at < time.time():
+            raise ContextCacheExpired(f"stub: cached content {cached_context.name} not found")
+        prefix, cached = entry
+        return prefix + "\n\n" + prompt, cached.tokens
+
+    def _roll_error(self, model=None):
+        p = self.profile_for(model)
+        with self._lock:
+            roll = self._rng.random()
+        if roll < p.error_429:
+            raise RateLimitError("stub: 429 Resource exhausted")
+        roll -= p.error_429
+        if roll < p.error_500:
+            raise ServerError("stub: 500 Internal error")
+        roll -= p.error_500
+        if roll < p.error_timeout:
+            self._sleep(p.timeout_seconds)
+            raise BackendTimeout("stub: deadline exceeded")
+
+    def _sleep(self, seconds):
+        if self.profile.time_scale > 0 and seconds > 0:
+            time.sleep(seconds * self.profile.time_scale)
+
+    FILLER = ["상권", "분석", "결과", "재방문", "고객", "전략", "신한카드", "데이터", "기준", "처방"]
+    ARRAY_ITEMS = 2   # JSON 응답의 배열 항목 수
+
+    def render(self, prompt, model=None, max_output_tokens=None, response_schema=None):
+        """프롬프트 해시로 정해지는 결정적 응답 텍스트 (response_schema 가 있으면 스키마에 맞는 JSON)"""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        n_tokens = self.profile_for(model).output_tokens
+        if max_output_tokens:
+            n_tokens = min(n_tokens, max_output_tokens)
+        if response_schema is not None:
+            return self._render_json(response_schema, digest, n_tokens)
+        words = [f"[{model or self.model_name}:{digest}]"]
+        for i in range(max(n_tokens - 1, 0)):
+            words.append(self.FILLER[(i + int(digest, 16)) % len(self.FILLER)])
+        return " ".join(words)
+
+    def _render_json(self, schema, digest, n_tokens):
+        """스키마의 모든 항목을 채운 JSON (문자열 길이로 전체 토큰 수를 n_tokens 안팎에 맞춤)"""
+        seed = int(digest, 16)
+
+        def strings(node):
+            if node.get("type") == "object":
+                return sum(strings(child) for child in node.get("properties", {}).values())
+            if node.get("type") == "array":
+                return self.ARRAY_ITEMS * strings(node.get("items", {}))
+            return 1 if node.get("type") == "string" and "enum" not in node else 0
+
+        words = max(1, min(12, n_tokens // max(strings(schema), 1) - 2))
+
+        def fill(node, i):
+            kind = node.get("type")
+            if kind == "object":
+                return {name: fill(child, i + n) for n, (name, child) in enumerate(node.get("properties", {}).items())}
+            if kind == "array":
+                return [fill(node.get("items", {}), i + k) for k in range(self.ARRAY_ITEMS)]
+            if "enum" in node:
+                return node["enum"][(seed + i) % len(node["enum"])]
+            if kind == "integer":
+                return 50 + (seed + i) % 950
+            if kind == "number":
+                return round(((seed >> i) % 200 - 100) / 100, 2) if "상관" in node.get("description", "") else (seed + i) % 100
+            if kind == "boolean":
+                return bool((seed + i) % 2)
+            return " ".join(self.FILLER[(seed + i + k) % len(self.FILLER)] for k in range(words))
+
+        return json.dumps(fill(schema, 0), ensure_ascii=False)
+
+    def _tokens(self, text):
+        return text.split(" ")
+
+    def generate(self, prompt, model=None, cached_context=None, max_output_tokens=None, response_schema=None, **options):
+        with self._lock:
+            self.calls += 1
+        full_prompt, cached_tokens = self._resolve(prompt, cached_context)
+        self._roll_error(model)
+        text = self.render(full_prompt, model, max_output_tokens, response_schema)
+        self._sleep(self._prefill(prompt, cached_tokens, model) + self.sample_ttft(model)
+                    + len(self._tokens(text)) / self.profile_for(model).tokens_per_second)
+        return LLMResponse(
+            text=text,
+            model=model or self.model_name,
+            prompt_tokens=self.count_tokens(prompt) + cached_tokens,
+            output_tokens=len(self._tokens(text)),
+            cached_tokens=cached_tokens,
+        )
+
+    def stream(self, prompt, model=None, cached_context=None, max_output_tokens=None, response_schema=None, **options):
+        with self._lock:
+            self.calls += 1
+        full_prompt, cached_tokens = self._resolve(prompt, cached_context)
+        self._roll_error(model)
+        text = self.render(full_prompt, model, max_output_tokens, response_schema)
+        tokens = self._tokens(text)
+        ttft = self._prefill(prompt, cached_tokens, model) + self.sample_ttft(model)
+        per_token = 1 / self.profile_for(model).tokens_per_second
+
+        def pieces():
+            self._sleep(ttft)
+            for i, token in enumerate(tokens):
+                if i:
+                    self._sleep(per_token)
+                yield token if i == 0 else " " + token
+
+        def finalize(result):
+            result.prompt_tokens = self.count_tokens(prompt) + cached_tokens
+            result.output_tokens = len(tokens)
+            result.cached_tokens = cached_tokens
+
+        return TextStream(pieces(), model or self.model_name, finalize)
+
+
+# ==================== 선택 ====================
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def stub_profile_from_settings(get_setting):
+    """STUB_* 설정 → StubProfile"""
+    defaults = StubProfile()
+    seed = get_setting("STUB_SEED")
+    return StubProfile(
+        latency=str(get_setting("STUB_LATENCY", defaults.latency)),
+        ttft_ms=_float(get_setting("STUB_TTFT_MS"), defaults.ttft_ms),
+        jitter=_float(get_setting("STUB_JITTER"), defaults.jitter),
+        tokens_per_second=_float(get_setting("STUB_TOKENS_PER_SECOND"), defaults.tokens_per_second),
+        input_tokens_per_second=_float(get_setting("STUB_INPUT_TOKENS_PER_SECOND"), defaults.input_tokens_per_second),
+        cached_input_speedup=_float(get_setting("STUB_CACHED_INPUT_SPEEDUP"), defaults.cached_input_speedup),
+        output_tokens=int(_float(get_setting("STUB_OUTPUT_TOKENS"), defaults.output_tokens)),
+        error_429=_float(get_setting("STUB_ERROR_429"), 0.0),
+        error_500=_float(get_setting("STUB_ERROR_500"), 0.0),
+        error_timeout=_float(get_setting("STUB_ERROR_TIMEOUT"), 0.0),
+        timeout_seconds=_float(get_setting("STUB_TIMEOUT_SECONDS"), defaults.timeout_seconds),
+        seed=int(seed) if seed not in (None, "") else None,
+        time_scale=_float(get_setting("STUB_TIME_SCALE"), defaults.time_scale),
+    )
+
+
+def stub_model_profiles_from_settings(get_setting, profile):
+    """STUB_MODEL_PROFILES: {"모델": {StubProfile 항목: 값}} JSON → 모델별 StubProfile (나머지 항목은 profile 값)"""
+    value = get_setting("STUB_MODEL_PROFILES")
+    if value in (None, ""):
+        return {}
+    overrides = json.loads(value) if isinstance(value, str) else value
+    return {model.removeprefix("stub:"): replace(profile, **fields) for model, fields in overrides.items()}
+
+
+def create_backend(get_setting):
+    """LLM_BACKEND 설정에 따라 백엔드 생성 (gemini 인데 API 키가 없으면 None)"""
+    kind = str(get_setting("LLM_BACKEND", "gemini")).lower()
+    model_name = get_setting("GEMINI_MODEL", DEFAULT_MODEL)
+    if kind == "stub":
+        # 캐시 키가 실제 모델 응답과 섞이지 않도록 이름 구분
+        profile = stub_profile_from_settings(get_setting)
+        return StubBackend(profile, model_name=f"stub:{model_name}",
+                           model_profiles=stub_model_profiles_from_settings(get_setting, profile))
+    if kind != "gemini":
+        raise ValueError(f"알 수 없는 LLM_BACKEND: {kind}")
+    api_key = get_setting("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    return GeminiBackend(api_key, model_name)
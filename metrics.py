@@ -0,0 +1,154 @@
+"""프로세스 공용 지표 수집 (카운터 + 최근 샘플 기반 분위수)
+
+Streamlit 세션 간에 공유되도록 모듈 전역에 보관한다.
+span() 으로 구간 시간을 재고, event() 는 구조화 로그(JSON 포맷은 metrics_export.py)로 남긴다.
+prometheus_text() 는 Prometheus 텍스트 형식으로 전체 지표를 내보낸다.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# 지표별 최근 샘플 보관 개수
+MAX_SAMPLES = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_totals = defaultdict(lambda: [0, 0.0])   # 샘플 지표의 전체 기간 [개수, 합계]
+
+logger = logging.getLogger("clinic.metrics")
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """카운터 증가"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, value, **labels):
+    """샘플 기록 (지연시간, 토큰 수 등)"""
+    key = _key(name, labels)
+    with _lock:
+        _samples[key].append(value)
+        totals = _totals[key]
+        totals[0] += 1
+        totals[1] += value
+
+
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def total(name, **labels):
+    """나머지 라벨과 무관하게 합친 카운터 값 (labels 를 주면 그 라벨이 일치하는 것만)"""
+    match = set(_key(name, labels)[1])
+    with _lock:
+        return sum(v for (n, key_labels), v in _counters.items() if n == name and match <= set(key_labels))
+
+
+def percentile(name, q, **labels):
+    """최근 샘플의 q 분위수 (0~100), 샘플이 없으면 None"""
+    with _lock:
+        values = sorted(_samples.get(_key(name, labels), ()))
+    if not values:
+        return None
+    rank = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[rank]
+
+
+def summary(name, **labels):
+    """샘플 개수/평균/p50/p95"""
+    with _lock:
+        values = list(_samples.get(_key(name, labels), ()))
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(name, 50, **labels),
+        "p95": percentile(name, 95, **labels),
+    }
+
+
+def snapshot():
+    """전체 지표 사본 {"counters": {...}, "samples": {...}}"""
+    with _lock:
+        counters = {_format(k): v for k, v in _counters.items()}
+        samples = {_format(k): list(v) for k, v in _samples.items()}
+    return {"counters": counters, "samples": samples}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _samples.clear()
+        _totals.clear()
+
+
+def event(name, **fields):
+    """구조화 로그 한 줄 (LOG_FORMAT=json 이면 JSON 으로 출력)"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(name, extra={"event": name, "fields": fields})
+
+
+@contextmanager
+def span(name, **labels):
+    """구간 시간 측정: {name}_seconds 샘플, 예외 시 {name}_errors_total 증가, 끝나면 event 로그"""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        inc(f"{name}_errors_total", error=error, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(f"{name}_seconds", elapsed, **labels)
+        event("span", span=name, seconds=round(elapsed, 6), error=error, **labels)
+
+
+def prometheus_text():
+    """Prometheus 텍스트 노출 형식 (카운터는 counter, 샘플은 최근 샘플 분위수 + 전체 합계/개수의 summary)"""
+    with _lock:
+        counters = sorted(_counters.items())
+        samples = {key: sorted(values) for key, values in _samples.items()}
+        totals = {key: tuple(value) for key, value in _totals.items()}
+
+    lines, typed = [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{_format((name, labels))} {value:g}")
+    for key in sorted(samples):
+        name, labels = key
+        values = samples[key]
+        if name not in typed:
+            lines.append(f"# TYPE {name} summary")
+            typed.add(name)
+        for q in (0.5, 0.95, 0.99):
+            rank = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+            lines.append(f"{_format((name, labels + (('quantile', str(q)),)))} {values[rank]:g}")
+        count, total = totals.get(key, (len(values), sum(values)))
+        lines.append(f"{_format((name + '_sum', labels))} {total:g}")
+        lines.append(f"{_format((name + '_count', labels))} {count:g}")
+    return "".join(line + "\n" for line in lines)
+
+
+def _format(key):
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,136 @@
+"""지표 / 로그 내보내기
+
+- JSON 로그: LOG_FORMAT=json 이면 루트 로거 출력을 한 줄짜리 JSON 으로 바꾼다
+  (metrics.event() 의 필드는 그대로 최상위 키로 들어감).
+- Prometheus 텍스트: METRICS_FILE 경로에 주기적으로 기록(node_exporter textfile 수집기 등)하거나
+  METRICS_PORT 를 주면 http://<host>:<port>/metrics 로 제공한다.
+둘 다 데몬 스레드에서 돌아 화면 렌더링에는 영향이 없다.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 기본 파일 기록 주기 (초)
+DEFAULT_INTERVAL = 15.0
+
+
+# ==================== JSON 로그 ====================
+class JsonFormatter(logging.Formatter):
+    """로그 레코드 하나를 JSON 한 줄로"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_json_logging(level=logging.INFO):
+    """루트 로거 핸들러를 JSON 포맷으로 (이미 설정되어 있으면 포맷만 교체)"""
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        handler.setFormatter(JsonFormatter())
+    root.setLevel(level)
+    logging.getLogger(metrics.logger.name).setLevel(level)
+
+
+# ==================== Prometheus 텍스트 ====================
+def write_file(path):
+    """현재 지표를 path 에 원자적으로 기록 (임시 파일 → rename)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(metrics.prometheus_text())
+        os.chmod(tmp, 0o644)  # 수집기가 다른 사용자로 읽을 수 있게
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 수집기 요청마다 로그를 남기지 않음
+
+
+class MetricsExporter:
+    """파일 기록 스레드 / HTTP 엔드포인트 (프로세스당 1개)"""
+
+    def __init__(self, path=None, port=None, interval=DEFAULT_INTERVAL, host="0.0.0.0"):
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.host = host
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.path:
+            thread = threading.Thread(target=self._write_loop, name="metrics-file", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.port:
+            try:
+                self.server = ThreadingHTTPServer((self.host, int(self.port)), _Handler)
+            except OSError as e:
+                logger.warning("지표 엔드포인트 시작 실패 (포트 %s): %s", self.port, e)
+            else:
+                thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            try:
+                write_file(self.path)
+            except Exception as e:
+                logger.warning("지표 파일 기록 실패: %s", e)
+            self._stop.wait(self.interval)
+
+
+def exporter_from_settings(get_setting):
+    """LOG_FORMAT / METRICS_FILE / METRICS_PORT / METRICS_INTERVAL 설정으로 시작"""
+    if str(get_setting("LOG_FORMAT", "")).lower() == "json":
+        configure_json_logging()
+    return MetricsExporter(
+        path=get_setting("METRICS_FILE"),
+        port=get_setting("METRICS_PORT"),
+        interval=float(get_setting("METRICS_INTERVAL", DEFAULT_INTERVAL)),
+    ).start()
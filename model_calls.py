@@ -0,0 +1,97 @@
+"""모델 호출 공통 (화면 app.py 와 일괄 처리 batch.py 가 함께 사용)
+
+응답 캐시 / 추측 실행 키와 호출 방식(모델 라우팅, 컨텍스트 캐시, 단계별 생성 옵션)을 한 곳에 두어
+화면과 배치가 항상 같은 키로 응답 캐시를 공유한다.
+"""
+import metrics
+from diagnosis import SCHEMA_VERSION as DIAGNOSIS_SCHEMA_VERSION
+from llm_backend import ContextCacheExpired
+from model_router import request_tokens
+from prompts import OUTPUT_TOKEN_LIMITS, generation_options
+from response_cache import make_key
+
+
+class ModelCaller:
+    """백엔드 + 프롬프트 빌더(문서 버전 / 참고 자료 예산 / 전체 문서 모드) + 단계별 최대 출력 토큰"""
+
+    def __init__(self, backend, builder, output_limits=None, context_cache=None, model_name=None):
+        """model_name: 백엔드가 없을 때(API 키 없음) 키에 쓸 모델명"""
+        self.backend = backend
+        self.builder = builder
+        self.output_limits = output_limits or dict(OUTPUT_TOKEN_LIMITS)
+        self.context_cache = context_cache
+        self.model_name = backend.model_name if backend is not None else model_name
+
+    def key_model(self, stage, prompt):
+        """캐시 키에 쓸 모델명: 라우터가 있으면 경로 표가 이 요청을 보내는 모델 (짧은 상담은 빠른 등급)
+
+        캐시에는 기본 경로(reason == primary) 응답만 넣으므로 저장된 답변의 키 모델은 곧 답한 모델(decision.model)이다.
+        GEMINI_FAST_MODEL / MODEL_TIERS / MODEL_ROUTES 를 바꿔 모델이 달라지면 키도 달라진다.
+        """
+        if self.backend is not None and hasattr(self.backend, "primary_model"):
+            return self.backend.primary_model(stage, request_tokens(prompt))
+        return self.model_name
+
+    def response_key(self, stage, inputs, prompt):
+        """응답 캐시 / 추측 실행 결과 키 (경로 모델명 + 문서 버전 + 단계 + 입력)
+
+        템플릿 문구와 상관 데이터 행도 프롬프트에 들어가므로 둘의 해시(prompt_version)를 넣어
+        `python correlations.py import` 나 문구 수정 뒤에는 이전 응답을 쓰지 않는다.
+        prompt 는 경로(요청 크기)를 정하는 데만 쓴다 (key_model).
+        """
+        key_inputs = dict(inputs, budget=self.builder.token_budget, max_output_tokens=self.output_limits.get(stage),
+                          prompt=self.builder.prompt_version)
+        if stage == "diagnosis":
+            key_inputs["schema"] = DIAGNOSIS_SCHEMA_VERSION
+        if self.builder.full_reference:
+            key_inputs["full_reference"] = True
+        return make_key(self.key_model(stage, prompt), self.builder.version, stage, key_inputs)
+
+    def call(self, prompt, stage, stream=True, max_output_tokens=None):
+        """백엔드 호출 (TextStream 또는 LLMResponse 반환)
+
+        prompt 는 prompts.PromptParts (부분별 토큰 수를 metrics 에 기록) 또는 문자열.
+        컨텍스트 캐시가 있으면 고정 앞부분은 빼고 뒷부분만 전송한다.
+        단계별 최대 출력 토큰(max_output_tokens 로 이번 호출만 변경)을 적용하고, 초기 진단은 JSON 스키마로 받는다.
+        모델 라우터가 있으면 단계 / 요청 크기로 모델을 고르고, 기본 모델이 아니면 컨텍스트 캐시는 쓰지 않는다.
+        """
+        options = generation_options(stage, max_output_tokens or self.output_limits.get(stage))
+        routed_model = self.model_name
+        if hasattr(self.backend, "route"):
+            decision = self.backend.route(stage, request_tokens(prompt))
+            options["route"] = decision
+            routed_model = decision.model
+        cached_context = None
+        if hasattr(prompt, "token_counts"):
+            for part, tokens in prompt.token_counts().items():
+                metrics.observe("prompt_part_tokens", tokens, stage=stage, part=part)
+            if self.context_cache is not None and routed_model == self.model_name:
+                cached_context = self.context_cache.get(stage, prompt.static_prefix, self.builder.version)
+                if cached_context is not None:
+                    tail = prompt.dynamic_tail
+            prompt = prompt.text
+
+        method = self.backend.stream if stream else self.backend.generate
+        result = None
+        if cached_context is not None:
+            try:
+                result = method(tail, cached_context=cached_context, **options)
+            except ContextCacheExpired:
+                # 공급자측에서 만료됨: 다음 요청부터 다시 등록하고 이번에는 전체 전송
+                self.context_cache.forget(stage)
+        if result is None:
+            result = method(prompt, **options)
+        # 응답을 캐시에 넣어도 되는지(cacheable) 판단할 수 있도록 경로 결정을 붙여 둠
+        result.route = options.get("route")
+        return result
+
+    @staticmethod
+    def cacheable(result):
+        """응답 / 유사 질문 캐시에 넣어도 되는 응답인지
+
+        키는 경로 표가 고른 모델(key_model)이라 짧은 상담의 빠른 등급 답변은 빠른 모델 키로 들어간다.
+        SLO 위반으로 대체 모델을 고른 응답(reason != primary)은 답한 모델이 키 모델과 달라 넣지 않는다
+        (넣으면 대체 모델 답변이 캐시 기간 내내 경로 모델 답변처럼 쓰인다).
+        """
+        route = getattr(result, "route", None)
+        return route is None or route.reason == "primary"
@@ -0,0 +1,325 @@
+"""단계 / 요청 크기별 모델 선택 (등급 표 + 지연 SLO + 느린 모델 강등)
+
+모델은 등급(tier)으로 나눈다: quality (GEMINI_MODEL) → fast (GEMINI_FAST_MODEL) 순으로 빠르다.
+경로 표(ROUTES)는 위에서부터 단계와 요청 크기(대화 기록 + 요청 부분 토큰)가 맞는 첫 줄을 쓰며,
+줄마다 등급과 SLO (첫 토큰 p95 초, 오류율) 를 정한다.
+(단계, 모델)별 최근 호출을 모아 p95 나 오류율이 SLO 를 넘으면 그 모델을 cooldown 초 동안 강등하고
+다음(더 빠른) 등급으로 보낸다. 강등이 끝나면 기록을 비우고 다시 원래 등급부터 시도한다.
+지연은 스트리밍이면 첫 토큰까지, 블로킹이면 전체 응답 시간이다 (관문 대기 / 재시도 포함).
+요청마다의 결정은 llm_route_decisions_total{stage,tier,model,reason} 과 llm_route 이벤트로 남긴다.
+"""
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import metrics
+from doc_retrieval import estimate_tokens
+from llm_backend import ContextCacheExpired, TextStream
+
+# 빠른 순서의 반대 (앞이 품질 우선, 뒤로 갈수록 빠름)
+TIER_ORDER = ("quality", "fast")
+DEFAULT_FAST_MODEL = "gemini-2.0-flash-lite"
+
+DEFAULT_WINDOW = 300.0       # 판단에 쓰는 최근 기록 (초)
+DEFAULT_MAX_SAMPLES = 200    # (단계, 모델)별 최대 기록 수
+DEFAULT_MIN_SAMPLES = 10     # 이보다 적으면 판단하지 않음
+DEFAULT_COOLDOWN = 60.0      # 강등 유지 시간 (초)
+DEFAULT_SLO_P95 = 4.0
+DEFAULT_MAX_ERROR_RATE = 0.2
+
+# 요청 크기에 넣지 않는 부분 (요청마다 거의 같은 고정 부분)
+FIXED_PARTS = ("system", "instructions", "reference")
+
+
+@dataclass(frozen=True)
+class Route:
+    """경로 표 한 줄 (stage="*" 는 모든 단계, max_request_tokens=None 은 크기 무관)"""
+    stage: str
+    tier: str
+    max_request_tokens: int = None
+    slo_p95: float = DEFAULT_SLO_P95
+    max_error_rate: float = DEFAULT_MAX_ERROR_RATE
+
+    def matches(self, stage, request_tokens):
+        return (self.stage in ("*", stage)
+                and (self.max_request_tokens is None or request_tokens <= self.max_request_tokens))
+
+
+# 짧은 상담(대화 기록이 짧은 후속 질문)은 빠른 등급, 진단 / 처방전 / 긴 상담은 품질 등급
+DEFAULT_ROUTES = (
+    Route("diagnosis", "quality", slo_p95=4.0),
+    Route("chat", "fast", max_request_tokens=600, slo_p95=2.0),
+    Route("chat", "quality", slo_p95=3.0),
+    Route("prescription", "quality", slo_p95=5.0),
+    Route("prescription_section", "quality", slo_p95=4.0),
+    Route("*", "fast", slo_p95=3.0),
+)
+
+
+@dataclass(frozen=True)
+class Decision:
+    """요청 하나의 경로 결정 (reason: primary / fallback_p95 / fallback_errors / degraded)"""
+    stage: str
+    tier: str
+    model: str
+    reason: str
+    route: Route
+
+
+def request_tokens(prompt):
+    """요청 크기: PromptParts 면 고정 부분을 뺀 토큰 수, 문자열이면 전체 추정 토큰 수"""
+    if hasattr(prompt, "token_counts"):
+        return sum(tokens for part, tokens in prompt.token_counts().items() if part not in FIXED_PARTS)
+    return estimate_tokens(prompt)
+
+
+# ==================== 모델 상태 ====================
+class ModelHealth:
+    """(단계, 모델) 하나의 최근 호출 기록 [(시각, 지연, 성공 여부)]"""
+
+    def __init__(self, window=DEFAULT_WINDOW, max_samples=DEFAULT_MAX_SAMPLES):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)
+        self.demoted_until = 0.0
+        self.demoted_reason = None
+
+    def record(self, seconds, ok, now):
+        self._samples.append((now, seconds, ok))
+
+    def snapshot(self, now):
+        """(기록 수, 성공 호출 지연 p95, 오류율)"""
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        if not self._samples:
+            return 0, None, 0.0
+        latencies = sorted(seconds for _, seconds, ok in self._samples if ok)
+        p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))] if latencies else None
+        errors = sum(1 for _, _, ok in self._samples if not ok)
+        return len(self._samples), p95, errors / len(self._samples)
+
+    def reset(self):
+        self._samples.clear()
+
+
+# ==================== 라우터 ====================
+class ModelRouter:
+    """백엔드(보통 CallGate)를 감싸 같은 인터페이스로 제공하고, route= 가 주어진 호출의 결과를 기록"""
+
+    def __init__(self, backend, tiers, routes=DEFAULT_ROUTES, window=DEFAULT_WINDOW,
+                 max_samples=DEFAULT_MAX_SAMPLES, min_samples=DEFAULT_MIN_SAMPLES, cooldown=DEFAULT_COOLDOWN,
+                 clock=time.monotonic):
+        self.backend = backend
+        self.tiers = dict(tiers)
+        self.routes = tuple(routes)
+        self.window = window
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.clock = clock
+        self._health = {}   # (단계, 모델) → ModelHealth
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # name / model_name / stats / create_context_cache 등은 감싼 백엔드 것을 그대로 사용
+        return getattr(self.backend, name)
+
+    # ---------- 결정 ----------
+    def _route_for(self, stage, request_tokens):
+        for route in self.routes:
+            if route.matches(stage, request_tokens):
+                return route
+        return Route(stage, TIER_ORDER[0])
+
+    def _tier_chain(self, tier):
+        """route 등급부터 더 빠른 등급들 (표에 모델이 없는 등급은 건너뜀)"""
+        order = TIER_ORDER[TIER_ORDER.index(tier):] if tier in TIER_ORDER else (tier,)
+        return [t for t in order if self.tiers.get(t)]
+
+    def _health_for(self, stage, model):
+        key = (stage, model)
+        health = self._health.get(key)
+        if health is None:
+            health = self._health[key] = ModelHealth(self.window, self.max_samples)
+        return health
+
+    def _breach(self, stage, model, route, now):
+        """SLO 위반 사유 (강등 중이면 강등 사유), 정상이면 None — _lock 안에서 호출"""
+        health = self._health_for(stage, model)
+        if health.demoted_until > now:
+            return health.demoted_reason
+        count, p95, error_rate = health.snapshot(now)
+        if count < self.min_samples:
+            return None
+        reason = None
+        if error_rate > route.max_error_rate:
+            reason = "errors"
+        elif p95 is not None and p95 > route.slo_p95:
+            reason = "p95"
+        if reason is not None:
+            # 강등 후 기록을 비워 강등이 끝나면 새 기록으로 다시 판단
+            health.demoted_until = now + self.cooldown
+            health.demoted_reason = reason
+            health.reset()
+            metrics.inc("llm_route_demotions_total", stage=stage, model=model, reason=reason)
+            metrics.event("llm_route_demoted", stage=stage, model=model, reason=reason,
+                          p95=p95, error_rate=round(error_rate, 3), cooldown=self.cooldown)
+        return reason
+
+    def primary_model(self, stage, request_tokens=0):
+        """경로 표가 이 요청에 고르는 (강등 전) 모델 — 상태를 보거나 기록하지 않음 (응답 캐시 키용)"""
+        route = self._route_for(stage, request_tokens)
+        tier = (self._tier_chain(route.tier) or [TIER_ORDER[0]])[0]
+        return self.tiers.get(tier) or self.backend.model_name
+
+    def route(self, stage, request_tokens=0):
+        """단계 / 요청 크기 → Decision (원래 등급이 SLO 위반이면 다음 등급, 모두 위반이면 원래 등급)"""
+        route = self._route_for(stage, request_tokens)
+        chain = self._tier_chain(route.tier) or [TIER_ORDER[0]]
+        now = self.clock()
+        first_breach = None
+        decision = None
+        with self._lock:
+            for tier in chain:
+                model = self.tiers.get(tier) or self.backend.model_name
+                breach = self._breach(stage, model, route, now)
+                if breach is None:
+                    reason = "primary" if first_breach is None else f"fallback_{first_breach}"
+                    decision = Decision(stage, tier, model, reason, route)
+                    break
+                if first_breach is None:
+                    first_breach = breach
+        if decision is None:
+            tier = chain[0]
+            decision = Decision(stage, tier, self.tiers.get(tier) or self.backend.model_name, "degraded", route)
+        metrics.inc("llm_route_decisions_total", stage=stage, tier=decision.tier, model=decision.model,
+                    reason=decision.reason)
+        metrics.event("llm_route", stage=stage, tier=decision.tier, model=decision.model, reason=decision.reason,
+                      request_tokens=request_tokens)
+        return decision
+
+    # ---------- 결과 기록 ----------
+    def record(self, decision, seconds, ok):
+        """호출 결과 한 건 (성공이면 지연 샘플 llm_route_latency_seconds, 실패면 llm_route_errors_total)"""
+        with self._lock:
+            self._health_for(decision.stage, decision.model).record(seconds, ok, self.clock())
+        if ok:
+            metrics.observe("llm_route_latency_seconds", seconds, stage=decision.stage, model=decision.model)
+        else:
+            metrics.inc("llm_route_errors_total", stage=decision.stage, model=decision.model)
+
+    # ---------- 백엔드 인터페이스 ----------
+    def generate(self, prompt, model=None, route=None, **options):
+        if route is None:
+            return self.backend.generate(prompt, model=model, **options)
+        started = time.perf_counter()
+        try:
+            result = self.backend.generate(prompt, model=route.model, **options)
+        except ContextCacheExpired:
+            raise  # 캐시 문제 (모델 상태와 무관)
+        except Exception:
+            self.record(route, time.perf_counter() - started, ok=False)
+            raise
+        self.record(route, time.perf_counter() - started, ok=True)
+        return result
+
+    def stream(self, prompt, model=None, route=None, **options):
+        """첫 토큰이 오면 지연을 기록, 첫 토큰 전 오류는 실패로 기록 (끝까지 읽지 않고 버려진 응답은 기록 없음)"""
+        if route is None:
+            return self.backend.stream(prompt, model=model, **options)
+        started = time.perf_counter()
+        try:
+            inner = self.backend.stream(prompt, model=route.model, **options)
+        except ContextCacheExpired:
+            raise
+        except Exception:
+            self.record(route, time.perf_counter() - started, ok=False)
+            raise
+        recorded = []
+
+        def record_once(ok):
+            if not recorded:
+                recorded.append(True)
+                self.record(route, time.perf_counter() - started, ok)
+
+        def pieces():
+            try:
+                for piece in inner:
+                    record_once(ok=True)
+                    yield piece
+            except ContextCacheExpired:
+                raise
+            except Exception:
+                record_once(ok=False)
+                raise
+            else:
+                record_once(ok=True)  # 빈 응답
+            finally:
+                inner.close()
+
+        def finalize(result):
+            result.prompt_tokens = inner.prompt_tokens
+            result.output_tokens = inner.output_tokens
+            result.cached_tokens = inner.cached_tokens
+
+        return TextStream(pieces(), inner.model, finalize)
+
+    def routing_stats(self):
+        """(단계, 모델)별 현재 상태 (사이드바/벤치마크용)"""
+        now = self.clock()
+        rows = []
+        with self._lock:
+            for (stage, model), health in sorted(self._health.items()):
+                count, p95, error_rate = health.snapshot(now)
+                rows.append({
+                    "stage": stage,
+                    "model": model,
+                    "samples": count,
+                    "p95": p95,
+                    "error_rate": error_rate,
+                    "demoted": health.demoted_until > now,
+                })
+        return rows
+
+
+# ==================== 설정 ====================
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _json_setting(get_setting, name, default):
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def router_from_settings(backend, get_setting):
+    """MODEL_ROUTING 설정으로 라우터 생성 (false 면 backend 를 그대로 반환)
+
+    MODEL_TIERS: {"등급": "모델"} JSON (기본 quality=GEMINI_MODEL, fast=GEMINI_FAST_MODEL)
+    MODEL_ROUTES: [{"stage", "tier", "max_request_tokens", "slo_p95", "max_error_rate"}] JSON (기본 DEFAULT_ROUTES)
+    MODEL_ROUTING_WINDOW / _MIN_SAMPLES / _COOLDOWN: 판단 기록 기간, 최소 기록 수, 강등 시간
+    스텁 백엔드는 캐시 키가 섞이지 않도록 모델명 앞에 "stub:" 을 붙인다.
+    """
+    if str(get_setting("MODEL_ROUTING", "true")).lower() in ("0", "false", "no", "off"):
+        return backend
+    tiers = _json_setting(get_setting, "MODEL_TIERS", None) or {
+        "quality": backend.model_name,
+        "fast": get_setting("GEMINI_FAST_MODEL", DEFAULT_FAST_MODEL),
+    }
+    if backend.name == "stub":
+        tiers = {tier: model if model.startswith("stub:") else f"stub:{model}" for tier, model in tiers.items()}
+    routes = _json_setting(get_setting, "MODEL_ROUTES", None)
+    return ModelRouter(
+        backend,
+        tiers,
+        routes=[Route(**row) for row in routes] if routes else DEFAULT_ROUTES,
+        window=_float(get_setting("MODEL_ROUTING_WINDOW"), DEFAULT_WINDOW),
+        min_samples=int(_float(get_setting("MODEL_ROUTING_MIN_SAMPLES"), DEFAULT_MIN_SAMPLES)),
+        cooldown=_float(get_setting("MODEL_ROUTING_COOLDOWN"), DEFAULT_COOLDOWN),
+    )
@@ -0,0 +1,473 @@
+"""처방전 내보내기 (Markdown / HTML / PDF + 여러 건 묶음 zip)
+
+처방전 한 건은 가맹점 정보 + 처방 본문 + 발급일로 만든 마크다운 문서 하나이고,
+형식별 결과는 (문서 내용 해시, 형식) 키로 메모리 LRU 에 두므로 화면을 다시 그려도 렌더링은 1회뿐이다.
+다운로드 버튼에는 렌더 함수를 넘겨 사용자가 누를 때만 만든다 (묶음 zip 도 누를 때 메모리에서 생성).
+외부 패키지 없이 동작한다:
+- HTML: 처방전에 쓰이는 마크다운(제목/목록/표/굵게/구분선)만 변환하는 간단한 변환기
+- PDF: 글꼴을 넣지 않고 PDF 표준 한글 CID 글꼴(HYGoThic-Medium, UniKS-UCS2-H)을 참조
+  (한글은 보이지만 이모지 등 KS X 1001 밖의 글자는 뺌)
+
+세션 저장소 / 배치 결과 전체 묶음:
+
+    python prescription_export.py out.zip [--sessions .cache/sessions.sqlite3] [--batch results.jsonl] [--formats md,html,pdf]
+"""
+import argparse
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import sys
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+import metrics
+
+# 렌더링 방식이 바뀌면 올림 (캐시 키에 포함)
+EXPORT_VERSION = 1
+
+# 형식 → (MIME, 확장자, 버튼 이름)
+FORMATS = {
+    "md": ("text/markdown", "md", "Markdown"),
+    "html": ("text/html", "html", "HTML"),
+    "pdf": ("application/pdf", "pdf", "PDF"),
+}
+
+# 기본값
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+DOCUMENT = """# 🏥 상권 마케팅 처방 클리닉
+
+*Marketing Prescription Clinic*
+
+- **환자명:** {store_name}
+- **업종:** {business_type}
+- **위치:** {region} - {location}
+- **발급일:** {issued}
+
+---
+
+## 📊 신한카드 빅데이터 기반 분석
+
+{body}
+
+---
+
+본 처방전은 신한카드 빅데이터 분석 기반으로 발급되었습니다.
+"""
+
+
+def _safe_name(text):
+    """파일 이름에 쓸 수 없는 문자 제거"""
+    return re.sub(r"[\\/:*?\"<>|\s]+", "_", str(text or "미입력")).strip("_") or "미입력"
+
+
+@dataclass(frozen=True)
+class PrescriptionDocument:
+    """내보낼 처방전 한 건 (내용이 같으면 해시도 같음)"""
+    store_name: str
+    business_type: str
+    region: str
+    location: str
+    issued: str
+    body: str
+
+    @property
+    def markdown(self):
+        return DOCUMENT.format(
+            store_name=self.store_name, business_type=self.business_type, region=self.region,
+            location=self.location, issued=self.issued, body=self.body.strip(),
+        )
+
+    @property
+    def digest(self):
+        """내용 해시 (캐시 키 / 묶음 파일 이름)"""
+        return hashlib.sha256(f"{EXPORT_VERSION}\n{self.markdown}".encode("utf-8")).hexdigest()
+
+    def file_name(self, fmt, unique=False):
+        """처방전_{가맹점}_{발급일}.{확장자} (unique 면 해시 앞 8자리를 붙임)"""
+        day = re.sub(r"\D", "", self.issued) or datetime.now().strftime("%Y%m%d")
+        suffix = f"_{self.digest[:8]}" if unique else ""
+        return f"처방전_{_safe_name(self.store_name)}_{day}{suffix}.{FORMATS[fmt][1]}"
+
+
+def prescription_document(store_info, prescription, issued=None):
+    """가맹점 정보 + 처방 본문 → PrescriptionDocument (발급일이 없으면 오늘)"""
+    info = store_info or {}
+    return PrescriptionDocument(
+        store_name=info.get("store_name") or "미입력",
+        business_type=info.get("business_type") or "미입력",
+        region=info.get("region") or "미입력",
+        location=info.get("location") or "미입력",
+        issued=issued or info.get("date") or datetime.now().strftime("%Y년 %m월 %d일"),
+        body=prescription or "",
+    )
+
+
+# ==================== 마크다운 → HTML ====================
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="ko">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ font-family: "Apple SD Gothic Neo", "Malgun Gothic", "Noto Sans KR", sans-serif; max-width: 760px;
+       margin: 2rem auto; padding: 0 1.2rem; line-height: 1.7; color: #212121; }}
+h1 {{ color: #1B5E20; border-bottom: 3px solid #4CAF50; padding-bottom: .4rem; }}
+h2 {{ color: #2E7D32; margin-top: 2rem; }}
+h3, h4 {{ color: #33691E; }}
+table {{ border-collapse: collapse; margin: 1rem 0; }}
+th, td {{ border: 1px solid #C8E6C9; padding: .35rem .7rem; }}
+th {{ background: #E8F5E9; }}
+blockquote {{ margin: 1rem 0; padding: .2rem 1rem; border-left: 4px solid #A5D6A7; background: #F1F8E9; }}
+hr {{ border: 0; border-top: 1px solid #C8E6C9; margin: 2rem 0; }}
+code {{ background: #F5F5F5; padding: 0 .25rem; border-radius: 3px; }}
+@media print {{ body {{ margin: 0; max-width: none; }} }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET = re.compile(r"^\s*[-*+]\s+(.*)$")
+_NUMBERED = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+_RULE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,}|━{3,})\s*$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+
+
+def _inline(text):
+    """굵게 / 기울임 / 코드 (나머지는 이스케이프)"""
+    text = html.escape(text, quote=False)
+    text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", text)
+    text = re.sub(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)", r"<em>\1</em>", text)
+    return text
+
+
+def _cells(line):
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def markdown_to_html(text):
+    """처방전 마크다운 → HTML 본문 (제목, 목록, 표, 인용, 구분선, 문단)"""
+    out, paragraph, list_tag = [], [], None
+    lines = text.splitlines()
+
+    def flush():
+        nonlocal list_tag
+        if paragraph:
+            out.append("<p>" + "<br>\n".join(_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+        if list_tag:
+            out.append(f"</{list_tag}>")
+            list_tag = None
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        heading, bullet, numbered = _HEADING.match(line), _BULLET.match(line), _NUMBERED.match(line)
+        if not line.strip():
+            flush()
+        elif _RULE.match(line):
+            flush()
+            out.append("<hr>")
+        elif heading:
+            flush()
+            level = len(heading.group(1))
+            out.append(f"<h{level}>{_inline(heading.group(2))}</h{level}>")
+        elif line.lstrip().startswith("|") and i + 1 < len(lines) and _TABLE_SEPARATOR.match(lines[i + 1]):
+            flush()
+            rows = [f"<tr>{''.join(f'<th>{_inline(c)}</th>' for c in _cells(line))}</tr>"]
+            i += 2
+            while i < len(lines) and lines[i].lstrip().startswith("|"):
+                rows.append(f"<tr>{''.join(f'<td>{_inline(c)}</td>' for c in _cells(lines[i]))}</tr>")
+                i += 1
+            out.append("<table>\n" + "\n".join(rows) + "\n</table>")
+            continue
+        elif bullet or numbered:
+            tag = "ul" if bullet else "ol"
+            if paragraph or list_tag != tag:
+                flush()
+                out.append(f"<{tag}>")
+                list_tag = tag
+            out.append(f"<li>{_inline((bullet or numbered).group(1))}</li>")
+        elif line.lstrip().startswith(">"):
+            flush()
+            out.append(f"<blockquote>{_inline(line.lstrip()[1:].strip())}</blockquote>")
+        else:
+            if list_tag:
+                flush()
+            paragraph.append(line.strip())
+        i += 1
+    flush()
+    return "\n".join(out)
+
+
+def render_html(document):
+    return HTML_PAGE.format(
+        title=html.escape(f"처방전 - {document.store_name}"), body=markdown_to_html(document.markdown)
+    ).encode("utf-8")
+
+
+# ==================== 마크다운 → PDF ====================
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842      # A4 (pt)
+MARGIN = 56
+# 블록 종류 → (글자 크기, 위 여백)
+PDF_STYLES = {1: (18, 10), 2: (14, 12), 3: (12, 8), "text": (10.5, 2), "item": (10.5, 2), "rule": (10.5, 6)}
+
+# KS X 1001 밖이라 표준 한글 글꼴로 못 그리는 문자 (이모지, 결합 문자)
+_UNPRINTABLE = re.compile("[\U00010000-\U0010FFFF\u200d\ufe0e\ufe0f\u2600-\u27bf\u2b00-\u2bff]")
+
+
+def _plain(text):
+    """PDF 용 텍스트 (마크다운 기호 / 그릴 수 없는 문자 제거)"""
+    text = re.sub(r"\*\*(.+?)\*\*", r"\1", text)
+    text = re.sub(r"`([^`]+)`", r"\1", text)
+    text = re.sub(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*", r"\1", text)
+    return _UNPRINTABLE.sub("", text).strip()
+
+
+def _width(text, size):
+    """글자 폭 (반각 영숫자 500, 그 밖의 글자 1000 / 1000pt)"""
+    return sum(500 if ord(ch) < 0x7F else 1000 for ch in text) * size / 1000
+
+
+def _wrap(text, size, width):
+    """폭에 맞춰 줄 나누기 (가능하면 공백에서, 아니면 글자 단위)"""
+    lines, line = [], ""
+    for ch in text:
+        if _width(line + ch, size) <= width:
+            line += ch
+            continue
+        cut = line.rfind(" ")
+        if cut > len(line) // 2:
+            lines.append(line[:cut])
+            line = line[cut + 1:] + ch
+        else:
+            lines.append(line)
+            line = ch.lstrip()
+    lines.append(line)
+    return lines
+
+
+def _pdf_blocks(markdown):
+    """마크다운 → [(종류, 텍스트)]"""
+    blocks = []
+    lines = markdown.splitlines()
+    for i, line in enumerate(lines):
+        line = line.rstrip()
+        heading, bullet, numbered = _HEADING.match(line), _BULLET.match(line), _NUMBERED.match(line)
+        if not line.strip() or _TABLE_SEPARATOR.match(line) and line.lstrip().startswith("|"):
+            continue
+        if _RULE.match(line):
+            blocks.append(("rule", ""))
+        elif heading:
+            blocks.append((min(len(heading.group(1)), 3), _plain(heading.group(2))))
+        elif bullet:
+            blocks.append(("item", "· " + _plain(bullet.group(1))))
+        elif numbered:
+            blocks.append(("item", _plain(line.strip())))
+        elif line.lstrip().startswith("|"):
+            blocks.append(("text", "  ".join(_plain(cell) for cell in _cells(line))))
+        else:
+            blocks.append(("text", _plain(line.lstrip("> "))))
+    return blocks
+
+
+def _pdf_string(text):
+    """UniKS-UCS2-H 인코딩 문자열 (UTF-16BE 16진)"""
+    return "<" + text.encode("utf-16-be").hex().upper() + ">"
+
+
+def _pdf_pages(blocks):
+    """블록 → 페이지별 내용 스트림"""
+    pages, ops, y = [], [], PAGE_HEIGHT - MARGIN
+    width = PAGE_WIDTH - 2 * MARGIN
+    for kind, text in blocks:
+        size, space = PDF_STYLES[kind]
+        leading = size * 1.55
+        indent = 12 if kind == "item" else 0
+        lines = [""] if kind == "rule" else _wrap(text, size, width - indent)
+        for n, line in enumerate(lines):
+            step = leading + (space if n == 0 else 0)
+            if y - step < MARGIN:
+                pages.append("\n".join(ops))
+                ops, y = [], PAGE_HEIGHT - MARGIN
+                step = leading
+            y -= step
+            if kind == "rule":
+                ops.append(f"0.78 0.9 0.79 RG 0.8 w {MARGIN} {y + size / 2:.1f} m {PAGE_WIDTH - MARGIN} {y + size / 2:.1f} l S")
+            elif line:
+                color = "0.11 0.37 0.13 rg" if isinstance(kind, int) else "0.13 0.13 0.13 rg"
+                x = MARGIN + (indent if n > 0 else 0)
+                ops.append(f"BT {color} /F1 {size} Tf {x:.1f} {y:.1f} Td {_pdf_string(line)} Tj ET")
+    pages.append("\n".join(ops))
+    return pages
+
+
+def render_pdf(document):
+    """처방전 → PDF bytes (A4, 글꼴 미포함)"""
+    pages = _pdf_pages(_pdf_blocks(document.markdown))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # 페이지 목록 (아래에서 채움)
+        "<< /Type /Font /Subtype /Type0 /BaseFont /HYGoThic-Medium /Encoding /UniKS-UCS2-H "
+        "/DescendantFonts [4 0 R] >>",
+        "<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HYGoThic-Medium "
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (Korea1) /Supplement 1 >> "
+        "/FontDescriptor 5 0 R /DW 1000 /W [1 95 500] >>",
+        "<< /Type /FontDescriptor /FontName /HYGoThic-Medium /Flags 6 /FontBBox [-6 -145 1003 880] "
+        "/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 720 /StemV 93 >>",
+    ]
+    kids = []
+    for content in pages:
+        data = zlib.compress(content.encode("latin-1"))
+        objects.append(f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode("latin-1") + data + b"\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode("latin-1"))
+        out.write(body if isinstance(body, bytes) else body.encode("latin-1"))
+        out.write(b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    out.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+RENDERERS = {
+    "md": lambda document: document.markdown.encode("utf-8"),
+    "html": render_html,
+    "pdf": render_pdf,
+}
+
+
+# ==================== 렌더 캐시 ====================
+class PrescriptionExporter:
+    """(내용 해시, 형식) → 렌더 결과 (메모리 LRU, 세션 간 공유, 스레드 안전)"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def render(self, document, fmt):
+        """형식별 bytes (같은 내용은 1회만 렌더링)"""
+        key = (document.digest, fmt)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+        if data is not None:
+            metrics.inc("prescription_export_total", format=fmt, result="hit")
+            return data
+        metrics.inc("prescription_export_total", format=fmt, result="miss")
+        with metrics.span("prescription_export", format=fmt):
+            data = RENDERERS[fmt](document)
+        metrics.observe("prescription_export_bytes", len(data), format=fmt)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = data
+                self._size += len(data)
+            while self._cache and (len(self._cache) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._cache.popitem(last=False)
+                self._size -= len(evicted)
+        return data
+
+    def zip(self, documents, formats=tuple(FORMATS)):
+        """여러 처방전 → zip bytes (같은 내용은 한 번만, 파일 이름에 해시 앞자리)
+
+        묶음에 들어가는 처방전은 캐시에 남기지 않는다 (화면에서 보는 처방전을 밀어내지 않도록).
+        """
+        buffer, seen = io.BytesIO(), set()
+        with metrics.span("prescription_export_zip"):
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for document in documents:
+                    if document.digest in seen:
+                        continue
+                    seen.add(document.digest)
+                    for fmt in formats:
+                        with self._lock:
+                            data = self._cache.get((document.digest, fmt))
+                        archive.writestr(document.file_name(fmt, unique=True), data or RENDERERS[fmt](document))
+        metrics.inc("prescription_export_zip_documents_total", len(seen))
+        return buffer.getvalue()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": self._size}
+
+
+# ==================== 저장된 처방전 ====================
+def stored_documents(session_store):
+    """세션 저장소의 처방전 (발급된 것만, 오래된 순으로 조금씩 읽음)"""
+    for token, store_info, result in session_store.prescriptions():
+        yield prescription_document(store_info, result.get("prescription"))
+
+
+def batch_documents(path):
+    """batch.py 결과 JSONL 의 처방전 (성공한 건만)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok" and record.get("prescription"):
+                yield prescription_document(record.get("store_info"), record["prescription"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="처방전 묶음 내보내기 (zip)")
+    parser.add_argument("out", help="만들 zip 파일")
+    parser.add_argument("--sessions", help="세션 저장소 SQLite 파일 (기본: .cache/sessions.sqlite3)")
+    parser.add_argument("--batch", help="batch.py 결과 JSONL")
+    parser.add_argument("--formats", default="md,html,pdf")
+    args = parser.parse_args(argv)
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        parser.error(f"지원하지 않는 형식: {', '.join(unknown)}")
+
+    def documents():
+        if args.batch:
+            yield from batch_documents(args.batch)
+        if args.sessions or not args.batch:
+            from session_store import SessionStore
+            path = args.sessions or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions.sqlite3")
+            yield from stored_documents(SessionStore(path, retention=0))
+
+    data = PrescriptionExporter().zip(documents(), formats)
+    with open(args.out, "wb") as f:
+        f.write(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        count = len(archive.namelist())
+    print(f"{count}개 파일 ({len(data) / 1024:.1f}KB) → {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""프롬프트 구성
+
+템플릿은 모듈 로드 시 한 번만 컴파일하고, 모든 요청에 같은 고정 부분(역할/원칙, 단계별 지시)과
+요청마다 바뀌는 부분(참고 자료 발췌, 가맹점 정보, 상담 내용)을 나눠서 조립한다.
+각 부분의 토큰 수를 따로 집계해 입력 토큰이 어디에 쓰이는지 확인할 수 있다.
+조립 시간은 metrics 의 prompt_build_seconds{stage} 로 기록한다.
+"""
+import hashlib
+import string
+import textwrap
+import threading
+from dataclasses import dataclass, field
+
+import metrics
+from diagnosis import DIAGNOSIS_SCHEMA
+from doc_retrieval import ReferenceIndex, DEFAULT_TOKEN_BUDGET, estimate_tokens
+
+# ==================== 고정 텍스트 ====================
+SYSTEM_PROMPT = """당신은 신한카드 빅데이터 기반 상권 마케팅 전문 의사입니다.
+
+## 응답 원칙
+1. **모든 수치 명시**: 상관계수, 비율, 매장수
+2. **의료 컨셉**: 진단 → 처방 형식
+3. **참고 자료 활용**: 아래 보고서 발췌 내용도 적극 활용"""
+
+# 사이드바 사전 질문별 기본 입력
+PRESET_STORE_INFO = {
+    1: {
+        "business_type": "카페",
+        "location_detail": "역세권/대로변 (유동인구 많음)",
+        "customer_type": "신규 고객 많음",
+        "concern": "주요 고객 특성에 맞는 마케팅 채널과 홍보 방법을 알고 싶어요",
+    },
+    2: {
+        "business_type": "카페",
+        "location_detail": "주택가/골목 (거주민 중심)",
+        "customer_type": "단골 손님 적음",
+        "concern": "재방문율이 30% 이하인데 어떻게 높일 수 있을까요?",
+    },
+    3: {
+        "business_type": "한식-일반",
+        "location_detail": "오피스/업무지구 (직장인 중심)",
+        "customer_type": "신규 고객 많음",
+        "concern": "요식업 매장의 가장 큰 문제점이 무엇인지 알고 이를 개선하고 싶어요",
+    },
+    4: {
+        "business_type": "카페",
+        "location_detail": "역세권/대로변 (유동인구 많음)",
+        "customer_type": "신규 고객 많음",
+        "concern": "같은 지역 내에서도 매출 편차가 큰 이유를 알고 싶어요",
+    },
+    5: {
+        "business_type": "카페",
+        "location_detail": "역세권/대로변 (유동인구 많음)",
+        "customer_type": "신규 고객 많음",
+        "concern": "계절별로 매출이 크게 변동하는데 대응 전략을 알고 싶어요",
+    },
+}
+
+# 사전 질문별 집중 지시
+QUESTION_FOCUS = {
+    1: "카페 고객 특성 및 마케팅 채널 추천에 집중",
+    2: "재방문율 개선 전략에 집중",
+    3: "요식업 문제 분석에 집중",
+    4: "지역별 매출 편차 분석에 집중",
+    5: "계절별 매출 변동 분석에 집중",
+}
+
+DIAGNOSIS_INSTRUCTIONS = """## 작업: 초기 진단
+아래 가맹점 정보로 초기 진단을 지정된 JSON 형식으로 작성하세요.
+- trade_area: 상권 유형(유동형/거주형/직장형)과 근거 매장 수, 고객 구성 비율
+- customers: 주 고객층(가맹점 정보의 주요 고객층)과 신한카드 데이터상 특징, 매출건수 비중, 재방문 상관계수
+- problem: 가맹점 고민 → 1가지 핵심 원인과 상관계수/비율 근거
+- prescription: 즉시 실행 가능한 액션 1개와 기대 효과
+지정된 JSON 항목만 쓰고 문장 항목은 각각 한 문장(40자 안팎)으로, 수치는 참고 자료/상관 데이터에 있는 값만 쓰며 없으면 null 로 두세요."""
+
+CHAT_INSTRUCTIONS = """## 작업: 전문의 상담
+가맹점 정보, 초기 진단, 이전 상담 기록을 바탕으로 점주 질문에 답하세요.
+이미 답한 내용은 반복하지 말고 신한카드 데이터의 구체적 수치로 답변하세요."""
+
+PRESCRIPTION_INSTRUCTIONS = """## 작업: 최종 처방전
+가맹점 정보, 초기 진단, 상담 노트(사실 / 정한 전략 / 언급된 수치)를 종합해 다음 형식의 처방전을 작성하세요.
+상담에서 정한 전략과 수치는 빠짐없이 반영하세요.
+
+# 💊 마케팅 처방전
+
+## 📋 환자 정보
+- 환자명 / 업종 / 위치 / 발급일 (가맹점 정보 그대로)
+
+## 🔬 종합 진단
+[상권 유형 + 고객 구조 + 핵심 문제 3가지 (신한카드 데이터 근거)]
+
+## 💊 처방 내역
+
+### 우선순위 1위
+**처방명:** [구체적 전략]
+**목표:** [수치 목표]
+**근거:** 신한카드 데이터 [상관계수, 비율]
+**실행:**
+1. [실행 1]
+2. [실행 2]
+3. [실행 3]
+**효과:** [구체적 수치]
+
+### 우선순위 2위
+(동일 형식)
+
+## ⚠️ 주의사항
+[주의점 3가지 + 데이터 근거]
+
+**발급일:** [발급일]"""
+
+# 처방전을 섹션별로 나눠 동시에 생성할 때 (제목, 작성 지침) — 템플릿 순서대로 조립
+PRESCRIPTION_SECTIONS = [
+    ("summary", "## 🔬 종합 진단",
+     "상권 유형 + 고객 구조 + 핵심 문제 3가지 (신한카드 데이터 근거)"),
+    ("priority1", "### 우선순위 1위",
+     "점주 고민을 가장 직접적으로 해결하는 전략 1개.\n"
+     "**처방명:** / **목표:** (수치) / **근거:** 신한카드 데이터 (상관계수, 비율) / **실행:** 1~3 / **효과:** (수치) 형식"),
+    ("priority2", "### 우선순위 2위",
+     "1위(고민 직접 해결)와 다른 축(홍보 채널, 상품/가격, 운영 시간 등)의 보완 전략 1개.\n"
+     "**처방명:** / **목표:** (수치) / **근거:** 신한카드 데이터 (상관계수, 비율) / **실행:** 1~3 / **효과:** (수치) 형식"),
+    ("cautions", "## ⚠️ 주의사항",
+     "처방 실행 시 주의점 3가지 + 데이터 근거"),
+]
+
+PRESCRIPTION_SECTION_INSTRUCTIONS = """## 작업: 최종 처방전 (섹션별 작성)
+처방전은 종합 진단 → 우선순위 1위 → 우선순위 2위 → 주의사항 순서로 구성되며, 각 섹션을 따로 작성해 합칩니다.
+가맹점 정보, 초기 진단, 상담 노트를 종합해 맨 아래 '작성할 섹션'만 작성하세요.
+섹션 제목과 환자 정보는 쓰지 말고 본문만 간결하게 작성하세요."""
+
+PRESCRIPTION_HEADER = string.Template("""# 💊 마케팅 처방전
+
+## 📋 환자 정보
+- 환자명: $store_name
+- 업종: $business_type
+- 위치: $region - $location
+- 발급일: $issued""")
+
+
+# 단계별 최대 출력 토큰 (MAX_OUTPUT_TOKENS_<단계> 설정으로 변경)
+OUTPUT_TOKEN_LIMITS = {
+    "diagnosis": 512,
+    "chat": 1024,
+    "prescription": 2048,
+    "prescription_section": 640,
+}
+
+
+def generation_options(stage, max_output_tokens=None):
+    """단계별 생성 옵션 (최대 출력 토큰, 초기 진단은 JSON 스키마)"""
+    options = {"max_output_tokens": max_output_tokens or OUTPUT_TOKEN_LIMITS.get(stage)}
+    if stage == "diagnosis":
+        options.update(response_mime_type="application/json", response_schema=DIAGNOSIS_SCHEMA)
+    return {name: value for name, value in options.items() if value is not None}
+
+
+# ==================== 템플릿 ====================
+@dataclass
+class PromptParts:
+    """조립된 프롬프트 (이름 붙은 부분들의 순서 있는 목록)"""
+    stage: str
+    parts: list = field(default_factory=list)   # [(이름, 텍스트, 고정 여부)]
+
+    def add(self, name, text, static=False):
+        if text:
+            self.parts.append((name, text, static))
+        return self
+
+    @property
+    def text(self):
+        return "\n\n".join(text for _, text, _ in self.parts)
+
+    @property
+    def static_prefix(self):
+        """요청과 무관한 앞부분 (맨 앞의 고정 부분들)"""
+        prefix = []
+        for _, text, static in self.parts:
+            if not static:
+                break
+            prefix.append(text)
+        return "\n\n".join(prefix)
+
+    @property
+    def dynamic_tail(self):
+        """static_prefix 이후 나머지"""
+        tail, in_tail = [], False
+        for _, text, static in self.parts:
+            if not static:
+                in_tail = True
+            if in_tail:
+                tail.append(text)
+        return "\n\n".join(tail)
+
+    def token_counts(self):
+        """부분별 추정 토큰 수 {이름: 토큰}"""
+        counts = {}
+        for name, text, _ in self.parts:
+            counts[name] = counts.get(name, 0) + estimate_tokens(text)
+        return counts
+
+
+class PromptTemplate:
+    """고정 지시문 + 요청별 필드 템플릿 (string.Template 은 생성 시 1회 컴파일)"""
+
+    def __init__(self, stage, instructions, body):
+        self.stage = stage
+        self.instructions = instructions.strip()
+        self._body = string.Template(textwrap.dedent(body).strip())
+
+    def render(self, reference="", history="", full_reference=False, data="", **fields):
+        """full_reference=True 면 reference 를 보고서 전체로 보고 고정 앞부분에 포함
+
+        data: 가맹점 조건에 맞는 상관 데이터 (correlations.CorrelationStore.prompt_block)
+        """
+        prompt = PromptParts(self.stage)
+        prompt.add("system", SYSTEM_PROMPT, static=True)
+        prompt.add("instructions", self.instructions, static=True)
+        if full_reference:
+            prompt.add("reference", f"## 참고 자료 (보고서 전체)\n{reference}", static=True)
+        else:
+            prompt.add("reference", f"## 참고 자료 (보고서 발췌)\n{reference}" if reference else "")
+        prompt.add("data", f"## 신한카드 상관 데이터 (가맹점 조건 해당분)\n{data}" if data else "")
+        prompt.add("history", f"## 상담 기록\n{history}" if history else "")
+        prompt.add("request", self._body.safe_substitute(fields))
+        return prompt
+
+
+STORE_BLOCK = string.Template(textwrap.dedent("""
+    가맹점 정보:
+    - 이름: $store_name
+    - 업종: $business_type
+    - 위치: $region - $location
+    - 상권: $location_detail
+    - 손님 특성: $customer_type
+    - 주요 고객: $customer_demographics
+    - 고민: $concern
+""").strip())
+
+DIAGNOSIS_TEMPLATE = PromptTemplate("diagnosis", DIAGNOSIS_INSTRUCTIONS, """
+    $focus
+    가맹점:
+    - 지역: $region - $location ($location_detail)
+    - 업종: $business_type
+    - 손님 특성: $customer_type
+    - 주요 고객층: $customer_demographics
+    - 고민: $concern
+""")
+
+CHAT_TEMPLATE = PromptTemplate("chat", CHAT_INSTRUCTIONS, """
+    $store
+
+    초기 진단:
+    $diagnosis
+
+    점주 질문: $question
+""")
+
+PRESCRIPTION_TEMPLATE = PromptTemplate("prescription", PRESCRIPTION_INSTRUCTIONS, """
+    $store
+    - 발급일: $issued
+
+    초기 진단:
+    $diagnosis
+
+    상담 노트:
+    $consultation
+""")
+
+PRESCRIPTION_SECTION_TEMPLATE = PromptTemplate("prescription_section", PRESCRIPTION_SECTION_INSTRUCTIONS, """
+    $store
+    - 발급일: $issued
+
+    초기 진단:
+    $diagnosis
+
+    상담 노트:
+    $consultation
+
+    작성할 섹션: $section_title
+    $section_guide
+""")
+
+
+def _template_version():
+    """고정 문구 / 템플릿 원문 해시 (문구를 고치면 응답 캐시 키가 바뀜)"""
+    parts = [SYSTEM_PROMPT, STORE_BLOCK.template, repr(sorted(QUESTION_FOCUS.items())), repr(PRESCRIPTION_SECTIONS)]
+    for template in (DIAGNOSIS_TEMPLATE, CHAT_TEMPLATE, PRESCRIPTION_TEMPLATE, PRESCRIPTION_SECTION_TEMPLATE):
+        parts += [template.instructions, template._body.template]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def _store_fields(store_info):
+    fields = {key: store_info.get(key, "") for key in (
+        "store_name", "business_type", "region", "location", "location_detail",
+        "customer_type", "customer_demographics", "concern",
+    )}
+    return {key: value if value is not None else "" for key, value in fields.items()}
+
+
+def store_block(store_info):
+    """가맹점 정보 블록"""
+    return STORE_BLOCK.safe_substitute(_store_fields(store_info))
+
+
+def prescription_header(store_info, issued):
+    """처방전 머리말 (모델 없이 가맹점 정보로 채움)"""
+    return PRESCRIPTION_HEADER.safe_substitute(_store_fields(store_info), issued=issued)
+
+
+def assemble_prescription(header, sections, issued):
+    """섹션 본문 [(이름, 제목, 본문)] → 처방전 전체 마크다운 (템플릿 순서)"""
+    blocks = [header]
+    for name, title, body in sections:
+        if name == "priority1":
+            blocks.append("## 💊 처방 내역")
+        blocks.append(f"{title}\n{body.strip()}")
+    blocks.append(f"**발급일:** {issued}")
+    return "\n\n".join(blocks)
+
+
+def consultation_log(messages, limit=10, width=150):
+    """처방전용 상담 기록 (최근 limit 개, 메시지당 width 자) — 화면은 consultation_digest 노트를 넘김"""
+    return "\n".join(f"- {msg['content'][:width]}..." for msg in messages[-limit:])
+
+
+# ==================== 문서 버전별 빌더 ====================
+class PromptBuilder:
+    """문서 한 버전에 대한 프롬프트 빌더 (섹션 인덱스 / 압축 문서를 1회만 생성)
+
+    full_reference=True 면 요청별 발췌 대신 압축한 보고서 전체를 고정 앞부분에 넣는다.
+    앞부분이 단계별로 항상 같아지므로 공급자측 컨텍스트 캐시(context_cache.py)에 등록할 수 있다.
+    """
+
+    def __init__(self, html, version=None, token_budget=DEFAULT_TOKEN_BUDGET, full_reference=False, correlations=None):
+        """correlations: correlations.CorrelationStore (주면 조건에 맞는 상관 데이터 행을 프롬프트에 넣음)"""
+        self.version = version
+        self.correlations = correlations
+        self.token_budget = token_budget
+        self.full_reference = full_reference
+        self._html = html
+        self._index = None
+        self._built = False
+        self._build_lock = threading.Lock()
+        self._compact = None
+
+    @property
+    def index(self):
+        """섹션 인덱스 (첫 사용 또는 warm_up() 때 1회 생성, 문서가 없으면 None)"""
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    with metrics.span("reference_index_build"):
+                        self._index = ReferenceIndex.from_html(self._html) if self._html else None
+                    self._html = None
+                    self._built = True
+        return self._index
+
+    def warm_up(self):
+        """인덱스(전체 문서 모드면 압축본까지) 미리 생성 — 서버 시작 시 백그라운드에서 호출"""
+        if self.full_reference:
+            return self.compact_reference
+        return self.index
+
+    @property
+    def compact_reference(self):
+        """보고서 전체를 태그/CSS 없이 압축한 텍스트 (지연 생성 후 재사용)"""
+        if self._compact is None:
+            if self.index is None:
+                self._compact = ""
+            else:
+                sections = sorted(self.index.sections.values(), key=lambda s: s.order)
+                self._compact = "\n\n".join(s.text for s in sections if s.text)
+        return self._compact
+
+    @property
+    def prompt_version(self):
+        """템플릿 해시 + 상관 데이터 해시 (참고 문서 버전과 함께 응답 캐시 키에 들어감)"""
+        data_version = self.correlations.version if self.correlations is not None else "-"
+        return f"{TEMPLATE_VERSION}:{data_version}"
+
+    def reference(self, store_info, query=""):
+        if self.index is None:
+            return "참고 문서 로드 실패"
+        if self.full_reference:
+            return self.compact_reference
+        return self.index.render(store_info, query, self.token_budget) or "(관련 섹션 없음)"
+
+    def data(self, store_info):
+        return self.correlations.prompt_block(store_info) if self.correlations is not None else ""
+
+    def diagnosis(self, store_info):
+        focus = QUESTION_FOCUS.get(store_info.get("question_type"))
+        with metrics.span("prompt_build", stage="diagnosis"):
+            return DIAGNOSIS_TEMPLATE.render(
+                reference=self.reference(store_info),
+                full_reference=self.full_reference,
+                data=self.data(store_info),
+                focus=f"[중요] {focus}\n" if focus else "",
+                **_store_fields(store_info),
+            )
+
+    def chat(self, store_info, diagnosis, question, history=""):
+        """history: chat_memory.ConversationMemory.history() 결과"""
+        with metrics.span("prompt_build", stage="chat"):
+            return CHAT_TEMPLATE.render(
+                reference=self.reference(store_info, question),
+                full_reference=self.full_reference,
+                data=self.data(store_info),
+                history=history,
+                store=store_block(store_info),
+                diagnosis=diagnosis,
+                question=question,
+            )
+
+    def prescription_sections(self, store_info, diagnosis, consultation, issued):
+        """섹션별 프롬프트 [(이름, 제목, PromptParts)] — 앞부분이 모두 같아 같은 컨텍스트를 공유"""
+        if not isinstance(consultation, str):
+            consultation = consultation_log(consultation)
+        with metrics.span("prompt_build", stage="prescription_section"):
+            reference = self.reference(store_info)
+            data = self.data(store_info)
+            return [
+                (name, title, PRESCRIPTION_SECTION_TEMPLATE.render(
+                    reference=reference,
+                    full_reference=self.full_reference,
+                    data=data,
+                    store=store_block(store_info),
+                    issued=issued,
+                    diagnosis=diagnosis,
+                    consultation=consultation or "(상담 없음)",
+                    section_title=title.lstrip("# "),
+                    section_guide=guide,
+                ))
+                for name, title, guide in PRESCRIPTION_SECTIONS
+            ]
+
+    def prescription(self, store_info, diagnosis, consultation, issued):
+        """consultation: 상담 기록 텍스트 또는 메시지 목록"""
+        if not isinstance(consultation, str):
+            consultation = consultation_log(consultation)
+        with metrics.span("prompt_build", stage="prescription"):
+            return PRESCRIPTION_TEMPLATE.render(
+                reference=self.reference(store_info),
+                full_reference=self.full_reference,
+                data=self.data(store_info),
+                store=store_block(store_info),
+                issued=issued,
+                diagnosis=diagnosis,
+                consultation=consultation or "(상담 없음)",
+            )
+
@@ -0,0 +1,269 @@
+"""상담 질문 유사도 캐시 (같은 세그먼트의 거의 같은 질문이면 이전 답변 재사용)
+
+같은 업종 / 상권 유형 / 사전 질문의 점주들은 "단골 늘리는 방법?" 같은 질문을 반복한다.
+세그먼트(모델, 문서 버전, business_type, location_detail, question_type, 진단 해시)별로 질문을
+문자 n-gram TF-IDF 벡터로 두고, 새 질문과의 코사인 유사도가 threshold 이상이면 저장된 답변을 돌려준다.
+답변은 초기 진단 내용과 이전 대화에 따라 달라지므로 진단 요약의 해시를 세그먼트에 넣고,
+호출하는 쪽(app.py)은 이전 대화가 없는 첫 질문만 조회 / 저장한다.
+한국어는 띄어쓰기/조사 변형이 많아 단어 대신 어절 안의 음절 1~2-gram 을 쓰고,
+어절 끝 조사와 "어떻게 하나요", "알려주세요" 같은 질문 틀 표현은 빼고 비교한다
+(어절 경계를 넘는 n-gram 은 조사 하나로 모두 바뀌어 "단골을 늘리는" / "단골 늘리는" 이 멀어짐).
+IDF 는 캐시에 있는 모든 질문 기준으로 갱신하므로 "방법", "추천" 같은 흔한 조각의 비중은 낮아진다.
+n-gram 유사도만으로는 한 단어만 바뀐 반대 질문("얼마가 적당한가요?" / "얼마가 과한가요?")을 가르지 못하므로,
+threshold 를 넘은 후보라도 양쪽에 상대에 없는 내용 어절이 하나씩 있으면(단어가 다른 단어로 바뀜) 버린다.
+한쪽에만 더 있는 어절("단골 손님 늘리는" / "단골 늘리는")은 바꿔 말하기로 보고, 같은 어절인지는
+앞 두 음절(짧은 쪽은 전체)로 본다 ("늘리는" / "늘리려면" 은 같고 "늘리는" / "줄이는" 은 다름).
+
+메모리에만 두며(프로세스당 1개) 전체 max_entries 개 초과 시 가장 오래 안 쓴 항목부터,
+세그먼트별 max_per_segment 개 초과 시 그 세그먼트에서 가장 오래 안 쓴 항목부터, ttl 초 지난 항목은 조회 시 지운다.
+적중률은 metrics 의 chat_similarity_cache_total{result} 와 stats() 로 확인한다.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+import metrics
+
+# 기본값
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_PER_SEGMENT = 200
+DEFAULT_TTL = 24 * 3600
+NGRAM_SIZES = (1, 2)
+STEM_SYLLABLES = 2         # 같은 어절로 볼 앞 음절 수
+
+_PUNCTUATION = re.compile(r"[^\w]+")
+
+# 어절 끝에서 떼는 조사 ("이"/"가" 는 명사 끝 글자와 겹쳐서 제외: 객단가 → 객단)
+PARTICLES = ("에서", "으로", "이랑", "에게", "을", "를", "은", "는", "과", "와", "에", "도")
+# 의도와 상관없는 질문 틀 표현 (같은 질문을 다르게 묻는 부분)
+STOPWORDS = frozenset((
+    "방법", "방법이", "어떻게", "어떤", "뭐가", "무엇", "좀", "알려주세요", "해주세요", "하나요", "해야",
+    "할까요", "있을까요", "있나요", "있어요", "되나요", "좋을까요", "걸", "하면",
+))
+
+
+def normalize(text):
+    """비교용 정규화 (NFC, 소문자, 문장부호/공백 제거)"""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFC", text or "").lower())
+
+
+def _content_word(word):
+    """어절 끝 조사를 떼고, 질문 틀 표현("어떻게", "알려주세요" 등)이면 None"""
+    if word in STOPWORDS:
+        return None
+    for particle in PARTICLES:
+        if len(word) > len(particle) + 1 and word.endswith(particle):
+            word = word[:-len(particle)]
+            break
+    return None if word in STOPWORDS else word
+
+
+def _words(text):
+    words = _PUNCTUATION.sub(" ", unicodedata.normalize("NFC", text or "").lower()).split()
+    return [word for word in map(_content_word, words) if word]
+
+
+def content_words(text):
+    """질문의 내용 어절 집합 (조사를 떼고 질문 틀 표현은 뺌)"""
+    return frozenset(_words(text))
+
+
+def ngrams(text):
+    """질문의 어절별 음절 n-gram 개수 (조사 / 질문 틀 표현 제외)"""
+    grams = Counter()
+    for word in _words(text):
+        for n in NGRAM_SIZES:
+            grams.update(word[i:i + n] for i in range(len(word) - n + 1))
+    return grams
+
+
+def _same_word(a, b):
+    n = min(STEM_SYLLABLES, len(a), len(b))
+    return a[:n] == b[:n]
+
+
+def substituted(words, other):
+    """두 질문의 내용 어절 중 서로 대응하지 않는 것이 양쪽에 다 있는지 (어절이 다른 어절로 바뀐 질문)"""
+    def unmatched(side, against):
+        return any(not any(_same_word(word, candidate) for candidate in against) for word in side)
+    return unmatched(words, other) and unmatched(other, words)
+
+
+def segment_key(model_name, version, store_info, diagnosis=""):
+    """세그먼트 키 (같은 키끼리만 답변 공유, diagnosis: 프롬프트에 넣는 진단 요약)"""
+    info = store_info or {}
+    diagnosis_hash = hashlib.sha256((diagnosis or "").encode("utf-8")).hexdigest()[:12]
+    return (model_name, version, info.get("business_type"), info.get("location_detail"), info.get("question_type"),
+            diagnosis_hash)
+
+
+@dataclass
+class Entry:
+    """저장된 질문 하나"""
+    segment: tuple
+    question: str
+    answer: str
+    grams: Counter
+    words: frozenset
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+    vector: dict = None     # 정규화한 TF-IDF 벡터 (IDF 가 바뀌면 다시 계산)
+    generation: int = -1
+
+
+@dataclass
+class Match:
+    """조회 결과"""
+    question: str
+    answer: str
+    score: float
+
+
+class QuestionCache:
+    """세그먼트별 유사 질문 → 답변 캐시 (세션 간 공유, 스레드 안전)"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_per_segment=DEFAULT_MAX_PER_SEGMENT, ttl=DEFAULT_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_per_segment = max_per_segment
+        self.ttl = ttl
+        self._entries = OrderedDict()     # id → Entry (LRU 순서)
+        self._segments = {}               # 세그먼트 → {id}
+        self._exact = {}                  # (세그먼트, 정규화한 질문) → id
+        self._df = Counter()              # n-gram → 포함한 질문 수 (IDF 용)
+        self._generation = 0              # 저장/제거 때마다 증가 (캐시해 둔 벡터 무효화)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    # ---------- 벡터 ----------
+    def _idf(self, gram):
+        return math.log((1 + len(self._entries)) / (1 + self._df.get(gram, 0))) + 1.0
+
+    def _vector(self, grams):
+        vector = {gram: count * self._idf(gram) for gram, count in grams.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {gram: v / norm for gram, v in vector.items()}
+
+    def _score(self, query, entry):
+        """두 질문의 TF-IDF 코사인 유사도 (현재 IDF 기준)"""
+        if entry.generation != self._generation:
+            entry.vector, entry.generation = self._vector(entry.grams), self._generation
+        other = entry.vector
+        return sum(weight * other.get(gram, 0.0) for gram, weight in query.items())
+
+    # ---------- 조회 / 저장 ----------
+    def lookup(self, segment, question):
+        """threshold 이상으로 가장 비슷한 저장 질문의 Match, 없으면 None"""
+        started = time.perf_counter()
+        grams = ngrams(question)
+        best, best_score = None, 0.0
+        with self._lock:
+            self._expire(time.time())
+            exact = self._exact.get((segment, normalize(question)))
+            if exact is not None:
+                best, best_score = exact, 1.0
+            elif grams:
+                query, words = self._vector(grams), content_words(question)
+                for entry_id in self._segments.get(segment, ()):
+                    entry = self._entries[entry_id]
+                    score = self._score(query, entry)
+                    if score <= best_score:
+                        continue
+                    if score >= self.threshold and substituted(words, entry.words):
+                        self._stats["rejected"] += 1
+                        metrics.inc("chat_similarity_rejected_total")
+                        continue
+                    best, best_score = entry_id, score
+            match = None
+            if best is not None and best_score >= self.threshold:
+                entry = self._entries[best]
+                entry.hits += 1
+                self._entries.move_to_end(best)
+                match = Match(entry.question, entry.answer, best_score)
+            self._stats["hits" if match else "misses"] += 1
+        metrics.inc("chat_similarity_cache_total", result="hit" if match else "miss")
+        metrics.observe("chat_similarity_lookup_seconds", time.perf_counter() - started)
+        if match:
+            metrics.observe("chat_similarity_score", match.score)
+        return match
+
+    def put(self, segment, question, answer):
+        """답변 저장 (같은 세그먼트에 같은 질문이 있으면 교체)"""
+        grams = ngrams(question)
+        if not grams or not answer:
+            return
+        with self._lock:
+            key = (segment, normalize(question))
+            if key in self._exact:
+                self._remove(self._exact[key])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = Entry(segment, question, answer, grams, content_words(question))
+            self._segments.setdefault(segment, set()).add(entry_id)
+            self._exact[key] = entry_id
+            self._df.update(grams.keys())
+            self._generation += 1
+            self._evict(segment)
+
+    # ---------- 제거 ----------
+    def _remove(self, entry_id, reason=None):
+        entry = self._entries.pop(entry_id)
+        members = self._segments[entry.segment]
+        members.discard(entry_id)
+        if not members:
+            del self._segments[entry.segment]
+        self._exact.pop((entry.segment, normalize(entry.question)), None)
+        self._df.subtract(entry.grams.keys())
+        for gram in entry.grams:
+            if self._df[gram] <= 0:
+                del self._df[gram]
+        self._generation += 1
+        if reason:
+            self._stats[f"evicted_{reason}"] += 1
+            metrics.inc("chat_similarity_cache_evictions_total", reason=reason)
+
+    def _evict(self, segment):
+        members = self._segments.get(segment, ())
+        if len(members) > self.max_per_segment:
+            # 세그먼트 안에서 가장 오래 안 쓴 항목 (LRU 순서상 가장 앞)
+            oldest = next(entry_id for entry_id in self._entries if entry_id in members)
+            self._remove(oldest, "segment")
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)), "capacity")
+
+    def _expire(self, now):
+        if not self.ttl:
+            return
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry.created > self.ttl]
+        for entry_id in expired:
+            self._remove(entry_id, "ttl")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._segments.clear()
+            self._exact.clear()
+            self._df.clear()
+
+    def stats(self):
+        """항목 수 / 세그먼트 수 / 적중률 / 어절이 달라 버린 후보 수 / 제거 수"""
+        with self._lock:
+            hits, misses = self._stats["hits"], self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "segments": len(self._segments),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "rejected": self._stats["rejected"],
+                "evictions": sum(v for k, v in self._stats.items() if k.startswith("evicted_")),
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,169 @@
+"""참고 문서 로더 (오프라인 우선 + 백그라운드 조건부 갱신)
+
+시작 시에는 저장소에 포함된 docs/ 사본을 바로 읽고, GitHub 원본은 백그라운드 스레드에서
+ETag / If-Modified-Since 조건부 GET 으로 확인한다. 내용이 실제로 바뀐 경우에만
+새 스냅샷으로 한 번에 교체하므로 화면 렌더링은 네트워크를 기다리지 않는다.
+갱신 시간과 결과는 metrics 의 reference_refresh_seconds / reference_refresh_total{result} 로 기록한다.
+requests 는 첫 갱신 때(백그라운드 스레드) 불러오므로 첫 화면 시간에 포함되지 않는다.
+"""
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 기본 갱신 주기 (초)
+DEFAULT_REFRESH_INTERVAL = 3600
+
+
+@dataclass(frozen=True)
+class DocumentSnapshot:
+    """문서 한 버전 (교체 시 통째로 바꾸는 불변 객체)"""
+    text: str
+    version: str
+    source: str
+    etag: str = None
+    last_modified: str = None
+    loaded_at: float = 0.0
+
+
+def content_version(text):
+    """문서 내용 해시 (버전 식별자)"""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:12]
+
+
+def make_session(pool_size=4):
+    """커넥션 풀을 쓰는 requests 세션 (일시 오류는 짧게 재시도)"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ReferenceDocument:
+    """참고 문서 보관소"""
+
+    def __init__(self, url, local_path, refresh_interval=DEFAULT_REFRESH_INTERVAL, timeout=10, session=None):
+        self.url = url
+        self.local_path = local_path
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._session = session  # 없으면 첫 갱신 때 생성
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self.last_error = None
+        self.last_checked = None
+        self._snapshot = self._load_local()
+
+    @property
+    def snapshot(self):
+        """현재 문서 스냅샷 (읽기는 잠금 없이 참조 하나만 가져감)"""
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """문서가 바뀌면 callback(snapshot) 호출"""
+        self._listeners.append(callback)
+
+    def _load_local(self):
+        try:
+            with open(self.local_path, encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            logger.warning("번들 참고 문서 읽기 실패: %s", e)
+            text = ""
+        return DocumentSnapshot(text=text, version=content_version(text), source="local", loaded_at=time.time())
+
+    def refresh(self):
+        """원본 조건부 GET, 내용이 바뀌었으면 교체 후 True"""
+        started = time.perf_counter()
+        result = "error"
+        try:
+            changed = self._refresh()
+            result = "changed" if changed else "unchanged"
+            return changed
+        finally:
+            if self.last_error is not None:
+                result = "error"
+            elapsed = time.perf_counter() - started
+            metrics.observe("reference_refresh_seconds", elapsed)
+            metrics.inc("reference_refresh_total", result=result)
+            metrics.event("reference_refresh", result=result, version=self._snapshot.version, seconds=round(elapsed, 6))
+
+    def _refresh(self):
+        current = self._snapshot
+        headers = {}
+        if current.etag:
+            headers["If-None-Match"] = current.etag
+        if current.last_modified:
+            headers["If-Modified-Since"] = current.last_modified
+        try:
+            if self._session is None:
+                self._session = make_session()
+            response = self._session.get(self.url, headers=headers, timeout=self.timeout)
+            self.last_checked = time.time()
+            if response.status_code == 304:
+                self.last_error = None
+                return False
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            text = response.text
+        except Exception as e:  # 네트워크 오류는 기존 스냅샷 유지
+            self.last_error = str(e)
+            logger.warning("참고 문서 갱신 실패: %s", e)
+            return False
+
+        self.last_error = None
+        version = content_version(text)
+        fresh = DocumentSnapshot(
+            text=text,
+            version=version,
+            source="remote",
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            loaded_at=time.time(),
+        )
+        with self._lock:
+            changed = version != self._snapshot.version
+            if not changed:
+                # 내용은 같음: 다음 조건부 요청용 헤더만 갱신
+                fresh = DocumentSnapshot(
+                    text=self._snapshot.text, version=self._snapshot.version, source=self._snapshot.source,
+                    etag=fresh.etag, last_modified=fresh.last_modified, loaded_at=self._snapshot.loaded_at,
+                )
+            self._snapshot = fresh
+        if changed:
+            logger.info("참고 문서 갱신: %s → %s", current.version, version)
+            for callback in list(self._listeners):
+                try:
+                    callback(fresh)
+                except Exception:
+                    logger.exception("참고 문서 변경 알림 실패")
+        return changed
+
+    def start(self):
+        """백그라운드 갱신 스레드 시작 (이미 실행 중이면 무시)"""
+        if not self.url or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reference-doc-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
@@ -0,0 +1,106 @@
+"""여러 섹션을 동시에 생성 (처방전 병렬 모드)
+
+섹션마다 스레드 하나에서 스트리밍 호출을 하고 도착한 조각을 섹션별 버퍼에 쌓는다.
+화면 갱신은 Streamlit 스크립트 스레드가 updates() 로 버퍼를 주기적으로 읽어 하므로
+작업 스레드는 st 를 전혀 호출하지 않는다. 동시 호출 수는 백엔드 관문(call_gate)이 제한한다.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# 섹션 생성 작업은 세션 간에 공유하는 스레드에서 처리
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="section")
+
+
+@dataclass
+class SectionState:
+    """섹션 하나의 진행 상태"""
+    name: str
+    title: str
+    pieces: list = field(default_factory=list)
+    done: bool = False
+    error: Exception = None
+    result: object = None          # 끝난 TextStream / LLMResponse (토큰 수 기록용)
+    first_token: float = None      # 시작 후 첫 조각까지 (초)
+    finished: float = None         # 시작 후 완료까지 (초)
+
+    @property
+    def text(self):
+        return "".join(self.pieces)
+
+
+class SectionedGeneration:
+    """sections: [(이름, 제목, 호출 함수)] — 호출 함수는 조각을 내는 iterable(TextStream 등)을 반환"""
+
+    def __init__(self, sections):
+        self.sections = [SectionState(name, title) for name, title, _ in sections]
+        self._calls = [call for _, _, call in sections]
+        self._lock = threading.Lock()
+        self._started = None
+        self._futures = []
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._futures = [_executor.submit(self._run, state, call) for state, call in zip(self.sections, self._calls)]
+        return self
+
+    def _run(self, state, call):
+        try:
+            stream = call()
+            for piece in stream:
+                with self._lock:
+                    if state.first_token is None:
+                        state.first_token = time.perf_counter() - self._started
+                    state.pieces.append(piece)
+            state.result = stream
+        except Exception as e:
+            state.error = e
+        finally:
+            with self._lock:
+                state.finished = time.perf_counter() - self._started
+                state.done = True
+
+    @property
+    def done(self):
+        with self._lock:
+            return all(state.done for state in self.sections)
+
+    def snapshot(self):
+        """[(이름, 제목, 현재까지 텍스트, 완료 여부)]"""
+        with self._lock:
+            return [(s.name, s.title, s.text, s.done) for s in self.sections]
+
+    def updates(self, interval=0.05):
+        """변화가 있을 때마다 snapshot() 을 내고, 모두 끝나면 마지막 snapshot 후 종료"""
+        last = None
+        while True:
+            finished = self.done
+            current = self.snapshot()
+            if current != last:
+                yield current
+                last = current
+            if finished:
+                return
+            time.sleep(interval)
+
+    def wait(self):
+        for future in self._futures:
+            future.result()
+        return self
+
+    def raise_for_error(self):
+        """실패한 섹션이 있으면 첫 오류를 다시 발생"""
+        for state in self.sections:
+            if state.error is not None:
+                raise state.error
+
+    @property
+    def first_token(self):
+        times = [s.first_token for s in self.sections if s.first_token is not None]
+        return min(times) if times else None
+
+    @property
+    def elapsed(self):
+        times = [s.finished for s in self.sections if s.finished is not None]
+        return max(times) if times else None
@@ -0,0 +1,278 @@
+"""진료 세션 저장소 (SQLite 디스크 저장 + 메모리 작업 집합)
+
+접수 정보, 진행 단계, 진단/처방전, 상담 메시지를 파일에 저장해 재시작 후에도 남기고
+세션 토큰(진료 번호)으로 이어서 진료할 수 있게 한다. 메모리에는 최근에 쓴 세션만
+최대 max_sessions 개, 세션마다 최근 메시지 window 개만 두고, idle_timeout 초 동안
+쓰지 않은 세션은 메모리에서 내린다(디스크에는 retention 동안 남음).
+상담 요약(chat_memory)은 저장하지 않으므로 이어하기 후 첫 답변에서 다시 만들어진다.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# 기본값
+DEFAULT_MAX_SESSIONS = 200          # 메모리에 둘 세션 수
+DEFAULT_IDLE_TIMEOUT = 15 * 60      # 이 시간 동안 쓰지 않으면 메모리에서 내림 (초)
+DEFAULT_WINDOW = 40                 # 세션당 메모리에 둘 최근 메시지 수
+DEFAULT_RETENTION = 30 * 24 * 3600  # 디스크 보관 기간 (초)
+
+INITIAL_STEP = "접수"
+
+
+class Session:
+    """진료 세션 하나 (값을 바꾸는 메서드는 바로 디스크에 기록)"""
+
+    def __init__(self, store, token, step=INITIAL_STEP, store_info=None, diagnosis_result=None,
+                 selected_question=None, messages=None, offset=0, created=None):
+        self._store = store
+        self.token = token
+        self.step = step
+        self.store_info = store_info or {}
+        self.diagnosis_result = diagnosis_result or {}
+        self.selected_question = selected_question
+        self.messages = messages or []   # 최근 window 개 (앞의 offset 개는 디스크에만)
+        self.offset = offset
+        self.created = created or time.time()
+        self.accessed = time.monotonic()
+
+    @property
+    def message_count(self):
+        return self.offset + len(self.messages)
+
+    def update(self, **fields):
+        """step / store_info / diagnosis_result / selected_question 변경"""
+        for name, value in fields.items():
+            if name not in ("step", "store_info", "diagnosis_result", "selected_question"):
+                raise AttributeError(name)
+            setattr(self, name, value)
+        self._store._save(self)
+
+    def set_result(self, name, text):
+        """진단 결과 항목 하나 저장 (initial / prescription)"""
+        self.diagnosis_result = dict(self.diagnosis_result, **{name: text})
+        self._store._save(self)
+
+    def append(self, role, content):
+        """메시지 추가 (메모리에는 최근 window 개만 유지)"""
+        message = {"role": role, "content": content}
+        self._store._append(self, message)
+        self.messages.append(message)
+        excess = len(self.messages) - self._store.window
+        if excess > 0:
+            del self.messages[:excess]
+            self.offset += excess
+        return message
+
+    def all_messages(self):
+        """전체 메시지 (메모리 밖으로 밀려난 것이 있으면 디스크에서 읽음)"""
+        if not self.offset:
+            return list(self.messages)
+        return self._store._load_messages(self.token)
+
+    def reset(self):
+        """처음으로: 접수 정보 / 진단 / 상담 기록 삭제 (토큰은 유지)"""
+        self.step = INITIAL_STEP
+        self.store_info = {}
+        self.diagnosis_result = {}
+        self.selected_question = None
+        self.messages = []
+        self.offset = 0
+        self._store._save(self, clear_messages=True)
+
+
+class SessionStore:
+    """SQLite 세션 저장소 (프로세스당 1개, 세션 간 공유)"""
+
+    def __init__(self, path, max_sessions=DEFAULT_MAX_SESSIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 window=DEFAULT_WINDOW, retention=DEFAULT_RETENTION):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.window = max(window, 2)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()   # 토큰 → Session (LRU 순서)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                token TEXT PRIMARY KEY,
+                step TEXT NOT NULL,
+                store_info TEXT NOT NULL,
+                diagnosis_result TEXT NOT NULL,
+                selected_question INTEGER,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                token TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (token, seq)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated)")
+        self.purge()
+
+    # ---------- 세션 열기 ----------
+    def create(self):
+        """새 세션 (토큰 발급 후 바로 저장)"""
+        session = Session(self, secrets.token_urlsafe(12))
+        self._save(session)
+        with self._lock:
+            self._remember(session)
+        metrics.inc("session_store_created_total")
+        return session
+
+    def open(self, token):
+        """토큰으로 세션 조회 (메모리 → 디스크 순), 없으면 None"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(token) if token else None
+            if session is not None:
+                self._sessions.move_to_end(token)
+                session.accessed = now
+                metrics.inc("session_store_lookups_total", result="memory")
+                return session
+        session = self._load(token) if token else None
+        if session is None:
+            metrics.inc("session_store_lookups_total", result="missing")
+            return None
+        with self._lock:
+            # 다른 스레드가 먼저 올려놨으면 그것을 사용
+            session = self._sessions.get(token) or session
+            self._remember(session)
+        metrics.inc("session_store_lookups_total", result="disk")
+        return session
+
+    def open_or_create(self, token):
+        return self.open(token) or self.create()
+
+    def _remember(self, session):
+        self._sessions[session.token] = session
+        self._sessions.move_to_end(session.token)
+        session.accessed = time.monotonic()
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            metrics.inc("session_store_evictions_total", reason="capacity")
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if now - session.accessed < self.idle_timeout:
+                break
+            del self._sessions[token]
+            metrics.inc("session_store_evictions_total", reason="idle")
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    # ---------- 디스크 ----------
+    def _load(self, token):
+        started = time.perf_counter()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT step, store_info, diagnosis_result, selected_question, created FROM sessions WHERE token = ?",
+                (token,),
+            ).fetchone()
+            if row is None:
+                return None
+            count = self._conn.execute("SELECT COUNT(*) FROM messages WHERE token = ?", (token,)).fetchone()[0]
+            offset = max(count - self.window, 0)
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE token = ? AND seq >= ? ORDER BY seq", (token, offset)
+            ).fetchall()
+        step, store_info, diagnosis_result, selected_question, created = row
+        session = Session(
+            self, token, step=step, store_info=json.loads(store_info), diagnosis_result=json.loads(diagnosis_result),
+            selected_question=selected_question, messages=[{"role": r, "content": c} for r, c in rows],
+            offset=offset, created=created,
+        )
+        metrics.observe("session_store_load_seconds", time.perf_counter() - started)
+        return session
+
+    def _save(self, session, clear_messages=False):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO sessions
+                       (token, step, store_info, diagnosis_result, selected_question, created, updated)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (session.token, session.step, json.dumps(session.store_info, ensure_ascii=False),
+                     json.dumps(session.diagnosis_result, ensure_ascii=False), session.selected_question,
+                     session.created, time.time()),
+                )
+                if clear_messages:
+                    self._conn.execute("DELETE FROM messages WHERE token = ?", (session.token,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _append(self, session, message):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (token, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                (session.token, session.message_count, message["role"], message["content"], now),
+            )
+            self._conn.execute("UPDATE sessions SET updated = ? WHERE token = ?", (now, session.token))
+
+    def _load_messages(self, token):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE token = ? ORDER BY seq", (token,)
+            ).fetchall()
+        return [{"role": r, "content": c} for r, c in rows]
+
+    def prescriptions(self, batch=100):
+        """처방전이 발급된 세션 (토큰, 접수 정보, 진단 결과) — 오래된 순으로 batch 개씩 읽음"""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    """SELECT rowid, token, store_info, diagnosis_result FROM sessions
+                       WHERE rowid > ? AND diagnosis_result LIKE '%"prescription"%' ORDER BY rowid LIMIT ?""",
+                    (last, batch),
+                ).fetchall()
+            for rowid, token, store_info, diagnosis_result in rows:
+                last = rowid
+                result = json.loads(diagnosis_result)
+                if result.get("prescription"):
+                    yield token, json.loads(store_info), result
+            if len(rows) < batch:
+                return
+
+    def purge(self):
+        """보관 기간이 지난 세션 삭제"""
+        if not self.retention:
+            return
+        cutoff = time.time() - self.retention
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM messages WHERE token IN (SELECT token FROM sessions WHERE updated < ?)", (cutoff,)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+
+    def stats(self):
+        """메모리 / 디스크 세션 수"""
+        with self._lock:
+            in_memory = len(self._sessions)
+            stored = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"in_memory": in_memory, "stored": stored, "max_sessions": self.max_sessions}
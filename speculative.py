@@ -0,0 +1,92 @@
+"""추측 실행 (입력이 거의 확정되면 제출 전에 미리 생성)
+
+접수 화면에서 진단에 쓰는 항목이 모두 채워지면 그 입력으로 초기 진단을 백그라운드에서 먼저 만든다.
+결과는 입력 키로 구분해 두고, 제출 시 키가 같으면 그대로 쓰고 다르면 버린다(진행 중이면 취소).
+작업 스레드는 모든 세션이 나눠 쓰므로, 제출 시 아직 대기열에서 시작하지 못한 추측은 기다리지 않고 취소한다
+(다른 세션의 추측이 끝나기를 기다리느니 바로 호출하는 편이 빠르다).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# 추측 작업은 세션 간에 공유하는 스레드에서 처리
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+
+
+class Speculation:
+    """진행 중(또는 끝난) 추측 하나"""
+
+    def __init__(self, key, future, cancel):
+        self.key = key
+        self.future = future
+        self.cancel_event = cancel
+        self.started = time.perf_counter()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.future.cancel()
+
+
+class Speculator:
+    """세션 하나의 추측 실행 관리 (가장 최근 입력 하나만 유지)"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.current = None
+        self._lock = threading.Lock()
+
+    def propose(self, key, work):
+        """key 입력으로 work(cancel_event) 실행 시작 (같은 키가 이미 있으면 그대로 둠)
+
+        work 는 작업 스레드에서 실행되므로 Streamlit API 를 호출하면 안 되고,
+        cancel_event 가 설정되면 가능한 빨리 None 을 반환해야 한다.
+        """
+        with self._lock:
+            if self.current is not None and self.current.key == key:
+                return self.current
+            if self.current is not None:
+                self._discard(self.current)
+            cancel = threading.Event()
+            self.current = Speculation(key, _executor.submit(work, cancel), cancel)
+            metrics.inc("speculation_started_total", stage=self.stage)
+            return self.current
+
+    def take(self, key, timeout=None):
+        """제출 시 호출: 키가 같으면 결과(진행 중이면 끝날 때까지 대기), 다르거나 아직 시작 전이거나 실패하면 None"""
+        with self._lock:
+            speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        if speculation.key != key:
+            self._discard(speculation)
+            return None
+        if speculation.future.cancel():
+            # 대기열에서 아직 시작 전: 기다리지 않고 호출한 쪽이 직접 생성
+            metrics.inc("speculation_not_started_total", stage=self.stage)
+            return None
+        started = time.perf_counter()
+        try:
+            result = speculation.future.result(timeout=timeout)
+        except Exception:
+            metrics.inc("speculation_errors_total", stage=self.stage)
+            return None
+        metrics.observe("speculation_wait_seconds", time.perf_counter() - started, stage=self.stage)
+        if result is None:
+            return None
+        metrics.inc("speculation_hits_total", stage=self.stage)
+        return result
+
+    def cancel(self):
+        with self._lock:
+            speculation, self.current = self.current, None
+        if speculation is not None:
+            self._discard(speculation)
+
+    def _discard(self, speculation):
+        if not speculation.future.done():
+            metrics.inc("speculation_cancelled_total", stage=self.stage)
+        else:
+            metrics.inc("speculation_discarded_total", stage=self.stage)
+        speculation.cancel()
@@ -0,0 +1,46 @@
+"""관문 서킷 브레이커: 반열림 시험 호출이 판정 없이 끝나도 다음 호출이 막히지 않는지"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+from call_gate import CallGate, CircuitBreaker, QueueTimeout  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+
+
+def half_open_gate(**options):
+    gate = CallGate(StubBackend(StubProfile(time_scale=0, seed=1)), failure_threshold=1, cooldown=0,
+                    rate_per_second=0, **options)
+    gate.breaker.failure()
+    assert gate.breaker.state == CircuitBreaker.OPEN
+    return gate
+
+
+def test_probe_stream_closed_before_reading_allows_next_call():
+    gate = half_open_gate()
+    stream = gate.stream("시험")
+    assert gate.breaker.state == CircuitBreaker.HALF_OPEN
+    stream.close()
+    assert gate.generate("다음").text
+    assert gate.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_stream_closed_midway_allows_next_call():
+    gate = half_open_gate()
+    stream = gate.stream("시험")
+    next(iter(stream))
+    stream.close()
+    assert gate.stats()["in_flight"] == 0
+    assert gate.generate("다음").text
+
+
+def test_probe_queue_timeout_allows_next_call():
+    gate = half_open_gate(max_concurrency=1, queue_timeout=0.01)
+    gate._slots.acquire()  # 다른 호출이 자리를 차지한 상태
+    with pytest.raises(QueueTimeout):
+        gate.generate("시험")
+    gate._slots.release()
+    assert gate.generate("다음").text
@@ -0,0 +1,27 @@
+"""참고 자료 선택: render 결과(섹션 경로 머리줄 포함)가 토큰 예산을 넘지 않는지"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+from doc_retrieval import ReferenceIndex, estimate_tokens  # noqa: E402
+from prompts import PRESET_STORE_INFO  # noqa: E402
+
+DOC_PATH = os.path.join(ROOT, "docs", "마케팅_전략_분석_보고서_full.html")
+
+
+@pytest.fixture(scope="module")
+def index():
+    with open(DOC_PATH, encoding="utf-8") as f:
+        return ReferenceIndex.from_html(f.read())
+
+
+@pytest.mark.parametrize("preset", sorted(PRESET_STORE_INFO))
+@pytest.mark.parametrize("budget", [300, 800, 1500])
+def test_render_stays_within_budget(index, preset, budget):
+    for question_type in range(1, 6):
+        info = dict(PRESET_STORE_INFO[preset], question_type=question_type)
+        assert estimate_tokens(index.render(info, "단골 늘리는 방법", budget)) <= budget
@@ -0,0 +1,39 @@
+"""헤징 스트림: 읽기 전에 닫거나 버려도 감싼 스트림의 관문 자리를 반납하는지"""
+import gc
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from call_gate import CallGate  # noqa: E402
+from hedging import HedgingBackend  # noqa: E402
+from llm_backend import StubBackend, StubProfile  # noqa: E402
+
+
+def hedged_gate():
+    gate = CallGate(StubBackend(StubProfile(time_scale=0, seed=1)), rate_per_second=0)
+    return gate, HedgingBackend(gate)
+
+
+def test_stream_closed_before_reading_releases_slot():
+    gate, hedging = hedged_gate()
+    stream = hedging.stream("질문")
+    assert gate.stats()["in_flight"] == 1
+    stream.close()
+    assert gate.stats()["in_flight"] == 0
+
+
+def test_stream_read_to_end_releases_slot():
+    gate, hedging = hedged_gate()
+    stream = hedging.stream("질문")
+    assert "".join(stream) == stream.text
+    stream.close()
+    assert gate.stats()["in_flight"] == 0
+
+
+def test_abandoned_stream_releases_slot():
+    gate, hedging = hedged_gate()
+    hedging.stream("질문")
+    gc.collect()
+    assert gate.stats()["in_flight"] == 0
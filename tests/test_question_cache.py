@@ -0,0 +1,67 @@
+"""유사 질문 캐시: 바꿔 말한 질문은 적중하고, 한 단어만 바꾼 반대 질문은 적중하지 않는지"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+from question_cache import QuestionCache, segment_key  # noqa: E402
+
+SEGMENT = segment_key("test", "v1", {"business_type": "카페", "question_type": 2})
+
+PARAPHRASES = [
+    ("단골 늘리는 방법?", "단골을 늘리는 방법이 있을까요?"),
+    ("단골 늘리는 방법?", "단골 손님 늘리는 방법 알려주세요"),
+    ("SNS 마케팅 추천?", "SNS 마케팅은 어떤 걸 추천하나요"),
+    ("인스타그램 광고 효과 있나요?", "인스타 광고 효과 있어요?"),
+    ("객단가 올리는 방법?", "객단가를 올리려면 어떻게 하나요"),
+]
+
+OPPOSITES = [
+    ("인스타그램 광고 예산은 얼마가 적당한가요?", "인스타그램 광고 예산은 얼마가 과한가요?"),
+    ("재방문 쿠폰을 늘려야 할까요?", "재방문 쿠폰을 줄여야 할까요?"),
+    ("주말 영업시간을 늘리는 게 좋을까요?", "주말 영업시간을 줄이는 게 좋을까요?"),
+    ("배달 수수료가 높은 편인가요?", "배달 수수료가 낮은 편인가요?"),
+]
+
+# 함께 저장해 둘 다른 질문 (실제 캐시처럼 IDF 가 여러 질문 기준이 되도록)
+OTHERS = [
+    "재방문 쿠폰은 얼마나 자주 발행해야 하나요?",
+    "주말 매출을 올리려면?",
+    "배달 매출 늘리는 방법?",
+    "경쟁 매장과 차별화하려면?",
+    "점심 시간 손님 늘리기",
+    "리뷰 이벤트 효과 있나요?",
+]
+
+
+@pytest.fixture
+def cache():
+    """저장 질문을 모두 넣은 캐시 (IDF 가 질문 여럿 기준이 되도록 한 캐시에 함께 넣음)"""
+    cache = QuestionCache(ttl=0)
+    for stored in OTHERS + [stored for stored, _ in PARAPHRASES + OPPOSITES]:
+        cache.put(SEGMENT, stored, stored)
+    return cache
+
+
+@pytest.mark.parametrize("stored, query", PARAPHRASES)
+def test_paraphrase_hits(cache, stored, query):
+    match = cache.lookup(SEGMENT, query)
+    assert match is not None and match.answer == stored
+
+
+@pytest.mark.parametrize("stored, query", OPPOSITES)
+def test_opposite_question_misses(cache, stored, query):
+    match = cache.lookup(SEGMENT, query)
+    assert match is None or match.answer != stored
+
+
+def test_opposite_question_rejected_by_words():
+    """n-gram 유사도는 threshold 를 넘지만 바뀐 어절 때문에 버림"""
+    cache = QuestionCache(threshold=0.5, ttl=0)
+    stored, query = OPPOSITES[0]
+    cache.put(SEGMENT, stored, "답변")
+    assert cache.lookup(SEGMENT, query) is None
+    assert cache.stats()["rejected"] == 1